@@ -12,5 +12,13 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+# serve the user API with the async views when running under ASGI
+os.environ.setdefault('USER_API_ASYNC', '1')
 
 application = get_asgi_application()
+
+# warm the URL resolvers, serializers and database connections before the
+# first request
+from core.readiness import warm_up  # noqa: E402
+
+warm_up()
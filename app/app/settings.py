@@ -46,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first so that it times the whole request
+    'core.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,6 +57,30 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# APP_PROFILE=api starts workers serving only /api/user/ and /metrics,
+# without the admin, the API docs, sessions, messages and static files.
+# Migrations are run with the full profile.
+APP_PROFILE = os.environ.get('APP_PROFILE', 'full')
+if APP_PROFILE == 'api':
+    INSTALLED_APPS = [
+        app for app in INSTALLED_APPS if app not in (
+            'django.contrib.admin',
+            'django.contrib.sessions',
+            'django.contrib.messages',
+            'django.contrib.staticfiles',
+            'drf_spectacular',
+        )
+    ]
+    # the API authenticates with tokens, nothing reads the session cookie
+    MIDDLEWARE = [
+        middleware for middleware in MIDDLEWARE if middleware not in (
+            'django.contrib.sessions.middleware.SessionMiddleware',
+            'django.middleware.csrf.CsrfViewMiddleware',
+            'django.contrib.auth.middleware.AuthenticationMiddleware',
+            'django.contrib.messages.middleware.MessageMiddleware',
+        )
+    ]
+
 ROOT_URLCONF = 'app.urls'
 
 TEMPLATES = [
@@ -81,14 +107,87 @@ WSGI_APPLICATION = 'app.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # DB_POOL=1 checks connections out of a pool kept by each worker
+        'ENGINE': (
+            'core.db.postgresql_pool'
+            if os.environ.get('DB_POOL') == '1'
+            else 'django.db.backends.postgresql'
+        ),
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        # used by the core.db.postgresql_pool engine
+        'POOL': {
+            'MIN_SIZE': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            # seconds before a connection is closed and replaced
+            'MAX_LIFETIME': int(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+            # seconds a checkout waits for a free connection
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+            # unpooled connections opened once the timeout is reached
+            'OVERFLOW': int(os.environ.get('DB_POOL_OVERFLOW', 0)),
+            # run SELECT 1 on every checkout
+            'CHECK': os.environ.get('DB_POOL_CHECK', '1') == '1',
+        },
     }
 }
 
+# Read replicas, DB_REPLICA_HOSTS=host1,host2 adds the databases 'replica1'
+# and 'replica2' using the other settings of the primary. DB_REPLICA_NAME
+# sets another database name, e.g. for two databases on one local server.
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASE_REPLICAS.append('replica%d' % index)
+    DATABASES['replica%d' % index] = dict(
+        DATABASES['default'],
+        HOST=host.strip(),
+        NAME=os.environ.get('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        # tests read the rows they write through the test database
+        TEST={'MIRROR': 'default'},
+    )
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    # kept by each process
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# SHARED_CACHE_LOCATION=memcached:11211 adds the cache 'shared', seen by every
+# worker and host, and shares the token cache, throttles and replica
+# stickiness through it unless their *_CACHE_ALIAS says otherwise
+SHARED_CACHE_LOCATION = os.environ.get('SHARED_CACHE_LOCATION')
+if SHARED_CACHE_LOCATION:
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': SHARED_CACHE_LOCATION.split(','),
+    }
+
+# Reads go to a replica, writes and reads inside transactions to the primary
+DATABASE_ROUTERS = ['core.db.routers.PrimaryReplicaRouter'] if DATABASE_REPLICAS else []
+
+# A client that wrote reads from the primary for SECONDS, longer than the
+# replication lag, so that it sees its own writes
+DATABASE_REPLICA_STICKINESS = {
+    'SECONDS': int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 10)),
+    # clients remembered by each worker
+    'MAX_KEYS': int(os.environ.get('DB_REPLICA_STICKY_MAX_KEYS', 100000)),
+    # alias of a shared cache in CACHES to remember clients across workers,
+    # `serve` refuses to start several workers with replicas and without it
+    'SHARED_CACHE': os.environ.get(
+        'DB_REPLICA_STICKY_CACHE_ALIAS', 'shared' if SHARED_CACHE_LOCATION else None,
+    ),
+}
+
+if DATABASE_REPLICAS:
+    # after PerformanceMiddleware, so that it times the whole request
+    MIDDLEWARE.insert(1, 'core.middleware.PrimaryStickinessMiddleware')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -137,4 +236,194 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # orjson backed JSON, the browsable API is only offered while debugging
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+    ] + (['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    # proxies in front of the app whose X-Forwarded-For is trusted to find
+    # the client IP of the throttles and of replica stickiness; with 0 the
+    # header, which any client can set, is ignored for REMOTE_ADDR
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
 }
+
+if APP_PROFILE == 'api':
+    # DRF resolves the schema class while importing its views, its own one
+    # spares the workers the import of the schema generator
+    del REST_FRAMEWORK['DEFAULT_SCHEMA_CLASS']
+
+# Cache of token -> user lookups used by the user API authentication.
+# Deleted tokens and deactivated users are dropped at once by every worker
+# sharing SHARED_CACHE; without it the other workers of `serve` keep
+# accepting them for up to TTL seconds, hence the short default.
+USER_TOKEN_CACHE = {
+    'MAX_SIZE': int(os.environ.get('USER_TOKEN_CACHE_SIZE', 10000)),
+    # optional alias of a shared cache in CACHES, e.g. 'shared'
+    'SHARED_CACHE': os.environ.get(
+        'USER_TOKEN_CACHE_ALIAS', 'shared' if SHARED_CACHE_LOCATION else None,
+    ),
+}
+# seconds before a cached token is looked up in the database again
+USER_TOKEN_CACHE['TTL'] = int(os.environ.get(
+    'USER_TOKEN_CACHE_TTL', 300 if USER_TOKEN_CACHE['SHARED_CACHE'] else 5,
+))
+
+# Lifetime of the database tokens issued by /api/user/token/. A token used
+# RENEW_INTERVAL seconds after its last renewal starts a new lifetime, so only
+# tokens left unused for TTL seconds expire. TTL=0 keeps tokens forever.
+# Expired tokens are deleted by `python manage.py purge_tokens`.
+USER_AUTH_TOKENS = {
+    'TTL': int(os.environ.get('USER_AUTH_TOKEN_TTL', 14 * 24 * 3600)),
+    'RENEW_INTERVAL': int(os.environ.get('USER_AUTH_TOKEN_RENEW_INTERVAL', 3600)),
+}
+
+# Signed access tokens issued by /api/user/token/ instead of database tokens.
+# KEYS maps a key id to its secret; tokens are signed with CURRENT_KEY and
+# verified with any key still listed, so a key is rotated by adding a new one,
+# making it current and removing the old one once TTL seconds have passed.
+USER_ACCESS_TOKENS = {
+    'ENABLED': os.environ.get('USER_ACCESS_TOKENS') == '1',
+    # seconds an access token is valid for
+    'TTL': int(os.environ.get('USER_ACCESS_TOKEN_TTL', 900)),
+    # USER_ACCESS_TOKEN_KEYS='2:new-secret,1:old-secret'
+    'KEYS': dict(
+        item.split(':', 1)
+        for item in os.environ.get('USER_ACCESS_TOKEN_KEYS', '').split(',') if item
+    ) or {'1': SECRET_KEY},
+    'CURRENT_KEY': os.environ.get('USER_ACCESS_TOKEN_CURRENT_KEY', '1'),
+    # seconds before revocations made by other processes are picked up
+    'REVOCATION_REFRESH': int(os.environ.get('USER_TOKEN_REVOCATION_REFRESH', 5)),
+    # seconds a revocation may take to commit, each refresh reads the rows
+    # revoked since the one before less this margin again
+    'REVOCATION_MARGIN': int(os.environ.get('USER_TOKEN_REVOCATION_MARGIN', 60)),
+    # revocations held by the bloom filter before it is rebuilt
+    'REVOCATION_CAPACITY': int(os.environ.get('USER_TOKEN_REVOCATION_CAPACITY', 10000)),
+}
+
+# Attempts allowed on token/ (login) and create/ (signup) per client IP and
+# per submitted email, checked before any password is hashed
+USER_THROTTLE = {
+    'RATES': {
+        'login': {
+            'ip': os.environ.get('USER_LOGIN_RATE_IP', '60/min'),
+            'email': os.environ.get('USER_LOGIN_RATE_EMAIL', '10/min'),
+        },
+        'signup': {
+            'ip': os.environ.get('USER_SIGNUP_RATE_IP', '20/min'),
+            'email': os.environ.get('USER_SIGNUP_RATE_EMAIL', '5/min'),
+        },
+    },
+    # keys counted in memory, the least recently used are evicted
+    'MAX_KEYS': int(os.environ.get('USER_THROTTLE_MAX_KEYS', 100000)),
+    # optional alias of a shared cache in CACHES to count attempts across
+    # workers, without it each worker of `serve` allows its share of the rates
+    'SHARED_CACHE': os.environ.get(
+        'USER_THROTTLE_CACHE_ALIAS', 'shared' if SHARED_CACHE_LOCATION else None,
+    ),
+}
+
+# Django's hashers with PBKDF2 replaced by one whose iterations are set by
+# PASSWORD_PBKDF2_ITERATIONS, see `python manage.py calibrate_hashers`
+PASSWORD_HASHERS = [
+    'core.hashers.CalibratedPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+# 0 keeps Django's default iteration count
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 0))
+
+# Rows above which the admin user list shows the planner's estimate
+# (pg_class.reltuples) instead of an exact COUNT(*)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(
+    os.environ.get('ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000)
+)
+
+# Worker processes hashing passwords off the request thread, 0 hashes inline
+PASSWORD_HASHING_WORKERS = int(
+    os.environ.get('PASSWORD_HASHING_WORKERS', os.cpu_count() or 1)
+)
+# Threads hashing the passwords of a batch when there are no hashing workers
+PASSWORD_HASHING_THREADS = int(
+    os.environ.get('PASSWORD_HASHING_THREADS', os.cpu_count() or 1)
+)
+# hashes queued or running before callers wait for a free slot
+PASSWORD_HASHING_MAX_PENDING = int(
+    os.environ.get('PASSWORD_HASHING_MAX_PENDING', PASSWORD_HASHING_WORKERS * 4)
+)
+# outdated hashes waiting to be upgraded after a login, 0 upgrades them
+# before the login responds
+PASSWORD_REHASH_QUEUE_SIZE = int(
+    os.environ.get('PASSWORD_REHASH_QUEUE_SIZE', 1000)
+)
+
+# Limits for /api/user/bulk-create/. Every password is hashed within the
+# request, so by default a request holds at most the users whose passwords
+# the worker hashes in half of SERVER_TIMEOUT, measured from one hash on the
+# first request; larger imports go through `python manage.py import_users`.
+# 0 derives the limit, without a SERVER_TIMEOUT it is DEFAULT_MAX_ITEMS.
+USER_BULK_CREATE_MAX_ITEMS = int(
+    os.environ.get('USER_BULK_CREATE_MAX_ITEMS', 0)
+)
+USER_BULK_CREATE_DEFAULT_MAX_ITEMS = 10000
+USER_BULK_CREATE_BATCH_SIZE = int(
+    os.environ.get('USER_BULK_CREATE_BATCH_SIZE', 1000)
+)
+
+# Rows fetched from the database cursor per chunk of /api/user/export/
+USER_EXPORT_CHUNK_SIZE = int(
+    os.environ.get('USER_EXPORT_CHUNK_SIZE', 2000)
+)
+
+# `python manage.py serve`, 0 workers or threads are sized from the CPUs
+# available to the container
+SERVER = {
+    'BIND': os.environ.get('SERVER_BIND', '0.0.0.0:8000'),
+    'WORKERS': int(os.environ.get('SERVER_WORKERS', 0)),
+    'THREADS': int(os.environ.get('SERVER_THREADS', 0)),
+    # restart a worker after this many requests (plus up to the jitter),
+    # which bounds the memory slowly leaked or fragmented by a worker
+    'MAX_REQUESTS': int(os.environ.get('SERVER_MAX_REQUESTS', 1000)),
+    'MAX_REQUESTS_JITTER': int(os.environ.get('SERVER_MAX_REQUESTS_JITTER', 100)),
+    'TIMEOUT': int(os.environ.get('SERVER_TIMEOUT', 30)),
+    # seconds given to workers to finish their requests on a reload or stop
+    'GRACEFUL_TIMEOUT': int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30)),
+    # import the app once in the master, workers share its memory
+    'PRELOAD': os.environ.get('SERVER_PRELOAD', '1') == '1',
+    # replaces PASSWORD_HASHING_WORKERS in every worker, which already
+    # spread the hashing over the CPUs, 0 hashes on the request threads
+    'HASHING_WORKERS': int(os.environ.get('SERVER_HASHING_WORKERS', 0)),
+    # replaces PASSWORD_HASHING_THREADS in every worker, the threads hashing
+    # bulk creates and imports, 0 starts one per available CPU
+    'HASHING_THREADS': int(os.environ.get('SERVER_HASHING_THREADS', 0)),
+}
+
+# /metrics, scrapers send 'Authorization: Bearer <TOKEN>', without a TOKEN
+# only requests from this host are answered
+METRICS = {
+    'TOKEN': os.environ.get('METRICS_TOKEN'),
+    # where the workers of `serve` save their metrics for each other, a
+    # temporary directory by default
+    'DIR': os.environ.get('METRICS_DIR'),
+    # seconds between two saves, how old the other workers' metrics can be
+    'EXPORT_INTERVAL': float(os.environ.get('METRICS_EXPORT_INTERVAL', 5)),
+}
+
+# Run the user API views on a thread pool of USER_API_THREADS under ASGI
+USER_API_ASYNC = os.environ.get('USER_API_ASYNC', '0') == '1'
+USER_API_THREADS = int(
+    os.environ.get('USER_API_THREADS', (os.cpu_count() or 1) * 5)
+)
+
+# Directory holding the schema written by 'manage.py build_schema', it is
+# used while its fingerprint matches the sources, otherwise the schema is
+# generated in memory on the first request
+SCHEMA_CACHE_DIR = os.environ.get('SCHEMA_CACHE_DIR')
+
+# Add a Server-Timing header with the db/serializer/hash/total time of
+# every request
+SERVER_TIMING_HEADER = os.environ.get('SERVER_TIMING_HEADER', '1') == '1'
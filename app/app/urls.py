@@ -14,21 +14,35 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularSwaggerView,
-)
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path, include
 
+from core.views import lazy_view, liveness_view, metrics_view, readiness_view
+
 urlpatterns = [
-    path('admin/', admin.site.urls),
-    path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
-    # this endpoint will bring you to the Swagger UI
-    path(
-        'api/docs/',
-        SpectacularSwaggerView.as_view(url_name='api-schema'),
-        name='api-docs',
-    ),
     path('api/user/', include('user.urls')),
+    # Prometheus metrics of the workers
+    path('metrics', metrics_view, name='metrics'),
+    # probes of the container orchestrator
+    path('healthz', liveness_view, name='liveness'),
+    path('readyz', readiness_view, name='readiness'),
 ]
+
+# the admin and the API docs are left out by APP_PROFILE=api
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+
+    urlpatterns.append(path('admin/', admin.site.urls))
+
+if apps.is_installed('drf_spectacular'):
+    urlpatterns += [
+        # generated once per process (or read from SCHEMA_CACHE_DIR) and
+        # served with ETags, the generator is only imported on the first hit
+        path('api/schema/', lazy_view('core.schema.CachedSchemaView'), name='api-schema'),
+        # this endpoint will bring you to the Swagger UI
+        path(
+            'api/docs/',
+            lazy_view('drf_spectacular.views.SpectacularSwaggerView', url_name='api-schema'),
+            name='api-docs',
+        ),
+    ]
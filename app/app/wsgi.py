@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
 application = get_wsgi_application()
+
+# warm the URL resolvers, serializers and database connections before the
+# first request
+from core.readiness import warm_up  # noqa: E402
+
+warm_up()
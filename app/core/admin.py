@@ -1,17 +1,69 @@
 """
 Django admin customization
 """
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.utils import flatten_fieldsets
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
 from core import models
 
 
+def estimated_count(queryset):
+    """Return the planner's row estimate for the queryset's table, or None."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    # reltuples is 0 or -1 until the table is first vacuumed or analyzed
+    return int(row[0]) if row and row[0] > 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator using the row estimate instead of COUNT(*) on large tables."""
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        # filtered and searched lists are counted, the indexes keep them fast
+        if query is not None and not query.where:
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate > settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class UserChangeList(ChangeList):
+    """Change list loading only the columns it displays."""
+
+    def get_queryset(self, request):
+        fields = [
+            name for name in self.list_display
+            if name in {field.name for field in self.model._meta.concrete_fields}
+        ]
+        return super().get_queryset(request).only('pk', *fields)
+
+
 class UserAdmin(BaseUserAdmin):
     """Define the admin pages for users."""
     ordering = ['id']
     list_display = ['email', 'name']
+    # icontains on email and name, backed by trigram indexes on Postgres
+    search_fields = ['email', 'name']
+    paginator = EstimatedCountPaginator
+    # skips a COUNT(*) of the whole table on every page
+    show_full_result_count = False
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
         (
@@ -45,5 +97,20 @@ class UserAdmin(BaseUserAdmin):
         ),
     )
 
+    def get_changelist(self, request, **kwargs):
+        return UserChangeList
+
+    def get_object(self, request, object_id, from_field=None):
+        """Return the user with only the columns of the change form loaded."""
+        # a save only writes the changed columns, so the others never load
+        queryset = self.get_queryset(request).only('pk', *flatten_fieldsets(self.fieldsets))
+        model = queryset.model
+        field = model._meta.pk if from_field is None else model._meta.get_field(from_field)
+        try:
+            object_id = field.to_python(object_id)
+            return queryset.get(**{field.name: object_id})
+        except (model.DoesNotExist, ValidationError, ValueError):
+            return None
+
 
 admin.site.register(models.User, UserAdmin)
@@ -4,3 +4,16 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from core import hashing, metrics
+        from core.db import pool, routers
+
+        # count and time the queries of every request
+        connection_created.connect(metrics.install_query_wrapper)
+        metrics.register_gauges(metrics.process_gauges)
+        metrics.register_gauges(hashing.metrics_gauges)
+        metrics.register_gauges(pool.metrics_gauges)
+        metrics.register_gauges(routers.metrics_gauges)
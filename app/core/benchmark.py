@@ -0,0 +1,66 @@
+"""
+Helpers shared by the benchmark management commands.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.test.utils import (
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+
+@contextmanager
+def bench_environment():
+    """Run a benchmark without leaving anything behind in the database."""
+    # allows the test client's 'testserver' host and the locmem email backend
+    setup_test_environment()
+    try:
+        with transaction.atomic():
+            yield
+            # roll back the seeded rows once the benchmark is done
+            transaction.set_rollback(True)
+    finally:
+        teardown_test_environment()
+
+
+def timed(func, iterations):
+    """Call func the given number of times and return the elapsed seconds."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return time.perf_counter() - start
+
+
+def percentile(values, pct):
+    """Return the pct percentile of values using the nearest rank."""
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(latencies):
+    """Return latency percentiles in milliseconds."""
+    return {
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000,
+    }
+
+
+class QueryCounter:
+    """Database execute wrapper counting queries across threads."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
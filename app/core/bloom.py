@@ -0,0 +1,43 @@
+"""
+Bloom filter for compact in-memory set membership.
+"""
+
+import hashlib
+import math
+
+
+class BloomFilter:
+    """Set of strings answering 'maybe present' or 'certainly absent'."""
+
+    __slots__ = ('capacity', 'size', 'hashes', 'bits', 'count')
+
+    def __init__(self, capacity=10000, error_rate=0.001):
+        self.capacity = capacity
+        # optimal bit count and number of hashes for the error rate
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # double hashing, two 64 bit halves of one digest give every position
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + index * second) % self.size for index in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(value)
+        )
+
+    @property
+    def full(self):
+        """True once more values were added than it was sized for."""
+        return self.count > self.capacity
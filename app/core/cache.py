@@ -0,0 +1,30 @@
+"""
+Caches shared between the workers of the server.
+"""
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# backends whose entries only the process that stored them sees
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared(alias):
+    """True if the cache alias is seen by every worker, e.g. memcached."""
+    config = settings.CACHES.get(alias)
+    return config is not None and config['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def check_shared(alias, name):
+    """Raise ImproperlyConfigured unless alias names a shared cache."""
+    if alias not in settings.CACHES:
+        raise ImproperlyConfigured(f'{name}={alias} is not an alias in CACHES.')
+    if not is_shared(alias):
+        # invalidations and pins would stay in the worker making them
+        raise ImproperlyConfigured(
+            f'{name}={alias} is a cache of each process, set SHARED_CACHE_LOCATION '
+            'to share a memcached server between the workers.'
+        )
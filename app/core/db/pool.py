@@ -0,0 +1,221 @@
+"""
+Database connection pool shared by the threads of a worker process.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+from django.db import connections
+from django.db.utils import OperationalError
+
+logger = logging.getLogger(__name__)
+
+
+class PoolExhausted(Exception):
+    """No connection became available before the checkout timeout."""
+
+
+class ConnectionPool:
+    """Thread safe pool of DB-API connections with a bounded size."""
+
+    def __init__(
+        self, connect, check=None, reset=None, min_size=0, max_size=10,
+        max_lifetime=1800, timeout=5, overflow=0,
+    ):
+        # connect() opens a connection, check(conn) returns whether it still
+        # works and reset(conn) returns whether it can be handed out again
+        self._connect = connect
+        self._check = check
+        self._reset = reset
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        # extra short lived connections allowed once the pool is exhausted
+        self.overflow = overflow
+        self._idle = deque()
+        # id(conn) -> time it was opened, for every pooled connection
+        self._opened_at = {}
+        self._overflow_ids = set()
+        # slots reserved by threads that are opening a connection
+        self._pending = 0
+        self._cond = threading.Condition()
+        self.stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'opened': 0,
+            'closed': 0,
+            'failed_checks': 0,
+        }
+
+    @property
+    def size(self):
+        """Number of pooled connections, idle, checked out or opening."""
+        return len(self._opened_at) + self._pending
+
+    def _expired(self, conn):
+        opened_at = self._opened_at[id(conn)]
+        return time.monotonic() - opened_at >= self.max_lifetime
+
+    def _discard(self, conn):
+        """Close a connection and free its slot, the lock must be held."""
+        self._opened_at.pop(id(conn), None)
+        self._overflow_ids.discard(id(conn))
+        self.stats['closed'] += 1
+        self._cond.notify()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _open(self, overflow=False):
+        """Open a connection in a slot reserved by the caller."""
+        try:
+            conn = self._connect()
+        except BaseException:
+            with self._cond:
+                self._pending -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._pending -= 1
+            self._opened_at[id(conn)] = time.monotonic()
+            if overflow:
+                self._overflow_ids.add(id(conn))
+            self.stats['opened'] += 1
+        return conn
+
+    def prewarm(self):
+        """Open connections until min_size are pooled."""
+        while True:
+            with self._cond:
+                if self.size >= self.min_size:
+                    return
+                self._pending += 1
+            conn = self._open()
+            with self._cond:
+                self._idle.append(conn)
+                self._cond.notify()
+
+    def getconn(self):
+        """Check out a connection, waiting up to timeout for a free one."""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            self.stats['checkouts'] += 1
+        while True:
+            conn, overflow = self._reserve(deadline)
+            if conn is None:
+                return self._open(overflow=overflow)
+            # the health check runs a query, so it is done outside the lock
+            if self._check is None or self._check(conn):
+                return conn
+            with self._cond:
+                self.stats['failed_checks'] += 1
+                self._discard(conn)
+
+    def _reserve(self, deadline):
+        """Pop an idle connection, or reserve a slot to open a new one."""
+        with self._cond:
+            while True:
+                while self._idle:
+                    conn = self._idle.pop()
+                    if self._expired(conn):
+                        self._discard(conn)
+                        continue
+                    return conn, False
+
+                if self.size < self.max_size:
+                    self._pending += 1
+                    return None, False
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    if len(self._overflow_ids) < self.overflow:
+                        self._pending += 1
+                        return None, True
+                    self.stats['timeouts'] += 1
+                    raise PoolExhausted(
+                        'No database connection available within %ss, all %s '
+                        'pooled connections are in use.' % (self.timeout, self.max_size)
+                    )
+                self.stats['waits'] += 1
+                self._cond.wait(remaining)
+
+    def putconn(self, conn):
+        """Return a connection to the pool."""
+        usable = self._reset is None or self._reset(conn)
+        with self._cond:
+            if id(conn) not in self._opened_at:
+                return
+            if not usable or id(conn) in self._overflow_ids or self._expired(conn):
+                self._discard(conn)
+                return
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def close(self):
+        """Close every idle connection."""
+        with self._cond:
+            while self._idle:
+                self._discard(self._idle.pop())
+
+    def get_stats(self):
+        """Return the pool counters and current sizes."""
+        with self._cond:
+            return {
+                **self.stats,
+                'size': self.size,
+                'idle': len(self._idle),
+                'in_use': self.size - len(self._idle),
+                'overflow': len(self._overflow_ids),
+                'max_size': self.max_size,
+            }
+
+
+def _pooled_connections():
+    for alias in connections:
+        connection = connections[alias]
+        if hasattr(connection, 'get_pool'):
+            yield alias, connection
+
+
+def prewarm_pools():
+    """Open min_size connections for every pooled database.
+
+    Return the aliases of the pooled and of the failed databases.
+    """
+    pooled, failed = [], []
+    for alias, connection in _pooled_connections():
+        pooled.append(alias)
+        try:
+            with connection.wrap_database_errors:
+                connection.get_pool().prewarm()
+        except OperationalError as exc:
+            # the worker still starts, connections open on first use instead
+            logger.warning('Could not pre-warm the %s pool: %s', alias, exc)
+            failed.append(alias)
+    return pooled, failed
+
+
+def pool_stats():
+    """Return the statistics of every pooled database by alias."""
+    return {
+        alias: connection.get_pool().get_stats()
+        for alias, connection in _pooled_connections()
+    }
+
+
+def metrics_gauges():
+    """Report the connection pool sizes on /metrics."""
+    return [
+        ('app_db_pool_connections', (('alias', alias), ('state', state)), stats[state])
+        for alias, stats in pool_stats().items()
+        for state in ('idle', 'in_use', 'overflow')
+    ] + [
+        ('app_db_pool_%s_total' % counter, (('alias', alias),), stats[counter])
+        for alias, stats in pool_stats().items()
+        for counter in ('checkouts', 'waits', 'timeouts')
+    ]
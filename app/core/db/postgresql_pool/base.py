@@ -0,0 +1,103 @@
+"""
+PostgreSQL backend checking connections out of a per-process pool.
+"""
+
+import functools
+import os
+import threading
+
+import psycopg2
+from psycopg2 import extensions
+from django.db.backends.postgresql import base, creation
+
+from core.db.pool import ConnectionPool, PoolExhausted
+
+# (pid, alias, connection params) -> pool, a forked worker builds its own
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _check(conn):
+    """Return whether a pooled connection still answers queries."""
+    if conn.closed:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        return False
+    return True
+
+
+def _reset(conn):
+    """Roll back anything left open, return whether conn can be reused."""
+    if conn.closed:
+        return False
+    try:
+        if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        return False
+    return True
+
+
+def close_pools():
+    """Close the idle connections of every pool in this process."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # idle pooled connections would keep the test database in use
+        close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_pool(self):
+        """Return the pool for this database, creating it on first use."""
+        conn_params = self.get_connection_params()
+        key = (os.getpid(), self.alias, tuple(sorted(conn_params.items())))
+        pool = _pools.get(key)
+        if pool is None:
+            with _pools_lock:
+                pool = _pools.get(key)
+                if pool is None:
+                    config = self.settings_dict.get('POOL', {})
+                    pool = _pools[key] = ConnectionPool(
+                        connect=functools.partial(
+                            super().get_new_connection, conn_params,
+                        ),
+                        check=_check if config.get('CHECK', True) else None,
+                        reset=_reset,
+                        min_size=config.get('MIN_SIZE', 0),
+                        max_size=config.get('MAX_SIZE', 10),
+                        max_lifetime=config.get('MAX_LIFETIME', 1800),
+                        timeout=config.get('TIMEOUT', 5),
+                        overflow=config.get('OVERFLOW', 0),
+                    )
+        return pool
+
+    def get_new_connection(self, conn_params):
+        try:
+            connection = self.get_pool().getconn()
+        except PoolExhausted as exc:
+            # surfaces as django.db.utils.OperationalError
+            raise psycopg2.OperationalError(str(exc)) from exc
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level,
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.get_pool().putconn(self.connection)
@@ -0,0 +1,168 @@
+"""
+Database router sending reads to the replicas and writes to the primary.
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_current = ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    """Database routing of the current request."""
+
+    __slots__ = ('replica', 'pinned', 'wrote')
+
+    def __init__(self, replica, pinned=False):
+        # every read of a request goes to the same replica
+        self.replica = replica
+        # the client wrote recently, read from the primary
+        self.pinned = pinned
+        # the request wrote, its later reads see the write on the primary
+        self.wrote = False
+
+
+def start_request(pinned=False):
+    """Start routing a request, return the state and the token for end_request."""
+    state = RoutingState(random.choice(settings.DATABASE_REPLICAS), pinned)
+    return state, _current.set(state)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Read from settings.DATABASE_REPLICAS unless the primary must be read."""
+
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        if state is not None and (state.pinned or state.wrote):
+            return DEFAULT_DB_ALIAS
+        # a transaction on the primary must see its own rows
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state is not None:
+            return state.replica
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # replicas get their schema from the primary
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class StickyClients:
+    """Clients that wrote recently and read from the primary for a while.
+
+    Replicas lag behind the primary, so a client reading right after its
+    own write, e.g. GET /me/ after PATCH /me/ or a login after signing up,
+    is sent to the primary until the replicas have caught up.
+    """
+
+    # prefix used for the keys stored in the optional shared cache tier
+    key_prefix = 'db-primary:'
+
+    def __init__(self, seconds=10, max_keys=100000, shared_cache=None):
+        self.seconds = seconds
+        self.max_keys = max_keys
+        # alias of an entry in settings.CACHES shared between workers
+        self.shared_cache = shared_cache
+        # client -> time until which it reads from the primary
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.pins = 0
+        self.pinned_requests = 0
+
+    @classmethod
+    def from_settings(cls):
+        """Create the store configured by settings.DATABASE_REPLICA_STICKINESS."""
+        config = getattr(settings, 'DATABASE_REPLICA_STICKINESS', {})
+        return cls(
+            seconds=config.get('SECONDS', 10),
+            max_keys=config.get('MAX_KEYS', 100000),
+            shared_cache=config.get('SHARED_CACHE'),
+        )
+
+    def pin(self, client, now=None):
+        """Send the reads of a client to the primary for the next seconds."""
+        now = time.time() if now is None else now
+        self.pins += 1
+        if self.shared_cache:
+            caches[self.shared_cache].set(self.key_prefix + client, now + self.seconds, self.seconds)
+            return
+        with self._lock:
+            self._entries[client] = now + self.seconds
+            self._entries.move_to_end(client)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+
+    def is_pinned(self, client, now=None):
+        """True while the reads of a client go to the primary."""
+        now = time.time() if now is None else now
+        if self.shared_cache:
+            until = caches[self.shared_cache].get(self.key_prefix + client)
+        else:
+            with self._lock:
+                until = self._entries.get(client)
+                if until is not None and until <= now:
+                    del self._entries[client]
+        pinned = until is not None and until > now
+        if pinned:
+            self.pinned_requests += 1
+        return pinned
+
+    def clear(self):
+        """Forget the local clients and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.pins = self.pinned_requests = 0
+
+    def stats(self):
+        return {
+            'pins': self.pins,
+            'pinned_requests': self.pinned_requests,
+            'size': len(self._entries),
+        }
+
+
+_sticky_clients = None
+_sticky_clients_lock = threading.Lock()
+
+
+def get_sticky_clients():
+    """Return the process wide store of clients reading from the primary."""
+    global _sticky_clients
+    if _sticky_clients is None:
+        with _sticky_clients_lock:
+            if _sticky_clients is None:
+                _sticky_clients = StickyClients.from_settings()
+    return _sticky_clients
+
+
+def metrics_gauges():
+    """Report the stickiness counters on /metrics."""
+    if not getattr(settings, 'DATABASE_REPLICAS', None):
+        return []
+    return [
+        ('app_db_sticky_%s' % name, (), value)
+        for name, value in get_sticky_clients().stats().items()
+    ]
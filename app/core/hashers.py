@@ -0,0 +1,18 @@
+"""
+Password hashers tuned for the hardware the app runs on.
+"""
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class CalibratedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2 with the iteration count found by calibrate_hashers.
+
+    The algorithm name is unchanged, so existing hashes still verify and are
+    upgraded when settings.PASSWORD_PBKDF2_ITERATIONS changes.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS or PBKDF2PasswordHasher.iterations
@@ -0,0 +1,321 @@
+"""
+Password hashing offloaded to a pool of worker processes.
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.db import connections
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker(settings_module):
+    """Configure Django in a freshly started worker process."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def _check_password(password, encoded):
+    """Check a password, returning (is_correct, must_update)."""
+    # the setter runs in the worker, so it only records that the hash
+    # should be upgraded and the caller saves the new hash itself
+    must_update = []
+    is_correct = hashers.check_password(
+        password, encoded, setter=lambda raw: must_update.append(True),
+    )
+    return is_correct, bool(must_update)
+
+
+def _timed(func, *args):
+    """Call func, returning its result and the CPU seconds it used."""
+    start = time.thread_time()
+    result = func(*args)
+    return result, time.thread_time() - start
+
+
+class HashingPool:
+    """Run PBKDF2 and friends on other cores with a bounded queue."""
+
+    def __init__(self, workers, max_pending=None, threads=0):
+        # with no workers the hashing runs on the calling thread
+        self.workers = workers
+        # with no workers batches are hashed on this many threads instead,
+        # hashlib releases the GIL while it hashes
+        self.threads = threads
+        self.max_pending = max_pending or max(workers, 1) * 4
+        # callers block here once max_pending hashes are queued or running
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = None
+        self._thread_executor = None
+        self._lock = threading.Lock()
+        # hashes computed and CPU seconds they used, wherever they ran
+        self.hashes = 0
+        self.cpu_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        # forking a process running request threads copies
+                        # locks they may hold, the workers start afresh
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_init_worker,
+                        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE'),),
+                    )
+        return self._executor
+
+    def _get_thread_executor(self):
+        if self._thread_executor is None:
+            with self._lock:
+                if self._thread_executor is None:
+                    self._thread_executor = ThreadPoolExecutor(
+                        max_workers=self.threads, thread_name_prefix='password-hash',
+                    )
+        return self._thread_executor
+
+    @property
+    def parallelism(self):
+        """Return the number of passwords of a batch hashed at once."""
+        if self.workers:
+            return self.workers
+        return max(self.threads, 1)
+
+    def submit(self, func, *args, batch=False):
+        """Queue func on the pool, pass the returned Future to wait()."""
+        if not self.workers and batch and self.threads > 1:
+            # a single hash gains nothing from another thread
+            return self._get_thread_executor().submit(_timed, func, *args)
+        if not self.workers:
+            future = Future()
+            future.set_result(_timed(func, *args))
+            return future
+
+        self._slots.acquire()
+        try:
+            future = self._get_executor().submit(_timed, func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def wait(self, future):
+        """Return the result of a submitted call, recording its CPU time."""
+        result, seconds = future.result()
+        with self._stats_lock:
+            self.hashes += 1
+            self.cpu_seconds += seconds
+        return result
+
+    def get_stats(self):
+        """Return the number of hashes and the CPU seconds they used."""
+        with self._stats_lock:
+            return {'hashes': self.hashes, 'cpu_seconds': self.cpu_seconds}
+
+    def make_password(self, password):
+        """Hash a password, see django.contrib.auth.hashers.make_password."""
+        # unusable passwords are random strings and cost nothing to build
+        if password is None:
+            return hashers.make_password(None)
+        with metrics.timing('hash'):
+            return self.wait(self.submit(hashers.make_password, password))
+
+    def make_passwords(self, passwords):
+        """Hash many passwords in parallel, returning hashes in order."""
+        with metrics.timing('hash'):
+            futures = [
+                None if password is None
+                else self.submit(hashers.make_password, password, batch=True)
+                for password in passwords
+            ]
+            return [
+                hashers.make_password(None) if future is None
+                else self.wait(future)
+                for future in futures
+            ]
+
+    def check_password(self, password, encoded):
+        """Check a password against a hash, return (is_correct, must_update)."""
+        if password is None or not encoded or not hashers.is_password_usable(encoded):
+            return False, False
+        with metrics.timing('hash'):
+            return self.wait(self.submit(_check_password, password, encoded))
+
+    def shutdown(self):
+        """Stop the worker processes, they are restarted on the next submit."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            if self._thread_executor is not None:
+                self._thread_executor.shutdown()
+                self._thread_executor = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process wide hashing pool."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HashingPool(
+                    workers=settings.PASSWORD_HASHING_WORKERS,
+                    max_pending=settings.PASSWORD_HASHING_MAX_PENDING,
+                    threads=settings.PASSWORD_HASHING_THREADS,
+                )
+    return _pool
+
+
+def make_password(password):
+    """Hash a password on the hashing pool."""
+    return get_pool().make_password(password)
+
+
+def make_passwords(passwords):
+    """Hash many passwords in parallel on the hashing pool."""
+    return get_pool().make_passwords(passwords)
+
+
+def check_password(password, encoded):
+    """Check a password on the hashing pool."""
+    return get_pool().check_password(password, encoded)
+
+
+_hash_seconds = None
+
+
+def hash_seconds():
+    """Return the CPU seconds of hashing a new password, measured once."""
+    global _hash_seconds
+    if _hash_seconds is None:
+        _, _hash_seconds = _timed(hashers.make_password, 'calibration-password')
+    return _hash_seconds
+
+
+def batch_capacity(seconds):
+    """Return the passwords of a batch the pool hashes in seconds."""
+    return int(seconds / hash_seconds() * get_pool().parallelism)
+
+
+class RehashQueue:
+    """Upgrade outdated password hashes on a background thread."""
+
+    def __init__(self, max_size):
+        # with no room the upgrade runs on the calling thread
+        self.max_size = max_size
+        self._queue = queue.Queue(max_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.rehashed = 0
+        # upgrades dropped on a full queue, they are retried on the next login
+        self.dropped = 0
+
+    def schedule(self, model, pk, password, encoded):
+        """Replace the hash encoded of row pk with a hash of password."""
+        if not self.max_size:
+            self._rehash(model, pk, password, encoded)
+            return
+
+        try:
+            self._queue.put_nowait((model, pk, password, encoded))
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name='password-rehash', daemon=True,
+                    )
+                    self._thread.start()
+
+    def _rehash(self, model, pk, password, encoded):
+        new_encoded = make_password(password)
+        # only replace the hash that was checked, not one set since then
+        model._default_manager.filter(pk=pk, password=encoded).update(password=new_encoded)
+        self.rehashed += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._rehash(*item)
+            except Exception:
+                logger.exception('Could not upgrade the password hash of %s', item[1])
+            finally:
+                self._queue.task_done()
+            if self._queue.empty():
+                # the connections of this thread idle until the next login
+                connections.close_all()
+
+    def join(self):
+        """Wait until every scheduled upgrade is done."""
+        self._queue.join()
+
+    def get_stats(self):
+        return {
+            'pending': self._queue.qsize(),
+            'rehashed': self.rehashed,
+            'dropped': self.dropped,
+        }
+
+
+_rehash_queue = None
+_defer_rehash = ContextVar('defer_rehash', default=False)
+
+
+def get_rehash_queue():
+    """Return the process wide rehash queue."""
+    global _rehash_queue
+    if _rehash_queue is None:
+        with _pool_lock:
+            if _rehash_queue is None:
+                _rehash_queue = RehashQueue(settings.PASSWORD_REHASH_QUEUE_SIZE)
+    return _rehash_queue
+
+
+@contextmanager
+def deferred_rehash():
+    """Upgrade outdated hashes checked in the block on the rehash queue."""
+    token = _defer_rehash.set(True)
+    try:
+        yield
+    finally:
+        _defer_rehash.reset(token)
+
+
+def rehash_deferred():
+    return _defer_rehash.get()
+
+
+def metrics_gauges():
+    """Report the hashing pool counters on /metrics."""
+    stats = get_pool().get_stats()
+    rehash_stats = get_rehash_queue().get_stats()
+    return [
+        ('app_password_hashes_total', (), stats['hashes']),
+        ('app_password_hash_cpu_seconds_total', (), stats['cpu_seconds']),
+        ('app_password_rehash_pending', (), rehash_stats['pending']),
+        ('app_password_rehash_total', (), rehash_stats['rehashed']),
+        ('app_password_rehash_dropped_total', (), rehash_stats['dropped']),
+    ]
@@ -0,0 +1,44 @@
+"""
+Django command to compare login throughput with and without the hashing pool
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import hashers
+from django.core.management.base import BaseCommand
+
+from core.hashing import HashingPool
+
+
+class Command(BaseCommand):
+    help = 'Measure password checks per second inline and on the hashing pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+
+    def handle(self, *args, **options):
+        encoded = hashers.make_password('benchpass123')
+        for label, workers in (('inline', 0), ('pool', options['workers'])):
+            pool = HashingPool(workers=workers)
+            # start the worker processes before timing
+            pool.check_password('benchpass123', encoded)
+
+            # each thread plays a web worker thread handling one login
+            with ThreadPoolExecutor(max_workers=options['threads']) as threads:
+                start = time.perf_counter()
+                results = list(threads.map(
+                    lambda _: pool.check_password('benchpass123', encoded),
+                    range(options['logins']),
+                ))
+                elapsed = time.perf_counter() - start
+
+            pool.shutdown()
+            assert all(is_correct for is_correct, _ in results)
+            self.stdout.write(
+                f'{label} ({workers} workers): '
+                f'{options["logins"] / elapsed:.1f} logins/sec'
+            )
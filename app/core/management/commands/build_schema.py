@@ -0,0 +1,37 @@
+"""
+Django command to pre-generate the OpenAPI schema served at /api/schema/
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.schema import (
+    generate_schema,
+    read_schema,
+    source_fingerprint,
+    write_schema,
+)
+
+
+class Command(BaseCommand):
+    help = 'Write the OpenAPI schema and its gzip variants to SCHEMA_CACHE_DIR.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.SCHEMA_CACHE_DIR)
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Regenerate even if the sources did not change.',
+        )
+
+    def handle(self, *args, **options):
+        directory = options['dir']
+        if not directory:
+            raise CommandError('Set SCHEMA_CACHE_DIR or pass --dir.')
+
+        fingerprint = source_fingerprint()
+        if not options['force'] and read_schema(directory, fingerprint):
+            self.stdout.write('Schema is up to date.')
+            return
+
+        write_schema(directory, generate_schema(), fingerprint)
+        self.stdout.write(self.style.SUCCESS(f'Schema written to {directory}'))
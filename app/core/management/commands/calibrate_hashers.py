@@ -0,0 +1,96 @@
+"""
+Django command to calibrate the password hasher cost for this host
+"""
+
+import os
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hashers
+from django.core.management.base import BaseCommand, CommandError
+
+SETTING = 'PASSWORD_PBKDF2_ITERATIONS'
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the configured password hashers on this host and recommend the '
+        'PBKDF2 iterations hitting a target latency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=250)
+        parser.add_argument('--samples', type=int, default=5)
+        parser.add_argument(
+            '--write', metavar='ENV_FILE',
+            help=f'Set {SETTING} in this env file.',
+        )
+
+    def time_hash(self, hasher, samples, **params):
+        """Return the median seconds of one hash."""
+        times = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            hasher.encode('calibration-password', hasher.salt(), **params)
+            times.append(time.perf_counter() - start)
+        return statistics.median(times)
+
+    def handle(self, *args, **options):
+        target = options['target_ms'] / 1000
+        samples = options['samples']
+        iterations = None
+        for hasher in get_hashers():
+            if not isinstance(hasher, PBKDF2PasswordHasher):
+                try:
+                    seconds = self.time_hash(hasher, samples)
+                except ValueError:
+                    # argon2/bcrypt are optional libraries
+                    self.stdout.write(f'{hasher.algorithm}: not installed')
+                    continue
+                self.stdout.write(f'{hasher.algorithm}: {seconds * 1000:.1f} ms')
+                continue
+
+            current = hasher.iterations
+            seconds = self.time_hash(hasher, samples, iterations=current)
+            # PBKDF2 time is linear in the iterations, never fewer than
+            # Django's default however fast the host
+            recommended = max(int(round(current * target / seconds, -3)), PBKDF2PasswordHasher.iterations)
+            check = self.time_hash(hasher, samples, iterations=recommended)
+            self.stdout.write(
+                f'{hasher.algorithm}: {current} iterations take {seconds * 1000:.1f} ms, '
+                f'{recommended} take {check * 1000:.1f} ms'
+            )
+            # the first hasher is the one new passwords are hashed with
+            if iterations is None:
+                iterations, applied = recommended, current
+
+        if iterations is None:
+            self.stdout.write(self.style.WARNING('No PBKDF2 hasher is configured.'))
+            return
+
+        if iterations < applied:
+            # the hasher rehashes passwords to its iterations on login,
+            # applying this would weaken every stored hash
+            message = f'{iterations} is fewer than the current {applied} iterations.'
+            if options['write']:
+                raise CommandError(message + f' Not written, lower {SETTING} by hand if intended.')
+            self.stdout.write(self.style.WARNING(message + ' Applying it would rehash passwords down.'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'{SETTING}={iterations}'))
+        if options['write']:
+            self.write_env(options['write'], iterations)
+            self.stdout.write(f'Written to {options["write"]}, restart to apply.')
+        elif iterations != getattr(settings, SETTING, None):
+            self.stdout.write(f'Set {SETTING} in the environment to apply.')
+
+    def write_env(self, path, iterations):
+        """Replace or add the setting in an env file."""
+        lines = []
+        if os.path.exists(path):
+            with open(path) as f:
+                lines = [line for line in f.read().splitlines() if not line.startswith(SETTING + '=')]
+        lines.append(f'{SETTING}={iterations}')
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
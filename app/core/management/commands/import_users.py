@@ -0,0 +1,101 @@
+"""
+Django command to stream users from a CSV or JSONL file into the database
+"""
+
+import sys
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.transfer import FIELDS, clean_batch, guess_format, read_rows, to_csv
+
+STAGING_TABLE = 'import_users_staging'
+
+
+class Command(BaseCommand):
+    help = (
+        'Import users in batches, hashing plaintext passwords and keeping '
+        'hashed ones. Users whose email already exists are skipped, rows '
+        'without a valid email are reported and skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='File to read, - for stdin.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'])
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = options['input']
+        fmt = options['format'] or guess_format(path)
+        if path == '-':
+            self.run(sys.stdin, fmt, options['batch_size'])
+        else:
+            with open(path, newline='', encoding='utf-8') as f:
+                self.run(f, fmt, options['batch_size'])
+
+    def run(self, stream, fmt, batch_size):
+        insert = self.copy_batch if connection.vendor == 'postgresql' else self.bulk_create_batch
+        normalize_email = get_user_model().objects.normalize_email
+        rows = read_rows(stream, fmt)
+        read = inserted = hashed = invalid = 0
+        start = time.perf_counter()
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            cleaned, batch_hashed, errors = clean_batch([row for _, row in batch], normalize_email)
+            for index, error in errors:
+                self.stderr.write(f'Line {batch[index][0]}: {error}, skipped.')
+            # each batch is committed, an interrupted import can be rerun
+            with transaction.atomic():
+                inserted += insert(cleaned)
+            read += len(batch)
+            hashed += batch_hashed
+            invalid += len(errors)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {read} users, imported {inserted}, skipped {read - inserted - invalid} existing '
+            f'and {invalid} invalid, '
+            f'hashed {hashed} plaintext passwords in {elapsed:.1f}s '
+            f'({read / elapsed if elapsed else 0:.0f} rows/sec)'
+        ))
+
+    def copy_batch(self, rows):
+        """COPY the batch into a staging table, then insert the new users."""
+        table = get_user_model()._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} ('
+                'email varchar(255), name varchar(255), password varchar(128), '
+                'is_active boolean, is_staff boolean, is_superuser boolean'
+                ') ON COMMIT DELETE ROWS'
+            )
+            cursor.copy_expert(
+                f'COPY {STAGING_TABLE} ({", ".join(FIELDS)}) FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (email, name, password))',
+                to_csv(rows),
+            )
+            # DO NOTHING skips emails taken, case-insensitively, by the table
+            # or by an earlier row of the batch
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(FIELDS)}, version, updated_at) '
+                f'SELECT {", ".join(FIELDS)}, 1, now() FROM {STAGING_TABLE} '
+                'ON CONFLICT DO NOTHING'
+            )
+            return cursor.rowcount
+
+    def bulk_create_batch(self, rows):
+        """Insert the batch with bulk_create, for databases without COPY."""
+        user_model = get_user_model()
+        # only the emails of the batch are counted, the unique LOWER(email)
+        # index skips the taken ones and the repeats within the batch
+        emails = {row[0].lower() for row in rows}
+        taken = user_model.objects.filter(email__lower__in=emails).count()
+        user_model.objects.bulk_create(
+            [user_model(**dict(zip(FIELDS, row))) for row in rows],
+            ignore_conflicts=True,
+        )
+        return len(emails) - taken
@@ -0,0 +1,35 @@
+"""
+Django command to list users whose emails only differ by case
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models.functions import Lower
+
+
+class Command(BaseCommand):
+    help = 'List the users blocking the case-insensitive unique email index.'
+
+    def handle(self, *args, **options):
+        user_model = get_user_model()
+        collisions = user_model.objects.case_collisions()
+        users = (
+            user_model.objects.annotate(email_lower=Lower('email'))
+            .filter(email_lower__in=collisions.values_list('email_lower', flat=True))
+            .order_by('email_lower', 'id')
+            .values_list('email_lower', 'id', 'email')
+        )
+
+        current = None
+        count = 0
+        for email_lower, pk, email in users.iterator():
+            if email_lower != current:
+                current = email_lower
+                count += 1
+                self.stdout.write(f'{email_lower}:')
+            self.stdout.write(f'  {email} (id {pk})')
+
+        if count:
+            self.stdout.write(self.style.WARNING(f'{count} emails are shared by several users.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No case collisions.'))
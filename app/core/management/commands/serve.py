@@ -0,0 +1,231 @@
+"""
+Django command to run the app on a preforking gunicorn server
+"""
+
+import gc
+import math
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+
+from core import cache, metrics, readiness
+
+
+def _cgroup_quota():
+    """Return the CPUs allowed by a cgroup v2 or v1 quota, or None."""
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as cpu_max:
+            quota, period = cpu_max.read().split()[:2]
+        if quota != 'max':
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as quota_file:
+            quota = int(quota_file.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as period_file:
+            period = int(period_file.read())
+    except (OSError, ValueError):
+        return None
+    return quota / period if quota > 0 else None
+
+
+def available_cpus():
+    """Return the CPUs this process may run on, honouring a container quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_quota()
+    if quota is not None:
+        cpus = min(cpus, max(math.ceil(quota), 1))
+    return cpus
+
+
+def describe_memory(usage):
+    if usage is None:
+        return 'memory unknown'
+    return 'rss %.1f MiB, private %.1f MiB' % (usage[0] / 2 ** 20, usage[1] / 2 ** 20)
+
+
+def load_application():
+    """Return the WSGI app with its URLconfs and serializers warmed up."""
+    application = get_wsgi_application()
+    # connections are opened by each worker once forked
+    readiness.warm_up(databases=False)
+    return application
+
+
+def get_server_class():
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise CommandError('gunicorn is not installed, see requirements.txt.')
+
+    class Server(BaseApplication):
+        """Gunicorn application serving the Django app."""
+
+        def __init__(self, application, options, started):
+            self.application = application
+            self.options = options
+            self.started = started
+            super().__init__()
+
+        def load_config(self):
+            for name, value in self.options.items():
+                self.cfg.set(name, value)
+            for hook in ('when_ready', 'post_fork', 'post_worker_init', 'worker_exit'):
+                self.cfg.set(hook, getattr(self, hook))
+
+        def load(self):
+            # without preloading every worker imports the app itself
+            return self.application or load_application()
+
+        def when_ready(self, server):
+            server.log.info(
+                'Started in %.2fs, %s workers of %s threads, master %s',
+                time.monotonic() - self.started, server.num_workers,
+                self.options['threads'], describe_memory(metrics.memory_usage()),
+            )
+
+        def post_fork(self, server, worker):
+            worker.forked_at = time.monotonic()
+
+        def post_worker_init(self, worker):
+            # connections opened by the master would be shared by every
+            # worker, each one fills its own pools once forked
+            readiness.warm_up()
+            config = settings.METRICS
+            if config['DIR']:
+                metrics.start_exporter(config['DIR'], config['EXPORT_INTERVAL'])
+            worker.log.info(
+                'Worker %s ready in %.2fs, %s', worker.pid,
+                time.monotonic() - worker.forked_at, describe_memory(metrics.memory_usage()),
+            )
+
+        def worker_exit(self, server, worker):
+            # shows how much a worker grew before max_requests recycled it
+            worker.log.info(
+                'Worker %s exiting after %s requests, %s', worker.pid,
+                worker.nr, describe_memory(metrics.memory_usage()),
+            )
+            if settings.METRICS['DIR']:
+                metrics.remove_snapshot(settings.METRICS['DIR'])
+
+    return Server
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the app on gunicorn, preloaded in the master and forked into '
+        'workers sized from the available CPUs. Send HUP to restart the '
+        'workers gracefully; with preloading, code changes need USR2 to '
+        'start a new master and then QUIT to the old one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind')
+        parser.add_argument('--workers', type=int)
+        parser.add_argument('--threads', type=int)
+        parser.add_argument('--max-requests', type=int)
+        parser.add_argument('--no-preload', action='store_true')
+
+    def get_options(self, options):
+        """Return the gunicorn settings from settings.SERVER and the options."""
+        config = settings.SERVER
+        cpus = available_cpus()
+        # gunicorn's rule of thumb, a worker waiting on the database or on a
+        # password hash leaves its CPU to another one
+        workers = options['workers'] or config['WORKERS'] or 2 * cpus + 1
+        threads = options['threads'] or config['THREADS'] or 2
+        gunicorn_options = {
+            'bind': options['bind'] or config['BIND'],
+            'workers': workers,
+            'threads': threads,
+            'worker_class': 'gthread' if threads > 1 else 'sync',
+            'max_requests': options['max_requests'] or config['MAX_REQUESTS'],
+            'max_requests_jitter': config['MAX_REQUESTS_JITTER'],
+            'timeout': config['TIMEOUT'],
+            'graceful_timeout': config['GRACEFUL_TIMEOUT'],
+            'preload_app': config['PRELOAD'] and not options['no_preload'],
+        }
+        # the heartbeat files of the workers, on disk they can stall in containers
+        if os.path.isdir('/dev/shm'):
+            gunicorn_options['worker_tmp_dir'] = '/dev/shm'
+        return gunicorn_options
+
+    def check_shared_state(self, workers):
+        """Make the stores of state kept per process hold across workers."""
+        for name, config in (
+            ('DB_REPLICA_STICKY_CACHE_ALIAS', settings.DATABASE_REPLICA_STICKINESS),
+            ('USER_TOKEN_CACHE_ALIAS', settings.USER_TOKEN_CACHE),
+            ('USER_THROTTLE_CACHE_ALIAS', settings.USER_THROTTLE),
+        ):
+            if config.get('SHARED_CACHE'):
+                try:
+                    cache.check_shared(config['SHARED_CACHE'], name)
+                except ImproperlyConfigured as exc:
+                    raise CommandError(exc)
+        if workers == 1:
+            return
+        if settings.DATABASE_REPLICAS and not settings.DATABASE_REPLICA_STICKINESS.get('SHARED_CACHE'):
+            # the next request of a client that wrote would read a replica
+            # on another worker, not its own writes
+            raise CommandError(
+                'Several workers with read replicas need DB_REPLICA_STICKY_CACHE_ALIAS '
+                'to send the reads of clients that wrote to the primary, or --workers 1.'
+            )
+        if not settings.USER_THROTTLE.get('SHARED_CACHE'):
+            settings.USER_THROTTLE = {**settings.USER_THROTTLE, 'WORKERS': workers}
+            self.stdout.write(
+                f'Throttles are counted by each of the {workers} workers, '
+                'set USER_THROTTLE_CACHE_ALIAS to count them together.'
+            )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        server_class = get_server_class()
+        gunicorn_options = self.get_options(options)
+        # a hashing pool sized for the host in each of the workers would
+        # start workers x CPUs processes
+        hashing_workers = settings.SERVER['HASHING_WORKERS']
+        settings.PASSWORD_HASHING_WORKERS = hashing_workers
+        settings.PASSWORD_HASHING_MAX_PENDING = max(hashing_workers, 1) * 4
+        # threads only cost CPU while a batch is hashed, so batches still
+        # use every CPU without processes per worker
+        settings.PASSWORD_HASHING_THREADS = settings.SERVER['HASHING_THREADS'] or available_cpus()
+        self.check_shared_state(gunicorn_options['workers'])
+        metrics_dir = None
+        if gunicorn_options['workers'] > 1 and not settings.METRICS['DIR']:
+            # every scrape reaches one worker, which renders them all
+            metrics_dir = tempfile.mkdtemp(
+                prefix='app-metrics-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None,
+            )
+            settings.METRICS = {**settings.METRICS, 'DIR': metrics_dir}
+
+        application = None
+        if gunicorn_options['preload_app']:
+            application = load_application()
+            # nothing opened here may be inherited by the workers
+            connections.close_all()
+            # the imported objects are never collected, so the collector of
+            # the workers doesn't write to the pages they share with the master
+            gc.freeze()
+            self.stdout.write(
+                f'Preloaded the app in {time.monotonic() - started:.2f}s, '
+                f'{describe_memory(metrics.memory_usage())}'
+            )
+
+        try:
+            server_class(application, gunicorn_options, started).run()
+        finally:
+            if metrics_dir:
+                shutil.rmtree(metrics_dir, ignore_errors=True)
@@ -0,0 +1,86 @@
+"""
+Django command to report the import time of a cold worker start
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+# what a worker imports before its first request, see serve.load_application
+STARTUP = (
+    'from django.core.wsgi import get_wsgi_application\n'
+    'from django.urls import get_resolver\n'
+    'get_wsgi_application()\n'
+    'get_resolver().url_patterns\n'
+)
+
+
+def parse_importtime(output):
+    """Return (module, self us, cumulative us) from python -X importtime."""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        columns = line[len('import time:'):].split('|')
+        if len(columns) != 3 or not columns[0].strip().isdigit():
+            # the header line
+            continue
+        modules.append((columns[2].strip(), int(columns[0]), int(columns[1])))
+    return modules
+
+
+class Command(BaseCommand):
+    help = (
+        'Start the app in a fresh interpreter and report the time spent '
+        'importing each package and the slowest modules.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profile', choices=['full', 'api'],
+            help='APP_PROFILE of the started process, the current one by default.',
+        )
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument(
+            '--budget-ms', type=float,
+            help='Fail when the start takes longer than this.',
+        )
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        if options['profile']:
+            env['APP_PROFILE'] = options['profile']
+        start = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP],
+            env=env, capture_output=True, text=True,
+        )
+        elapsed = (time.perf_counter() - start) * 1000
+        if process.returncode:
+            raise CommandError('The app failed to start:\n' + process.stderr)
+
+        modules = parse_importtime(process.stderr)
+        total = sum(self_us for _, self_us, _ in modules) / 1000
+        self.stdout.write(
+            f'Started profile {env.get("APP_PROFILE", "full")} in {elapsed:.0f} ms, '
+            f'{total:.0f} ms importing {len(modules)} modules'
+        )
+
+        packages = {}
+        for name, self_us, _ in modules:
+            package = name.split('.')[0]
+            packages[package] = packages.get(package, 0) + self_us
+        self.stdout.write('\nBy package:')
+        for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'  {package:<30} {self_us / 1000:8.1f} ms')
+
+        self.stdout.write('\nSlowest modules, with what they import:')
+        for name, _, cumulative in sorted(modules, key=lambda module: -module[2])[:options['top']]:
+            self.stdout.write(f'  {name:<50} {cumulative / 1000:8.1f} ms')
+
+        budget = options['budget_ms']
+        if budget is not None and elapsed > budget:
+            raise CommandError(f'The start took {elapsed:.0f} ms, over the budget of {budget:.0f} ms.')
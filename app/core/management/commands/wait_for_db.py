@@ -1,26 +1,60 @@
 """
-Django command to wait for the database to be available
+Django command to wait for the databases to be available
 """
 
 import time
+from concurrent.futures import ThreadPoolExecutor
 from psycopg2 import OperationalError as Psycopg2Error
 
+from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 
 class Command(BaseCommand):
-    # Django command to wait for database
-    def handle(self, *args, **options):
-        # Entrypoint for command
-        self.stdout.write('Waiting for database...')
-        db_up = False
-        while db_up is False:
+    help = (
+        'Wait for every configured database with exponential backoff. The '
+        'serving processes warm themselves up, see `serve` and app/wsgi.py.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--timeout', type=float, default=60,
+            help='Seconds to wait before failing.',
+        )
+        parser.add_argument('--initial-delay', type=float, default=0.1)
+        parser.add_argument('--max-delay', type=float, default=2)
+
+    def wait_for(self, alias, deadline, options):
+        """Check a database until it answers, backing off between attempts"""
+        delay = options['initial_delay']
+        while True:
             try:
-                self.check(databases=['default'])
-                db_up = True
+                self.check(databases=[alias])
+                return
             except (Psycopg2Error, OperationalError):
-                self.stdout.write('Database unavailable, waiting 1 second...')
-                time.sleep(1)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(
+                        f'Database {alias} unavailable after {options["timeout"]:g} seconds.'
+                    )
+                delay = min(delay, remaining)
+                self.stdout.write(f'Database {alias} unavailable, waiting {delay:.1f} seconds...')
+                time.sleep(delay)
+                delay = min(delay * 2, options['max_delay'])
+
+    # Entrypoint for command
+    def handle(self, *args, **options):
+        self.stdout.write('Waiting for database...')
+        start = time.monotonic()
+        deadline = start + options['timeout']
+        aliases = list(connections)
+        # a slow primary doesn't hold up the checks of the replicas
+        with ThreadPoolExecutor(max_workers=len(aliases)) as executor:
+            futures = [executor.submit(self.wait_for, alias, deadline, options) for alias in aliases]
+            for future in futures:
+                future.result()
 
-        self.stdout.write(self.style.SUCCESS('Database available!'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Database available! ({time.monotonic() - start:.2f} seconds)'
+        ))
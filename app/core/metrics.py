@@ -0,0 +1,330 @@
+"""
+Per-request timings and per-worker histograms in Prometheus format.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds of the histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Time spent in each phase of the current request."""
+
+    __slots__ = ('queries', 'seconds', '_depth')
+
+    def __init__(self):
+        self.queries = 0
+        # phase -> seconds, phases are 'db', 'serializer' and 'hash'
+        self.seconds = {}
+        # nesting of each phase, only the outermost timer is counted
+        self._depth = {}
+
+    def add(self, phase, seconds):
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+
+    def server_timing(self, total):
+        """Return the value of the Server-Timing header."""
+        entries = ['%s;dur=%.2f' % (phase, seconds * 1000) for phase, seconds in self.seconds.items()]
+        if self.queries:
+            entries.append('queries;desc="%d"' % self.queries)
+        entries.append('total;dur=%.2f' % (total * 1000))
+        return ', '.join(entries)
+
+
+def start_request():
+    """Start collecting timings, return the token for end_request."""
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+@contextmanager
+def timing(phase):
+    """Add the time spent in the block to a phase of the current request."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    depth = timings._depth.get(phase, 0)
+    timings._depth[phase] = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings._depth[phase] = depth
+        if not depth:
+            timings.add(phase, time.perf_counter() - start)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper timing the queries of the current request."""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.add('db', time.perf_counter() - start)
+
+
+class Registry:
+    """Counters and histograms written by a single thread."""
+
+    def __init__(self):
+        # (name, labels) -> value
+        self.counters = {}
+        # (name, labels) -> [bucket counts..., count, sum]
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = [0] * (len(BUCKETS) + 2)
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[index] += 1
+                break
+        histogram[-2] += 1
+        histogram[-1] += seconds
+
+
+# every thread writes to its own registry without locking, the registries
+# are only merged when /metrics is scraped
+_local = threading.local()
+_registries = []
+_registries_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the registry of the calling thread."""
+    registry = getattr(_local, 'registry', None)
+    if registry is None:
+        registry = _local.registry = Registry()
+        with _registries_lock:
+            _registries.append(registry)
+    return registry
+
+
+def record_request(view, method, status, total, timings):
+    """Add a finished request to the histograms of the calling thread."""
+    registry = get_registry()
+    registry.inc('app_requests_total', (('view', view), ('method', method), ('status', str(status))))
+    registry.inc('app_request_db_queries_total', (('view', view),), timings.queries)
+    registry.observe('app_request_duration_seconds', (('view', view), ('phase', 'total')), total)
+    for phase, seconds in timings.seconds.items():
+        registry.observe('app_request_duration_seconds', (('view', view), ('phase', phase)), seconds)
+
+
+def collect():
+    """Merge the registries of every thread."""
+    counters = {}
+    histograms = {}
+    with _registries_lock:
+        registries = list(_registries)
+    for registry in registries:
+        # copying a dict or list is atomic under the GIL
+        for key, value in dict(registry.counters).items():
+            counters[key] = counters.get(key, 0) + value
+        for key, values in dict(registry.histograms).items():
+            merged = histograms.setdefault(key, [0] * (len(BUCKETS) + 2))
+            for index, value in enumerate(list(values)):
+                merged[index] += value
+    return counters, histograms
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    """Time the queries of every new database connection."""
+    # the wrapper list outlives reconnections, so only add it once
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+# callables returning (name, labels, value) gauges added on every scrape
+_gauge_sources = []
+
+
+def register_gauges(source):
+    """Add a callable reporting gauges to the /metrics output."""
+    if source not in _gauge_sources:
+        _gauge_sources.append(source)
+
+
+def memory_usage(pid='self'):
+    """Return the (resident, private) bytes of a process, None off Linux.
+
+    Private memory leaves out the pages still shared with a forking server
+    master, it is what stopping the process would give back.
+    """
+    values = {}
+    try:
+        with open('/proc/%s/smaps_rollup' % pid) as smaps:
+            for line in smaps:
+                name, _, value = line.partition(':')
+                if value.strip().endswith('kB'):
+                    values[name] = int(value.split()[0]) * 1024
+    except (OSError, ValueError):
+        return None
+    if 'Rss' not in values:
+        return None
+    return values['Rss'], values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+
+
+def process_gauges():
+    """Report the memory of the worker serving the scrape."""
+    usage = memory_usage()
+    if usage is None:
+        return []
+    return [
+        ('app_process_resident_memory_bytes', (), usage[0]),
+        ('app_process_private_memory_bytes', (), usage[1]),
+    ]
+
+
+# HELP lines of the metrics whose names are known in advance
+DESCRIPTIONS = {
+    'app_requests_total': 'Requests answered, by URL name, method and status.',
+    'app_request_db_queries_total': 'Database queries made by requests, by URL name.',
+    'app_request_duration_seconds': 'Time spent in each phase of the requests, by URL name.',
+    'app_process_resident_memory_bytes': 'Resident memory of the worker.',
+    'app_process_private_memory_bytes': 'Memory of the worker not shared with the server master.',
+    'app_password_hashes_total': 'Passwords hashed or checked.',
+    'app_password_hash_cpu_seconds_total': 'CPU seconds spent hashing passwords.',
+}
+
+
+def snapshot():
+    """Return the metrics of this process as JSON serializable lists."""
+    counters, histograms = collect()
+    return {
+        'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+        'histograms': [[name, labels, values] for (name, labels), values in histograms.items()],
+        'gauges': [list(gauge) for source in _gauge_sources for gauge in source()],
+    }
+
+
+def _snapshot_path(directory, pid):
+    return os.path.join(directory, '%d.json' % pid)
+
+
+def write_snapshot(directory):
+    """Save the metrics of this process for the other workers to render."""
+    path = _snapshot_path(directory, os.getpid())
+    with open(path + '.tmp', 'w') as output:
+        json.dump(snapshot(), output)
+    # readers never see a partly written file
+    os.replace(path + '.tmp', path)
+
+
+def remove_snapshot(directory, pid=None):
+    try:
+        os.remove(_snapshot_path(directory, pid or os.getpid()))
+    except OSError:
+        pass
+
+
+def read_snapshots(directory):
+    """Return pid -> snapshot of the other live workers saving to directory."""
+    snapshots = {}
+    for filename in os.listdir(directory):
+        pid, _, extension = filename.partition('.')
+        if extension != 'json' or not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            # a worker killed before it could remove its file
+            remove_snapshot(directory, int(pid))
+            continue
+        except PermissionError:
+            pass
+        try:
+            with open(os.path.join(directory, filename)) as snapshot_file:
+                snapshots[int(pid)] = json.load(snapshot_file)
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def start_exporter(directory, interval):
+    """Save the metrics of this worker every interval seconds.
+
+    Each scrape of a multi-worker server reaches a single worker, which
+    renders the saved metrics of the others along with its own.
+    """
+    def export():
+        while True:
+            try:
+                write_snapshot(directory)
+            except OSError as exc:
+                logger.warning('Could not save the metrics to %s: %s', directory, exc)
+            time.sleep(interval)
+
+    threading.Thread(target=export, name='metrics-exporter', daemon=True).start()
+
+
+def _labels(labels):
+    return ','.join('%s="%s"' % (name, value) for name, value in labels)
+
+
+def _metric_type(name, kind):
+    if kind == 'gauges':
+        # the gauge sources also report counters, named as such
+        return 'counter' if name.endswith('_total') else 'gauge'
+    return {'counters': 'counter', 'histograms': 'histogram'}[kind]
+
+
+def render(directory=None):
+    """Return every metric in the Prometheus text format.
+
+    Every series is labelled with the pid of its worker, the metrics saved
+    to directory by the other workers are rendered too.
+    """
+    snapshots = read_snapshots(directory) if directory else {}
+    snapshots[os.getpid()] = snapshot()
+    # name -> (type, sample lines), the samples of a metric stay together
+    families = {}
+    for pid, data in sorted(snapshots.items()):
+        worker = (('pid', str(pid)),)
+        for kind in ('counters', 'histograms', 'gauges'):
+            for name, labels, value in sorted(data[kind], key=lambda item: (item[0], list(item[1]))):
+                labels = _labels(worker + tuple(tuple(label) for label in labels))
+                lines = families.setdefault(name, (_metric_type(name, kind), []))[1]
+                if kind != 'histograms':
+                    lines.append('%s{%s} %s' % (name, labels, value))
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS, value):
+                    cumulative += count
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, cumulative))
+                lines.append('%s_bucket{%s,le="+Inf"} %d' % (name, labels, value[-2]))
+                lines.append('%s_count{%s} %d' % (name, labels, value[-2]))
+                lines.append('%s_sum{%s} %f' % (name, labels, value[-1]))
+
+    output = []
+    for name, (metric_type, lines) in families.items():
+        if name in DESCRIPTIONS:
+            output.append('# HELP %s %s' % (name, DESCRIPTIONS[name]))
+        output.append('# TYPE %s %s' % (name, metric_type))
+        output.extend(lines)
+    return '\n'.join(output) + '\n'
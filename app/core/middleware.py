@@ -0,0 +1,96 @@
+"""
+Middleware shared by the whole project.
+"""
+
+import asyncio
+import time
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from core import metrics
+from core.db import routers
+
+
+class PerformanceMiddleware:
+    """Time every request, report it in Server-Timing and in /metrics."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # let Django await this middleware instead of adapting it
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        timings, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timings, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    def finish(self, request, response, timings, total):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unresolved'
+        metrics.record_request(view, request.method, response.status_code, total, timings)
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = timings.server_timing(total)
+        return response
+
+
+class PrimaryStickinessMiddleware:
+    """Read from the primary database for a while after a client writes.
+
+    Clients are told apart by IP, like the throttles, as a signup and the
+    login following it carry no token yet.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # X-Forwarded-For is trusted as configured by NUM_PROXIES
+        self.get_ident = BaseThrottle().get_ident
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        client = self.get_ident(request)
+        state, token = routers.start_request(routers.get_sticky_clients().is_pinned(client))
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.end_request(token)
+        return self.finish(client, state, response)
+
+    async def __acall__(self, request):
+        client = self.get_ident(request)
+        state, token = routers.start_request(routers.get_sticky_clients().is_pinned(client))
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.end_request(token)
+        return self.finish(client, state, response)
+
+    def finish(self, client, state, response):
+        if state.wrote:
+            routers.get_sticky_clients().pin(client)
+        return response
@@ -0,0 +1,74 @@
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+INDEX = 'core_user_email_lower_uniq'
+
+
+def check_case_collisions(apps, schema_editor):
+    """Refuse to build the index while emails collide, listing them all."""
+    User = apps.get_model('core', 'User')
+    collisions = (
+        User.objects.using(schema_editor.connection.alias)
+        .values(email_lower=Lower('email'))
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .values_list('email_lower', flat=True)
+    )
+    emails = (
+        User.objects.using(schema_editor.connection.alias)
+        .annotate(email_lower=Lower('email'))
+        .filter(email_lower__in=collisions)
+        .order_by('email_lower', 'id')
+        .values_list('id', 'email')
+    )
+    report = ['  %s (id %s)' % (email, pk) for pk, email in emails]
+    if report:
+        raise RuntimeError(
+            'Cannot add the case-insensitive unique index on core_user.email, '
+            'these users share an email ignoring case:\n%s\n'
+            'Merge or rename them, then run the migration again.'
+            % '\n'.join(report)
+        )
+
+
+def create_index(apps, schema_editor):
+    """Build the unique index, on Postgres without locking out writes."""
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.execute(
+            'CREATE UNIQUE INDEX IF NOT EXISTS %s ON core_user (LOWER(email));' % INDEX
+        )
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)', [INDEX],
+        )
+        row = cursor.fetchone()
+    if row and row[0]:
+        # left invalid by a concurrent build that failed, e.g. on an email
+        # colliding since the check, IF NOT EXISTS would keep it
+        schema_editor.execute('DROP INDEX CONCURRENTLY %s;' % INDEX)
+    # CONCURRENTLY keeps the table writable while a large index builds
+    schema_editor.execute(
+        'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS %s ON core_user (LOWER(email));' % INDEX
+    )
+
+
+def drop_index(apps, schema_editor):
+    concurrently = ' CONCURRENTLY' if schema_editor.connection.vendor == 'postgresql' else ''
+    schema_editor.execute('DROP INDEX%s IF EXISTS %s;' % (concurrently, INDEX))
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0002_user_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_case_collisions, migrations.RunPython.noop),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_revoked_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        # SQLite adds columns by rebuilding the table, which drops the index
+        # created by 0003 because Django does not know about it
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX IF NOT EXISTS core_user_email_lower_uniq ON core_user (LOWER(email));',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
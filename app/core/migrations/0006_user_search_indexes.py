@@ -0,0 +1,45 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:40
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# index name -> column, matching the UPPER(column::text) LIKE UPPER('%...%')
+# Django builds for the admin's icontains search on Postgres
+INDEXES = {
+    'core_user_email_upper_trgm': 'email',
+    'core_user_name_upper_trgm': 'name',
+}
+
+
+def create_indexes(apps, schema_editor):
+    """Back the admin user search with trigram indexes on Postgres."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, column in INDEXES.items():
+        # CONCURRENTLY keeps the table writable while a large index builds
+        schema_editor.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS %s ON core_user '
+            'USING gin (UPPER(%s::text) gin_trgm_ops);' % (name, column)
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in INDEXES:
+        schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS %s;' % name)
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0005_user_version_updated_at'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
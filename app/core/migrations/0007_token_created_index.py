@@ -0,0 +1,39 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:10
+
+from django.db import migrations
+
+INDEX = 'authtoken_token_created_idx'
+
+
+def create_index(apps, schema_editor):
+    """Index authtoken_token.created for the expiry purge."""
+    # the table belongs to rest_framework.authtoken, its model can't take the index
+    if schema_editor.connection.vendor == 'postgresql':
+        # CONCURRENTLY keeps logins working while a large index builds
+        schema_editor.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS %s ON authtoken_token (created);' % INDEX
+        )
+    else:
+        schema_editor.execute('CREATE INDEX IF NOT EXISTS %s ON authtoken_token (created);' % INDEX)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS %s;' % INDEX)
+    else:
+        schema_editor.execute('DROP INDEX IF EXISTS %s;' % INDEX)
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('authtoken', '0003_tokenproxy'),
+        ('core', '0006_user_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
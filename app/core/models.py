@@ -2,16 +2,38 @@
 Database models
 """
 
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Lower
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin,
 )
 
+from core import hashing
+
+# email__lower=value compiles to LOWER(email) = value, which is what the
+# unique functional index on core_user is built on
+models.EmailField.register_lookup(Lower)
+
 
 class UserManager(BaseUserManager):
 
+    def get_by_natural_key(self, email):
+        """Return the user with this email, ignoring case."""
+        return self.get(email__lower=email.lower())
+
+    def case_collisions(self):
+        """Return the lowercased emails shared by more than one user."""
+        return (
+            self.values(email_lower=Lower('email'))
+            .annotate(count=Count('id'))
+            .filter(count__gt=1)
+            .order_by('email_lower')
+        )
+
     def create_user(self, email, password=None, **extra_fields):
         """Create, save and return a new user."""
         if not email:
@@ -26,21 +48,173 @@ class UserManager(BaseUserManager):
         """Create and return a new superuser."""
         # email: test@admin.com
         # password: testadmin
-        user = self.create_user(email, password)
-        user.is_staff = True
-        user.is_superuser = True
-        user.save(using=self._db)
+        # the flags are part of the INSERT, no second save is needed
+        return self.create_user(
+            email, password, is_staff=True, is_superuser=True,
+        )
 
-        return user
+
+class DirtyFieldsMixin:
+    """Track the columns changed since the instance was loaded or saved."""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot()
+        return instance
+
+    def _snapshot(self, fields=None):
+        """Remember the current value of the loaded columns."""
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        if fields is not None:
+            fields = {self._meta.get_field(name).attname for name in fields}
+        for field in self._meta.concrete_fields:
+            # deferred columns are not in __dict__ until they are loaded
+            if field.attname in self.__dict__ and (fields is None or field.attname in fields):
+                loaded[field.attname] = self.__dict__[field.attname]
+
+    def get_dirty_fields(self):
+        """Return the names of the columns changed since the last load or save."""
+        loaded = self.__dict__.get('_loaded_values', {})
+        return [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key
+            and field.attname in self.__dict__
+            and (
+                field.attname not in loaded
+                or loaded[field.attname] != self.__dict__[field.attname]
+            )
+        ]
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        self._snapshot(fields)
+
+    def on_update(self):
+        """Called before a row is updated, return extra columns to write."""
+        return []
+
+    def save(self, *args, **kwargs):
+        """Save only the dirty columns of a loaded row, nothing if none."""
+        update_fields = kwargs.get('update_fields')
+        if (
+            update_fields is None
+            and not args
+            and not kwargs.get('force_insert')
+            and not self._state.adding
+            and '_loaded_values' in self.__dict__
+        ):
+            update_fields = self.get_dirty_fields()
+        # Model.save returns without a query for empty update_fields
+        if not self._state.adding and (update_fields is None or update_fields):
+            extra = self.on_update()
+            if update_fields is not None:
+                update_fields = list(update_fields) + [name for name in extra if name not in update_fields]
+        if update_fields is not None:
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+        self._snapshot(update_fields)
 
 
-class User(AbstractBaseUser, PermissionsMixin):
+class VersionConflict(Exception):
+    """The row was changed since the version the update expected."""
+
+
+class User(DirtyFieldsMixin, AbstractBaseUser, PermissionsMixin):
     """User in the system"""
     email = models.EmailField(max_length=255, unique=True)
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # bumped by every write, identifies a state of the row for ETags
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
 
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
+
+    class Meta:
+        indexes = [
+            # back the is_active/is_staff filters of the paginated user list
+            models.Index(fields=['is_active', 'id'], name='core_user_active_id_idx'),
+            models.Index(fields=['is_staff', 'id'], name='core_user_staff_id_idx'),
+        ]
+
+    # version the next update must find in the database, None for any
+    expected_version = None
+
+    def on_update(self):
+        """Bump the version with every change written to the row."""
+        # incremented by the UPDATE itself, concurrent writes of instances
+        # loaded at the same version still get distinct versions
+        self.version = F('version') + 1
+        return ['version', 'updated_at']
+
+    def save(self, *args, **kwargs):
+        if self.expected_version is None:
+            return super().save(*args, **kwargs)
+        # a conflict only rolls back this savepoint, not the caller's transaction
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # optimistic concurrency, the UPDATE only matches the expected version
+        if self.expected_version is not None:
+            base_qs = base_qs.filter(version=self.expected_version)
+        # the row stays locked by the UPDATE until its new version is read
+        with transaction.atomic(using=using):
+            updated = super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+            if updated and hasattr(self.version, 'resolve_expression'):
+                self.version = type(self)._base_manager.using(using).values_list(
+                    'version', flat=True,
+                ).get(pk=pk_val)
+        if not updated and self.expected_version is not None:
+            raise VersionConflict(self.pk)
+        return updated
+
+    def validate_unique(self, exclude=None):
+        """Also reject emails only differing by case from another user."""
+        super().validate_unique(exclude)
+        if exclude and 'email' in exclude:
+            return
+        others = User.objects.filter(email__lower=self.email.lower())
+        if self.pk is not None:
+            others = others.exclude(pk=self.pk)
+        if others.exists():
+            raise ValidationError({
+                'email': self.unique_error_message(User, ['email']),
+            })
+
+    def set_password(self, raw_password):
+        """Hash the password on the hashing pool instead of this thread."""
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        """Check the password on the hashing pool, upgrading old hashes."""
+        is_correct, must_update = hashing.check_password(
+            raw_password, self.password,
+        )
+        if is_correct and must_update:
+            if hashing.rehash_deferred() and self.pk is not None:
+                # the login answers now, the hash is upgraded in the background
+                hashing.get_rehash_queue().schedule(
+                    type(self), self.pk, raw_password, self.password,
+                )
+                return is_correct
+            self.set_password(raw_password)
+            self._password = None
+            self.save(update_fields=['password'])
+
+        return is_correct
+
+
+class RevokedToken(models.Model):
+    """Revocation of signed access tokens, by token id or by user"""
+    # 'jti:<token id>' revokes one token, 'user:<pk>' every token of a user
+    # issued before revoked_at
+    key = models.CharField(max_length=64, db_index=True)
+    revoked_at = models.DateTimeField(db_index=True)
+    # once every token it covers has expired the row can be deleted
+    expires_at = models.DateTimeField(db_index=True)
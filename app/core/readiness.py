@@ -0,0 +1,112 @@
+"""
+Warm-up of a serving process and its readiness state.
+"""
+
+import logging
+import threading
+
+from django.db import connections
+from django.db.utils import OperationalError
+from django.urls import URLResolver, get_resolver
+
+from core.db.pool import prewarm_pools
+
+logger = logging.getLogger(__name__)
+
+# warm_up() ran with the databases, and they all answered since
+_warmed = threading.Event()
+_ready = threading.Event()
+
+
+def iter_views(resolver=None):
+    """Yield the class-based views routed by a resolver and its includes."""
+    resolver = resolver or get_resolver()
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_views(pattern)
+            continue
+        # set by as_view(), views imported lazily have none
+        view_class = getattr(pattern.callback, 'cls', None)
+        if view_class is not None:
+            yield view_class
+
+
+def warm_url_resolvers(resolver=None):
+    """Import every URLconf and build the reverse lookups of each one."""
+    resolver = resolver or get_resolver()
+    # building the lookups is what reverse() would do on its first call
+    resolver.reverse_dict
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            warm_url_resolvers(pattern)
+
+
+def warm_serializers():
+    """Introspect the serializers of every view, return how many there are."""
+    serializer_classes = {
+        view_class.serializer_class for view_class in iter_views()
+        if getattr(view_class, 'serializer_class', None) is not None
+    }
+    for serializer_class in serializer_classes:
+        # loads the model metadata the fields are built from
+        serializer_class().fields
+        if hasattr(serializer_class, 'get_compiled_representation'):
+            serializer_class.get_compiled_representation()
+    return len(serializer_classes)
+
+
+def warm_connections():
+    """Fill the connection pools and check the other databases.
+
+    Return the aliases that failed. Connections outside a pool belong to
+    the thread opening them, which is not a request thread here, so they
+    are only checked and closed again.
+    """
+    pooled, failed = prewarm_pools()
+    for alias in connections:
+        if alias in pooled:
+            continue
+        connection = connections[alias]
+        opened = connection.connection is None
+        try:
+            connection.ensure_connection()
+        except OperationalError as exc:
+            logger.warning('Could not connect to the %s database: %s', alias, exc)
+            failed.append(alias)
+            continue
+        if opened:
+            connection.close()
+    return failed
+
+
+def warm_up(databases=True):
+    """Do the work of a first request before serving, then report ready.
+
+    Without databases only what is safe to share with forked workers is
+    warmed, and the process is not marked ready. It is not either while a
+    database is down, is_ready() checks them again until they answer.
+    """
+    warm_url_resolvers()
+    warm_serializers()
+    if databases:
+        _warmed.set()
+        if not warm_connections():
+            _ready.set()
+
+
+def is_ready():
+    if not _ready.is_set() and _warmed.is_set() and not warm_connections():
+        _ready.set()
+    return _ready.is_set()
+
+
+def check_databases():
+    """Return alias -> None, or the error of a database that is down."""
+    errors = {}
+    for alias in connections:
+        try:
+            connections[alias].ensure_connection()
+            errors[alias] = None
+        except OperationalError as exc:
+            errors[alias] = str(exc)
+    return errors
@@ -0,0 +1,176 @@
+"""
+OpenAPI schema generated once and served from memory.
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+
+import drf_spectacular
+import rest_framework
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.views import View
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+
+# format query parameter -> (file name, content type, renderer)
+FORMATS = {
+    'openapi': ('openapi.yaml', 'application/vnd.oai.openapi', OpenApiYamlRenderer),
+    'openapi-json': ('openapi.json', 'application/vnd.oai.openapi+json', OpenApiJsonRenderer),
+}
+
+
+def source_fingerprint():
+    """Hash the project sources the schema is generated from."""
+    digest = hashlib.sha256()
+    digest.update(rest_framework.__version__.encode())
+    digest.update(drf_spectacular.__version__.encode())
+    for root, dirs, files in os.walk(settings.BASE_DIR):
+        # walk in a stable order and skip what cannot change the schema
+        dirs[:] = sorted(d for d in dirs if d not in ('tests', 'migrations', '__pycache__'))
+        for name in sorted(files):
+            if name.endswith('.py'):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, settings.BASE_DIR).encode())
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+    return digest.hexdigest()
+
+
+def generate_schema():
+    """Return the schema document rendered in every format."""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    schema = generator.get_schema(request=None, public=True)
+    return {
+        fmt: renderer().render(schema, renderer_context={})
+        for fmt, (_, _, renderer) in FORMATS.items()
+    }
+
+
+def write_schema(directory, documents, fingerprint):
+    """Write the documents, gzip variants and fingerprint to directory."""
+    os.makedirs(directory, exist_ok=True)
+    for fmt, (file_name, _, _) in FORMATS.items():
+        path = os.path.join(directory, file_name)
+        with open(path, 'wb') as f:
+            f.write(documents[fmt])
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(documents[fmt], mtime=0))
+    with open(os.path.join(directory, 'fingerprint'), 'w') as f:
+        f.write(fingerprint)
+
+
+def read_schema(directory, fingerprint):
+    """Return format -> (document, gzip document), None when they are stale."""
+    try:
+        with open(os.path.join(directory, 'fingerprint')) as f:
+            if f.read().strip() != fingerprint:
+                return None
+        documents = {}
+        for fmt, (file_name, _, _) in FORMATS.items():
+            path = os.path.join(directory, file_name)
+            with open(path, 'rb') as f:
+                body = f.read()
+            with open(path + '.gz', 'rb') as f:
+                documents[fmt] = (body, f.read())
+        return documents
+    except FileNotFoundError:
+        return None
+
+
+def accepts_gzip(header):
+    """True when an Accept-Encoding header allows gzip, 'gzip;q=0' does not."""
+    qualities = {}
+    for coding in header.split(','):
+        name, _, params = coding.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+    if 'gzip' in qualities:
+        return qualities['gzip'] > 0
+    return qualities.get('*', 0) > 0
+
+
+class SchemaVariant:
+    """One rendered schema document with its gzip body and ETag."""
+
+    __slots__ = ('body', 'gzip_body', 'etag', 'content_type')
+
+    def __init__(self, body, content_type, gzip_body=None):
+        self.body = body
+        # built by build_schema, or compressed once here
+        self.gzip_body = gzip_body or gzip.compress(body, mtime=0)
+        self.etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+        self.content_type = content_type
+
+
+_variants = None
+_variants_lock = threading.Lock()
+
+
+def get_variants():
+    """Return the schema variants, built on first use in this process."""
+    global _variants
+    if _variants is None:
+        with _variants_lock:
+            if _variants is None:
+                documents = None
+                directory = settings.SCHEMA_CACHE_DIR
+                if directory:
+                    fingerprint = source_fingerprint()
+                    documents = read_schema(directory, fingerprint)
+                if documents is None:
+                    documents = {fmt: (body, None) for fmt, body in generate_schema().items()}
+                _variants = {
+                    fmt: SchemaVariant(documents[fmt][0], content_type, documents[fmt][1])
+                    for fmt, (_, content_type, _) in FORMATS.items()
+                }
+    return _variants
+
+
+def clear_variants():
+    """Forget the schema so the next request builds it again."""
+    global _variants
+    with _variants_lock:
+        _variants = None
+
+
+class CachedSchemaView(View):
+    """Serve the OpenAPI schema from memory with ETags and gzip."""
+
+    http_method_names = ['get', 'head']
+
+    def get(self, request, *args, **kwargs):
+        fmt = request.GET.get('format')
+        if fmt not in FORMATS:
+            accept = request.META.get('HTTP_ACCEPT', '')
+            fmt = 'openapi-json' if 'json' in accept else 'openapi'
+        variant = get_variants()[fmt]
+
+        etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if variant.etag in etags or '*' in etags:
+            response = HttpResponseNotModified()
+        else:
+            compressed = accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            response = HttpResponse(
+                variant.gzip_body if compressed else variant.body,
+                content_type=variant.content_type,
+            )
+            if compressed:
+                response['Content-Encoding'] = 'gzip'
+
+        response['ETag'] = variant.etag
+        # clients keep their copy and revalidate it with If-None-Match
+        response['Cache-Control'] = 'no-cache'
+        patch_vary_headers(response, ['Accept', 'Accept-Encoding'])
+        return response
@@ -2,11 +2,17 @@
 Test for the Django admin modification
 """
 
-from django.test import TestCase
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.test import Client
 
+from core.admin import EstimatedCountPaginator
+
 
 class AdminSiteTests(TestCase):
     """Tests for Django Admin"""
@@ -63,3 +69,58 @@ class AdminSiteTests(TestCase):
         res = self.client.get(url)
 
         self.assertEqual(res.status_code, 200)
+
+    def test_search_users(self):
+        """Test searching users by part of their email or name."""
+        url = reverse('admin:core_user_changelist')
+
+        res = self.client.get(url, {'q': 'test us'})
+
+        self.assertContains(res, self.user.email)
+        self.assertNotContains(res, 'admin@example.com</a>')
+
+    def test_users_list_slim_queries(self):
+        """Test the list only loads the displayed columns without counting all rows."""
+        url = reverse('admin:core_user_changelist')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+
+        user_queries = [
+            query['sql'] for query in queries
+            if 'FROM "core_user"' in query['sql'] and 'django_session' not in query['sql']
+        ]
+        select = [sql for sql in user_queries if 'COUNT' not in sql and 'ORDER BY' in sql][-1]
+        self.assertNotIn('"password"', select)
+        self.assertEqual(len([sql for sql in user_queries if 'COUNT' in sql]), 1)
+
+    def test_edit_user_saves_changed_columns(self):
+        """Test the change form only writes what was changed."""
+        url = reverse('admin:core_user_change', args=[self.user.id])
+        payload = {
+            'email': self.user.email,
+            'is_active': 'on',
+            'is_staff': 'on',
+        }
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(url, payload)
+
+        self.assertEqual(res.status_code, 302)
+        update = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "core_user"')]
+        self.assertEqual(len(update), 1)
+        self.assertIn('"is_staff"', update[0])
+        self.assertNotIn('"email"', update[0])
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_staff)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1000)
+    def test_paginator_estimated_count(self):
+        """Test large unfiltered lists use the planner estimate."""
+        users = get_user_model().objects.order_by('id')
+
+        with patch('core.admin.estimated_count', return_value=5000000):
+            self.assertEqual(EstimatedCountPaginator(users, 100).count, 5000000)
+            self.assertEqual(EstimatedCountPaginator(users.filter(is_staff=True), 100).count, 1)
+        with patch('core.admin.estimated_count', return_value=500):
+            self.assertEqual(EstimatedCountPaginator(users, 100).count, 2)
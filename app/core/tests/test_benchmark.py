@@ -0,0 +1,27 @@
+"""
+Tests for the benchmark helpers.
+"""
+
+from django.test import SimpleTestCase
+
+from core.benchmark import percentile, summarize
+
+
+class BenchmarkHelperTests(SimpleTestCase):
+    """Test the latency statistics"""
+
+    def test_percentile_nearest_rank(self):
+        """Test percentiles pick an observed value"""
+        values = list(range(1, 101))
+
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([7], 95), 7)
+
+    def test_summarize_in_milliseconds(self):
+        """Test latencies in seconds are summarized in milliseconds"""
+        summary = summarize([0.001, 0.002, 0.003, 0.004])
+
+        self.assertEqual(summary['p50_ms'], 2)
+        self.assertEqual(summary['max_ms'], 4)
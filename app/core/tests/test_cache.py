@@ -0,0 +1,34 @@
+"""
+Tests for the caches shared between workers.
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from core.cache import check_shared, is_shared
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': ['memcached:11211'],
+    },
+})
+class SharedCacheTests(SimpleTestCase):
+    """Test telling shared caches from caches of each process"""
+
+    def test_is_shared(self):
+        """Test only a cache outside the process is shared"""
+        self.assertTrue(is_shared('shared'))
+        self.assertFalse(is_shared('default'))
+        self.assertFalse(is_shared('missing'))
+
+    def test_check_shared(self):
+        """Test process local and unknown aliases are rejected"""
+        check_shared('shared', 'USER_TOKEN_CACHE_ALIAS')
+
+        with self.assertRaisesMessage(ImproperlyConfigured, 'USER_TOKEN_CACHE_ALIAS=default'):
+            check_shared('default', 'USER_TOKEN_CACHE_ALIAS')
+        with self.assertRaisesMessage(ImproperlyConfigured, 'not an alias'):
+            check_shared('missing', 'USER_TOKEN_CACHE_ALIAS')
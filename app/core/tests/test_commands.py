@@ -2,11 +2,18 @@
 Test custom Django management commands.
 """
 
-from unittest.mock import patch
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import MagicMock, patch
 from psycopg2 import OperationalError as Psycopg2Error
-from django.core.management import call_command
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.management import CommandError, call_command
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, override_settings
+
+from core.management.commands import serve, startup_profile
 
 
 # Mocking the 'check' method provided by the 'BaseCommand' class inside of wait_for_db.py
@@ -45,3 +52,201 @@ class CommandTests(SimpleTestCase):
         self.assertEqual(patched_check.call_count, 6)
 
         patched_check.assert_called_with(databases=['default'])
+
+    @patch('time.sleep')
+    def test_wait_for_db_backoff(self, patched_sleep, patched_check):
+        # Test the wait doubles after every failure, up to the max delay
+        patched_check.side_effect = [OperationalError] * 4 + [True]
+
+        call_command('wait_for_db', initial_delay=0.1, max_delay=0.3, stdout=StringIO())
+
+        self.assertEqual(
+            [round(call.args[0], 3) for call in patched_sleep.call_args_list],
+            [0.1, 0.2, 0.3, 0.3],
+        )
+
+    @patch('time.sleep')
+    def test_wait_for_db_timeout(self, patched_sleep, patched_check):
+        # Test the command fails once the timeout has passed
+        patched_check.side_effect = OperationalError
+
+        with self.assertRaises(CommandError):
+            call_command('wait_for_db', timeout=0, stdout=StringIO())
+
+
+@override_settings(PASSWORD_PBKDF2_ITERATIONS=1000)
+class CalibrateHashersCommandTests(SimpleTestCase):
+    """Test calibrating the password hashers"""
+
+    def test_recommends_iterations(self):
+        """Test the command prints the recommended PBKDF2 iterations"""
+        out = StringIO()
+
+        call_command('calibrate_hashers', target_ms=1, samples=1, stdout=out)
+
+        self.assertIn('pbkdf2_sha256: 1000 iterations take', out.getvalue())
+        self.assertIn('PASSWORD_PBKDF2_ITERATIONS=', out.getvalue())
+
+    def test_write_env_file(self):
+        """Test the recommendation replaces the setting in an env file"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, '.env')
+            with open(path, 'w') as f:
+                f.write('DB_HOST=db\nPASSWORD_PBKDF2_ITERATIONS=1\n')
+
+            call_command('calibrate_hashers', target_ms=1, samples=1, write=path, stdout=StringIO())
+
+            with open(path) as f:
+                lines = f.read().splitlines()
+        self.assertEqual(lines[0], 'DB_HOST=db')
+        self.assertEqual(len(lines), 2)
+        self.assertRegex(lines[1], r'^PASSWORD_PBKDF2_ITERATIONS=\d+$')
+
+    @patch('core.management.commands.calibrate_hashers.Command.time_hash', return_value=1)
+    def test_never_recommends_fewer_than_default(self, patched_time_hash):
+        """Test a fast host is still recommended Django's default iterations"""
+        out = StringIO()
+
+        call_command('calibrate_hashers', target_ms=1, samples=1, stdout=out)
+
+        self.assertIn(f'PASSWORD_PBKDF2_ITERATIONS={PBKDF2PasswordHasher.iterations}', out.getvalue())
+
+    @patch('core.management.commands.calibrate_hashers.Command.time_hash', return_value=1)
+    def test_refuses_to_lower_iterations(self, patched_time_hash):
+        """Test a recommendation below the current setting is not written"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, '.env')
+            with self.settings(PASSWORD_PBKDF2_ITERATIONS=PBKDF2PasswordHasher.iterations * 2):
+                with self.assertRaises(CommandError):
+                    call_command('calibrate_hashers', target_ms=1, samples=1, write=path, stdout=StringIO())
+
+            self.assertFalse(os.path.exists(path))
+
+
+# the command changes the settings of the process it runs in
+@override_settings()
+@patch('core.management.commands.serve.available_cpus', return_value=4)
+@patch('core.management.commands.serve.get_server_class')
+class ServeCommandTests(SimpleTestCase):
+    """Test starting the gunicorn server"""
+
+    def test_sizes_workers_from_cpus(self, patched_server_class, patched_cpus):
+        """Test workers and threads default to the available CPUs"""
+        call_command('serve', no_preload=True, stdout=StringIO())
+
+        application, options, _ = patched_server_class.return_value.call_args[0]
+        self.assertIsNone(application)
+        self.assertEqual(options['workers'], 9)
+        self.assertEqual(options['threads'], 2)
+        self.assertEqual(options['worker_class'], 'gthread')
+        self.assertFalse(options['preload_app'])
+        patched_server_class.return_value.return_value.run.assert_called_once_with()
+
+    def test_hashing_pool_sized_per_worker(self, patched_server_class, patched_cpus):
+        """Test the workers don't each start a hashing pool for every CPU"""
+        with self.settings(SERVER={**settings.SERVER, 'HASHING_WORKERS': 1}):
+            call_command('serve', no_preload=True, stdout=StringIO())
+
+            self.assertEqual(settings.PASSWORD_HASHING_WORKERS, 1)
+            self.assertEqual(settings.PASSWORD_HASHING_MAX_PENDING, 4)
+            # batches are still hashed on every CPU
+            self.assertEqual(settings.PASSWORD_HASHING_THREADS, 4)
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_replicas_need_shared_stickiness(self, patched_server_class, patched_cpus):
+        """Test several workers won't start with clients pinned per worker"""
+        with self.assertRaises(CommandError):
+            call_command('serve', no_preload=True, stdout=StringIO())
+
+        call_command('serve', workers=1, no_preload=True, stdout=StringIO())
+        patched_server_class.return_value.return_value.run.assert_called_once_with()
+
+    def test_throttles_shared_by_workers(self, patched_server_class, patched_cpus):
+        """Test each worker counting throttles alone allows its share"""
+        call_command('serve', no_preload=True, stdout=StringIO())
+
+        self.assertEqual(settings.USER_THROTTLE['WORKERS'], 9)
+
+    def test_process_local_cache_not_shared(self, patched_server_class, patched_cpus):
+        """Test a cache of each process is refused as a shared cache"""
+        with self.settings(USER_TOKEN_CACHE={**settings.USER_TOKEN_CACHE, 'SHARED_CACHE': 'default'}):
+            with self.assertRaises(CommandError):
+                call_command('serve', no_preload=True, stdout=StringIO())
+        with self.settings(USER_THROTTLE={**settings.USER_THROTTLE, 'SHARED_CACHE': 'missing'}):
+            with self.assertRaises(CommandError):
+                call_command('serve', workers=1, no_preload=True, stdout=StringIO())
+        patched_server_class.return_value.return_value.run.assert_not_called()
+
+    def test_options_override_settings(self, patched_server_class, patched_cpus):
+        """Test the command line options win over settings.SERVER"""
+        call_command(
+            'serve', workers=1, threads=1, bind='127.0.0.1:9000', max_requests=10,
+            no_preload=True, stdout=StringIO(),
+        )
+
+        options = patched_server_class.return_value.call_args[0][1]
+        self.assertEqual(options['workers'], 1)
+        self.assertEqual(options['worker_class'], 'sync')
+        self.assertEqual(options['bind'], '127.0.0.1:9000')
+        self.assertEqual(options['max_requests'], 10)
+
+    @patch('core.management.commands.serve.gc.freeze')
+    @patch('core.management.commands.serve.load_application')
+    def test_preloads_app(self, patched_load, patched_freeze, patched_server_class, patched_cpus):
+        """Test the app is loaded before the workers are forked"""
+        patched_load.return_value = app = MagicMock()
+        out = StringIO()
+
+        call_command('serve', stdout=out)
+
+        self.assertIs(patched_server_class.return_value.call_args[0][0], app)
+        patched_freeze.assert_called_once_with()
+        self.assertIn('Preloaded the app', out.getvalue())
+
+
+class AvailableCpusTests(SimpleTestCase):
+    """Test counting the CPUs the server may use"""
+
+    @patch('core.management.commands.serve._cgroup_quota', return_value=1.5)
+    @patch('os.sched_getaffinity', return_value=set(range(8)), create=True)
+    def test_container_quota(self, patched_affinity, patched_quota):
+        """Test a CPU quota lowers the count, rounded up"""
+        self.assertEqual(serve.available_cpus(), 2)
+
+    @patch('core.management.commands.serve._cgroup_quota', return_value=None)
+    @patch('os.sched_getaffinity', return_value={0, 1, 2}, create=True)
+    def test_cpu_affinity(self, patched_affinity, patched_quota):
+        """Test only the CPUs the process may run on are counted"""
+        self.assertEqual(serve.available_cpus(), 3)
+
+
+class StartupProfileCommandTests(SimpleTestCase):
+    """Test profiling the start of the app"""
+
+    def test_parse_importtime(self):
+        """Test the self and cumulative times are read per module"""
+        output = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |   yaml.error\n'
+            'import time:       300 |        420 | yaml\n'
+        )
+
+        self.assertEqual(startup_profile.parse_importtime(output), [
+            ('yaml.error', 120, 120),
+            ('yaml', 300, 420),
+        ])
+
+    def test_api_profile(self):
+        """Test the API profile starts without the schema generator"""
+        out = StringIO()
+
+        call_command('startup_profile', profile='api', top=1000, stdout=out)
+
+        self.assertIn('Started profile api', out.getvalue())
+        self.assertIn('user.views', out.getvalue())
+        self.assertNotIn('drf_spectacular.openapi', out.getvalue())
+
+    def test_budget(self):
+        """Test a start over the budget fails"""
+        with self.assertRaises(CommandError):
+            call_command('startup_profile', budget_ms=1, stdout=StringIO())
@@ -0,0 +1,144 @@
+"""
+Tests for the password hashing pool.
+"""
+
+from django.contrib.auth import get_user_model, hashers
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.hashing import HashingPool, RehashQueue
+
+
+class HashingPoolTests(SimpleTestCase):
+    """Test hashing passwords on worker processes"""
+
+    def setUp(self):
+        self.pool = HashingPool(workers=2)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_make_password_on_pool(self):
+        """Test the pool builds hashes that Django can check"""
+        encoded = self.pool.make_password('testpass123')
+
+        self.assertTrue(hashers.check_password('testpass123', encoded))
+
+    def test_check_password_on_pool(self):
+        """Test checking correct and incorrect passwords"""
+        encoded = hashers.make_password('testpass123')
+
+        self.assertEqual(
+            self.pool.check_password('testpass123', encoded),
+            (True, False),
+        )
+        self.assertEqual(
+            self.pool.check_password('wrongpass', encoded),
+            (False, False),
+        )
+
+    def test_check_password_reports_outdated_hash(self):
+        """Test a hash with old parameters is flagged for upgrade"""
+        encoded = hashers.make_password('testpass123', hasher='pbkdf2_sha1')
+
+        self.assertEqual(
+            self.pool.check_password('testpass123', encoded),
+            (True, True),
+        )
+
+    def test_unusable_password_never_matches(self):
+        """Test unusable passwords are rejected without hashing"""
+        encoded = self.pool.make_password(None)
+
+        self.assertFalse(hashers.is_password_usable(encoded))
+        self.assertEqual(
+            self.pool.check_password('', encoded),
+            (False, False),
+        )
+
+    def test_inline_pool(self):
+        """Test a pool without workers hashes on the calling thread"""
+        pool = HashingPool(workers=0)
+
+        encoded = pool.make_password('testpass123')
+
+        self.assertEqual(pool.check_password('testpass123', encoded), (True, False))
+        self.assertIsNone(pool._executor)
+
+    def test_inline_pool_hashes_batches_on_threads(self):
+        """Test a pool without workers hashes batches on its threads"""
+        pool = HashingPool(workers=0, threads=2)
+        self.addCleanup(pool.shutdown)
+
+        encoded = pool.make_passwords(['pass1', 'pass2', 'pass3'])
+
+        for password, hashed in zip(['pass1', 'pass2', 'pass3'], encoded):
+            self.assertTrue(hashers.check_password(password, hashed))
+        self.assertIsNotNone(pool._thread_executor)
+        self.assertIsNone(pool._executor)
+        self.assertEqual(pool.get_stats()['hashes'], 3)
+
+    def test_make_passwords_in_order(self):
+        """Test hashing many passwords keeps them in order"""
+        passwords = ['pass%s' % i for i in range(6)] + [None]
+
+        encoded = self.pool.make_passwords(passwords)
+
+        for password, hashed in zip(passwords[:-1], encoded):
+            self.assertTrue(hashers.check_password(password, hashed))
+        self.assertFalse(hashers.is_password_usable(encoded[-1]))
+
+    def test_stats_count_hashes(self):
+        """Test the pool records the hashes and their CPU time"""
+        encoded = self.pool.make_password('testpass123')
+        self.pool.check_password('testpass123', encoded)
+
+        stats = self.pool.get_stats()
+        self.assertEqual(stats['hashes'], 2)
+        self.assertGreater(stats['cpu_seconds'], 0)
+
+
+class RehashQueueTests(TestCase):
+    """Test upgrading outdated hashes"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('test@example.com', 'test123')
+        self.old = hashers.make_password('test123', hasher='pbkdf2_sha1')
+        get_user_model().objects.filter(pk=self.user.pk).update(password=self.old)
+
+    def test_rehash_upgrades_hash(self):
+        """Test the checked hash is replaced by one of the default hasher"""
+        RehashQueue(max_size=0).schedule(get_user_model(), self.user.pk, 'test123', self.old)
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        self.assertTrue(self.user.check_password('test123'))
+
+    def test_rehash_keeps_newer_password(self):
+        """Test a password changed since the check is not overwritten"""
+        self.user.set_password('newpass123')
+        self.user.save()
+
+        RehashQueue(max_size=0).schedule(get_user_model(), self.user.pk, 'test123', self.old)
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('newpass123'))
+
+
+class CalibratedHasherTests(SimpleTestCase):
+    """Test the PBKDF2 hasher with calibrated iterations"""
+
+    @override_settings(PASSWORD_PBKDF2_ITERATIONS=1000)
+    def test_iterations_from_settings(self):
+        """Test new hashes use the configured iterations"""
+        encoded = hashers.make_password('test123')
+
+        self.assertTrue(encoded.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(hashers.check_password('test123', encoded))
+
+    def test_changed_iterations_need_update(self):
+        """Test hashes made with other iterations are upgraded"""
+        with self.settings(PASSWORD_PBKDF2_ITERATIONS=1000):
+            encoded = hashers.make_password('test123')
+
+        with self.settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+            self.assertTrue(hashers.identify_hasher(encoded).must_update(encoded))
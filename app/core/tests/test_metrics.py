@@ -0,0 +1,174 @@
+"""
+Tests for the request instrumentation and the /metrics endpoint.
+"""
+
+import json
+import os
+import tempfile
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import metrics
+
+METRICS_URL = reverse('metrics')
+ME_URL = reverse('user:me')
+
+
+class PerformanceMiddlewareTests(TestCase):
+    """Test timing requests"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+        )
+        self.token = Token.objects.create(user=user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_server_timing_header(self):
+        """Test the response reports its phases"""
+        res = self.client.post(reverse('user:token'), {
+            'email': 'test@example.com',
+            'password': 'testpass123',
+        })
+
+        timing = res['Server-Timing']
+        for phase in ('db;dur=', 'serializer;dur=', 'hash;dur=', 'total;dur='):
+            self.assertIn(phase, timing)
+        self.assertIn('queries;desc=', timing)
+
+    def test_metrics_per_url_name(self):
+        """Test requests are aggregated by URL name on /metrics"""
+        self.client.get(ME_URL)
+
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        body = res.content.decode()
+        pid = os.getpid()
+        self.assertIn(
+            f'app_requests_total{{pid="{pid}",view="user:me",method="GET",status="200"}}',
+            body,
+        )
+        self.assertIn(
+            f'app_request_duration_seconds_count{{pid="{pid}",view="user:me",phase="total"}}',
+            body,
+        )
+        self.assertIn('# TYPE app_requests_total counter', body)
+        self.assertIn('# TYPE app_request_duration_seconds histogram', body)
+        self.assertIn('# HELP app_requests_total ', body)
+        self.assertIn('app_password_hashes_total', body)
+        self.assertIn('app_token_cache_hits', body)
+
+    def test_metrics_need_token(self):
+        """Test only the bearer of the metrics token may scrape"""
+        with self.settings(METRICS={**settings.METRICS, 'TOKEN': 'scrape-secret'}):
+            self.assertEqual(self.client.get(METRICS_URL).status_code, 403)
+            self.client.credentials(HTTP_AUTHORIZATION='Bearer scrape-secret')
+            res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_metrics_local_without_token(self):
+        """Test without a token only requests from this host are answered"""
+        res = self.client.get(METRICS_URL, REMOTE_ADDR='203.0.113.7')
+
+        self.assertEqual(res.status_code, 403)
+
+
+class WorkerMetricsTests(SimpleTestCase):
+    """Test rendering the metrics saved by the other workers"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def save_worker(self, pid):
+        data = {
+            'counters': [['app_requests_total', [['view', 'user:me']], 3]],
+            'histograms': [],
+            'gauges': [['app_db_pool_checkouts_total', [], 7]],
+        }
+        with open(os.path.join(self.directory, '%d.json' % pid), 'w') as output:
+            json.dump(data, output)
+
+    def test_other_workers_rendered(self):
+        """Test each worker's series are labelled with its pid"""
+        # the parent of the test process stands in for a live worker
+        self.save_worker(os.getppid())
+        metrics.write_snapshot(self.directory)
+
+        body = metrics.render(self.directory)
+
+        self.assertIn(f'app_requests_total{{pid="{os.getppid()}",view="user:me"}} 3', body)
+        self.assertIn(f'app_db_pool_checkouts_total{{pid="{os.getppid()}"}} 7', body)
+        self.assertEqual(body.count('# TYPE app_requests_total counter'), 1)
+
+    @patch('os.kill', side_effect=ProcessLookupError)
+    def test_dead_workers_removed(self, patched_kill):
+        """Test the metrics of a worker gone without cleaning up are dropped"""
+        self.save_worker(os.getpid() + 1)
+
+        body = metrics.render(self.directory)
+
+        self.assertNotIn(f'pid="{os.getpid() + 1}"', body)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class TimingTests(SimpleTestCase):
+    """Test the request timings"""
+
+    def test_nested_timers_counted_once(self):
+        """Test a phase nested in itself is not counted twice"""
+        timings, token = metrics.start_request()
+        try:
+            with metrics.timing('serializer'):
+                with metrics.timing('serializer'):
+                    pass
+        finally:
+            metrics.end_request(token)
+
+        self.assertEqual(list(timings.seconds), ['serializer'])
+
+    def test_timing_outside_request(self):
+        """Test timers are a no-op without a current request"""
+        with metrics.timing('hash'):
+            pass
+
+    def test_histogram_buckets_cumulative(self):
+        """Test the rendered histogram buckets are cumulative"""
+        registry = metrics.Registry()
+        registry.observe('test_seconds', (('view', 'x'),), 0.002)
+        registry.observe('test_seconds', (('view', 'x'),), 0.2)
+
+        values = registry.histograms[('test_seconds', (('view', 'x'),))]
+
+        self.assertEqual(values[-2], 2)
+        self.assertEqual(sum(values[:-2]), 2)
+
+
+class MemoryUsageTests(SimpleTestCase):
+    """Test reading the memory of the process"""
+
+    @skipUnless(os.path.exists('/proc/self/smaps_rollup'), 'needs Linux 4.14+')
+    def test_memory_usage(self):
+        """Test private memory is part of the resident memory"""
+        resident, private = metrics.memory_usage()
+
+        self.assertGreater(resident, 0)
+        self.assertLessEqual(private, resident)
+
+    def test_missing_process(self):
+        """Test None is returned when the memory cannot be read"""
+        self.assertIsNone(metrics.memory_usage(pid='no-such-process'))
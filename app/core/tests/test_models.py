@@ -2,11 +2,21 @@
 Tests for models.
 """
 
+from importlib import import_module
+from types import SimpleNamespace
+
+from django.apps import apps as global_apps
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 # helper function to help get the default user model while not directly importing the actual defined user model in models.py
 # it is the best practice to use get_user_model because even if you modify you custom user model later, this will still
 # automatically retrieve the default user model
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+
+from core.models import VersionConflict
 
 
 class ModelTests(TestCase):
@@ -55,3 +65,159 @@ class ModelTests(TestCase):
 
         self.assertTrue(user.is_superuser)
         self.assertTrue(user.is_staff)
+
+    def test_create_superuser_single_query(self):
+        """Test the superuser is created with a single INSERT"""
+        with self.assertNumQueries(1):
+            get_user_model().objects.create_superuser('test@example.com', 'test123')
+
+    def test_outdated_password_hash_upgraded_on_check(self):
+        """Test checking a password re-hashes it with the default hasher"""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'test123',
+        )
+        user.password = make_password('test123', hasher='pbkdf2_sha1')
+        user.save()
+
+        self.assertTrue(user.check_password('test123'))
+
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+
+    def test_get_by_natural_key_ignores_case(self):
+        """Test users are found by email whatever its case"""
+        user = get_user_model().objects.create_user('Test@Example.com', 'test123')
+
+        found = get_user_model().objects.get_by_natural_key('tEST@example.COM')
+
+        self.assertEqual(found, user)
+
+    def test_email_unique_ignoring_case(self):
+        """Test the database rejects emails only differing by case"""
+        get_user_model().objects.create_user('test@example.com', 'test123')
+
+        with self.assertRaises(IntegrityError):
+            get_user_model().objects.create_user('TEST@example.com', 'test123')
+
+    def test_validate_unique_ignores_case(self):
+        """Test model validation reports emails only differing by case"""
+        get_user_model().objects.create_user('test@example.com', 'test123')
+        user = get_user_model()(email='Test@example.com', name='Test')
+
+        with self.assertRaises(ValidationError) as cm:
+            user.validate_unique()
+
+        self.assertIn('email', cm.exception.message_dict)
+
+    def test_case_collisions(self):
+        """Test finding emails shared by several users ignoring case"""
+        get_user_model().objects.bulk_create([
+            get_user_model()(email='a@example.com'),
+            get_user_model()(email='b@example.com'),
+        ])
+        get_user_model().objects.filter(email='b@example.com').update(email='B@example.com')
+
+        self.assertEqual(list(get_user_model().objects.case_collisions()), [])
+
+    def test_case_collisions_found(self):
+        """Test emails differing only by case are reported, and block the index"""
+        with connection.cursor() as cursor:
+            # rolled back with the test, rows predating the index
+            cursor.execute('DROP INDEX core_user_email_lower_uniq')
+        get_user_model().objects.bulk_create([
+            get_user_model()(email='a@example.com'),
+            get_user_model()(email='A@example.com'),
+            get_user_model()(email='b@example.com'),
+        ])
+
+        collisions = get_user_model().objects.case_collisions()
+
+        self.assertEqual([(row['email_lower'], row['count']) for row in collisions], [('a@example.com', 2)])
+        migration = import_module('core.migrations.0003_user_email_lower_unique')
+        with self.assertRaisesMessage(RuntimeError, 'A@example.com (id'):
+            migration.check_case_collisions(global_apps, SimpleNamespace(connection=connection))
+
+    def test_save_unchanged_user_no_query(self):
+        """Test saving a user without changes does not touch the database"""
+        get_user_model().objects.create_user('test@example.com', 'test123')
+        user = get_user_model().objects.get()
+
+        with self.assertNumQueries(0):
+            user.save()
+
+    def test_save_writes_dirty_fields_only(self):
+        """Test saving a loaded user only updates the changed columns"""
+        get_user_model().objects.create_user('test@example.com', 'test123')
+        user = get_user_model().objects.get()
+        user.name = 'New Name'
+
+        self.assertEqual(user.get_dirty_fields(), ['name'])
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"name"', updates[0])
+        self.assertNotIn('"email"', updates[0])
+        self.assertEqual(user.get_dirty_fields(), [])
+        user.refresh_from_db()
+        self.assertEqual(user.name, 'New Name')
+
+    def test_created_user_tracked(self):
+        """Test a user is tracked from the save that created it"""
+        user = get_user_model().objects.create_user('test@example.com', 'test123')
+
+        with self.assertNumQueries(0):
+            user.save()
+
+    def test_deferred_field_loaded_not_dirty(self):
+        """Test a deferred column loaded on access is not written back"""
+        get_user_model().objects.create_user('test@example.com', 'test123', name='Test')
+        user = get_user_model().objects.only('id', 'email').get()
+
+        user.name
+        user.is_staff = True
+
+        self.assertEqual(user.get_dirty_fields(), ['is_staff'])
+
+    def test_version_bumped_on_change(self):
+        """Test every write bumps the version, saves without changes do not"""
+        user = get_user_model().objects.create_user('test@example.com', 'test123')
+        updated_at = user.updated_at
+        self.assertEqual(user.version, 1)
+
+        user.save()
+        user.name = 'New Name'
+        user.save()
+
+        user.refresh_from_db()
+        self.assertEqual(user.version, 2)
+        self.assertGreater(user.updated_at, updated_at)
+
+    def test_concurrent_writes_get_distinct_versions(self):
+        """Test instances loaded at the same version never write the same one"""
+        get_user_model().objects.create_user('test@example.com', 'test123')
+        first = get_user_model().objects.get()
+        second = get_user_model().objects.get()
+
+        first.name = 'First'
+        first.save()
+        second.name = 'Second'
+        second.save()
+
+        self.assertEqual((first.version, second.version), (2, 3))
+        self.assertEqual(get_user_model().objects.get().version, 3)
+
+    def test_expected_version_conflict(self):
+        """Test an update expecting another version is refused"""
+        user = get_user_model().objects.create_user('test@example.com', 'test123')
+        get_user_model().objects.filter(pk=user.pk).update(version=5)
+        user.name = 'New Name'
+        user.expected_version = 1
+
+        with self.assertRaises(VersionConflict):
+            user.save()
+
+        user.refresh_from_db()
+        self.assertEqual(user.name, '')
@@ -0,0 +1,104 @@
+"""
+Tests for the database connection pool.
+"""
+
+import threading
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from core.db.pool import ConnectionPool, PoolExhausted
+
+
+class FakeConnection:
+    """Stands in for a DB-API connection"""
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Test checking connections in and out of the pool"""
+
+    def test_connections_are_reused(self):
+        """Test a returned connection is handed out again"""
+        pool = ConnectionPool(FakeConnection)
+        conn = pool.getconn()
+        pool.putconn(conn)
+
+        self.assertIs(pool.getconn(), conn)
+        self.assertEqual(pool.get_stats()['opened'], 1)
+
+    def test_prewarm(self):
+        """Test prewarm opens min_size idle connections"""
+        pool = ConnectionPool(FakeConnection, min_size=3)
+        pool.prewarm()
+
+        stats = pool.get_stats()
+        self.assertEqual(stats['idle'], 3)
+        self.assertEqual(stats['in_use'], 0)
+
+    def test_exhausted_pool_times_out(self):
+        """Test checkout fails once max_size connections are in use"""
+        pool = ConnectionPool(FakeConnection, max_size=1, timeout=0.01)
+        pool.getconn()
+
+        with self.assertRaises(PoolExhausted):
+            pool.getconn()
+        self.assertEqual(pool.get_stats()['timeouts'], 1)
+
+    def test_waiting_checkout_gets_returned_connection(self):
+        """Test a waiting thread gets the next connection put back"""
+        pool = ConnectionPool(FakeConnection, max_size=1, timeout=5)
+        conn = pool.getconn()
+        timer = threading.Timer(0.05, pool.putconn, [conn])
+        timer.start()
+
+        self.assertIs(pool.getconn(), conn)
+        self.assertEqual(pool.get_stats()['waits'], 1)
+        timer.join()
+
+    def test_overflow_connections_are_closed(self):
+        """Test an exhausted pool opens overflow connections and closes them"""
+        pool = ConnectionPool(FakeConnection, max_size=1, timeout=0, overflow=1)
+        pool.getconn()
+        conn = pool.getconn()
+
+        self.assertEqual(pool.get_stats()['overflow'], 1)
+        pool.putconn(conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.get_stats()['overflow'], 0)
+
+    def test_failed_health_check_replaces_connection(self):
+        """Test a connection failing its check is closed and replaced"""
+        pool = ConnectionPool(FakeConnection, check=lambda conn: not conn.closed)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        conn.closed = True
+
+        self.assertIsNot(pool.getconn(), conn)
+        self.assertEqual(pool.get_stats()['failed_checks'], 1)
+
+    def test_unusable_connection_not_returned(self):
+        """Test reset rejecting a connection closes it"""
+        pool = ConnectionPool(FakeConnection, reset=lambda conn: False)
+        conn = pool.getconn()
+        pool.putconn(conn)
+
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.get_stats()['size'], 0)
+
+    @patch('core.db.pool.time.monotonic')
+    def test_expired_connection_replaced(self, patched_monotonic):
+        """Test connections older than max_lifetime are not reused"""
+        patched_monotonic.return_value = 0
+        pool = ConnectionPool(FakeConnection, max_lifetime=60)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        patched_monotonic.return_value = 61
+
+        self.assertIsNot(pool.getconn(), conn)
+        self.assertTrue(conn.closed)
@@ -0,0 +1,101 @@
+"""
+Tests for the warm-up and the health endpoints.
+"""
+
+import threading
+from unittest.mock import MagicMock, patch
+
+from django.db.utils import OperationalError
+from django.test import TestCase
+from django.urls import reverse
+
+from core import readiness
+from user import views
+
+LIVENESS_URL = reverse('liveness')
+READINESS_URL = reverse('readiness')
+
+
+class WarmUpTests(TestCase):
+    """Test warming up a process before it serves"""
+
+    def test_views_are_found(self):
+        """Test the class-based views of every URLconf are found"""
+        found = set(readiness.iter_views())
+
+        self.assertIn(views.ManageUserView, found)
+        self.assertIn(views.ExportUserView, found)
+
+    def test_warm_up_marks_ready(self):
+        """Test the process is ready once warmed up with its databases"""
+        with patch.object(readiness, '_ready') as patched_ready:
+            readiness.warm_up(databases=False)
+            patched_ready.set.assert_not_called()
+
+            readiness.warm_up()
+            patched_ready.set.assert_called_once_with()
+
+    @patch.object(readiness, '_warmed', threading.Event())
+    @patch.object(readiness, '_ready', threading.Event())
+    def test_not_ready_while_database_down(self):
+        """Test a process warmed up without its database is ready once it answers"""
+        with patch('django.db.backends.base.base.BaseDatabaseWrapper.ensure_connection',
+                   side_effect=OperationalError('down')):
+            readiness.warm_up()
+
+            self.assertFalse(readiness.is_ready())
+
+        self.assertTrue(readiness.is_ready())
+
+    def test_unpooled_connections_not_kept(self):
+        """Test a connection opened for the check is closed again"""
+        connection = MagicMock(connection=None)
+        with patch.object(readiness, 'connections', {'replica1': connection}):
+            self.assertEqual(readiness.warm_connections(), [])
+
+        connection.ensure_connection.assert_called_once_with()
+        connection.close.assert_called_once_with()
+
+    def test_serializers_are_compiled(self):
+        """Test the compiled representations are built ahead of requests"""
+        with patch.object(views.UserSerializer, '_compiled', {}):
+            readiness.warm_serializers()
+
+            self.assertIn(views.UserSerializer, views.UserSerializer._compiled)
+
+
+class HealthEndpointTests(TestCase):
+    """Test the liveness and readiness probes"""
+
+    def test_liveness_without_database(self):
+        """Test liveness answers without a query"""
+        with self.assertNumQueries(0):
+            res = self.client.get(LIVENESS_URL)
+
+        self.assertEqual(res.status_code, 200)
+
+    @patch('core.readiness.is_ready', return_value=False)
+    def test_not_ready_while_starting(self, patched_ready):
+        """Test readiness fails until the process warmed up"""
+        res = self.client.get(READINESS_URL)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json(), {'status': 'starting'})
+
+    @patch('core.readiness.is_ready', return_value=True)
+    def test_ready(self, patched_ready):
+        """Test readiness reports every database"""
+        res = self.client.get(READINESS_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {'status': 'ready', 'databases': {'default': None}})
+
+    @patch('core.readiness.is_ready', return_value=True)
+    def test_database_down(self, patched_ready):
+        """Test readiness fails while a database is down"""
+        with patch('django.db.backends.base.base.BaseDatabaseWrapper.ensure_connection',
+                   side_effect=OperationalError('down')):
+            res = self.client.get(READINESS_URL)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['databases'], {'default': 'down'})
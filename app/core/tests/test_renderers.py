@@ -0,0 +1,107 @@
+"""
+Tests for the orjson backed renderer and parser.
+"""
+
+import datetime
+import io
+import uuid
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+from django.utils.translation import gettext_lazy
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer
+
+DATA = ReturnList([
+    ReturnDict({
+        'id': 1,
+        'email': 'test@example.com',
+        'name': 'Zo\u00eb\u2028line',
+        'is_active': True,
+        'ratio': 0.5,
+        'missing': None,
+        'created': datetime.datetime(2021, 6, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+        'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'price': Decimal('1.50'),
+        'label': gettext_lazy('Users'),
+        'counts': {1: 2},
+    }, serializer=None),
+], serializer=None)
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    """Test rendering JSON with orjson"""
+
+    def test_same_bytes_as_json_renderer(self):
+        """Test the output matches DRF's renderer"""
+        self.assertEqual(
+            FastJSONRenderer().render(DATA),
+            JSONRenderer().render(DATA),
+        )
+
+    def test_none_renders_empty(self):
+        """Test rendering None returns an empty body"""
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_indent_uses_json_renderer(self):
+        """Test indented output is left to the stdlib encoder"""
+        media_type = 'application/json; indent=4'
+
+        self.assertEqual(
+            FastJSONRenderer().render(DATA, media_type),
+            JSONRenderer().render(DATA, media_type),
+        )
+
+    def test_wide_integer_uses_json_renderer(self):
+        """Test values orjson rejects are still rendered"""
+        data = {'big': 2 ** 70}
+
+        self.assertEqual(FastJSONRenderer().render(data), b'{"big":1180591620717411303424}')
+
+    @patch('core.renderers.orjson', None)
+    def test_without_orjson(self):
+        """Test the renderer works when orjson is not installed"""
+        self.assertEqual(
+            FastJSONRenderer().render(DATA),
+            JSONRenderer().render(DATA),
+        )
+
+
+class FastJSONParserTests(SimpleTestCase):
+    """Test parsing JSON with orjson"""
+
+    def test_parse(self):
+        """Test parsing a request body"""
+        body = '{"email": "zoë@example.com", "items": [1, 2.5, null]}'.encode()
+
+        data = FastJSONParser().parse(io.BytesIO(body))
+
+        self.assertEqual(data, JSONParser().parse(io.BytesIO(body)))
+
+    def test_parse_other_encoding(self):
+        """Test parsing a body sent in another charset"""
+        body = '{"name": "Zoë"}'.encode('latin-1')
+
+        data = FastJSONParser().parse(io.BytesIO(body), parser_context={'encoding': 'latin-1'})
+
+        self.assertEqual(data, {'name': 'Zoë'})
+
+    def test_invalid_json_error(self):
+        """Test invalid bodies raise a parse error"""
+        for body in (b'{"email": ', b'{"value": NaN}', b'\xff'):
+            with self.subTest(body=body), self.assertRaises(ParseError):
+                FastJSONParser().parse(io.BytesIO(body))
+
+    @patch('core.parsers.orjson', None)
+    def test_without_orjson(self):
+        """Test the parser works when orjson is not installed"""
+        data = FastJSONParser().parse(io.BytesIO(b'{"a": [1]}'))
+
+        self.assertEqual(data, {'a': [1]})
@@ -0,0 +1,124 @@
+"""
+Tests for the primary/replica database router.
+"""
+
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core.db import routers
+from core.middleware import PrimaryStickinessMiddleware
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    """Test where the router sends reads and writes"""
+
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+        self.model = get_user_model()
+
+    def test_reads_go_to_a_replica(self):
+        """Test reads outside a request go to any replica"""
+        self.assertIn(self.router.db_for_read(self.model), ['replica1', 'replica2'])
+
+    def test_writes_go_to_the_primary(self):
+        """Test writes always go to the primary"""
+        self.assertEqual(self.router.db_for_write(self.model), 'default')
+
+    def test_request_reads_one_replica(self):
+        """Test every read of a request goes to the same replica"""
+        state, token = routers.start_request()
+        try:
+            reads = {self.router.db_for_read(self.model) for _ in range(20)}
+        finally:
+            routers.end_request(token)
+
+        self.assertEqual(reads, {state.replica})
+
+    def test_reads_after_write_go_to_the_primary(self):
+        """Test a request reads from the primary once it wrote"""
+        state, token = routers.start_request()
+        try:
+            self.router.db_for_write(self.model)
+            db = self.router.db_for_read(self.model)
+        finally:
+            routers.end_request(token)
+
+        self.assertTrue(state.wrote)
+        self.assertEqual(db, 'default')
+
+    def test_pinned_request_reads_the_primary(self):
+        """Test a pinned client reads from the primary"""
+        _, token = routers.start_request(pinned=True)
+        try:
+            self.assertEqual(self.router.db_for_read(self.model), 'default')
+        finally:
+            routers.end_request(token)
+
+    def test_reads_in_transaction_go_to_the_primary(self):
+        """Test reads inside a transaction on the primary stay there"""
+        with patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(self.model), 'default')
+
+    def test_replicas_are_not_migrated(self):
+        """Test migrations only run on the primary"""
+        self.assertFalse(self.router.allow_migrate('replica1', 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
+
+
+class StickyClientsTests(SimpleTestCase):
+    """Test remembering the clients that wrote recently"""
+
+    def test_pin_expires(self):
+        """Test a client reads from the primary for the configured seconds"""
+        clients = routers.StickyClients(seconds=10)
+        clients.pin('10.0.0.1', now=100)
+
+        self.assertTrue(clients.is_pinned('10.0.0.1', now=109))
+        self.assertFalse(clients.is_pinned('10.0.0.2', now=109))
+        self.assertFalse(clients.is_pinned('10.0.0.1', now=110))
+        self.assertEqual(clients.stats()['size'], 0)
+
+    def test_least_recent_clients_are_evicted(self):
+        """Test the store keeps at most max_keys clients"""
+        clients = routers.StickyClients(seconds=10, max_keys=2)
+        for client in ['a', 'b', 'c']:
+            clients.pin(client, now=100)
+
+        self.assertFalse(clients.is_pinned('a', now=101))
+        self.assertTrue(clients.is_pinned('c', now=101))
+
+    @override_settings(CACHES={'sticky': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_shared_cache(self):
+        """Test clients pinned by one worker are pinned for the others"""
+        routers.StickyClients(shared_cache='sticky').pin('10.0.0.1')
+
+        self.assertTrue(routers.StickyClients(shared_cache='sticky').is_pinned('10.0.0.1'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class PrimaryStickinessMiddlewareTests(SimpleTestCase):
+    """Test clients are pinned to the primary after writing"""
+
+    def setUp(self):
+        routers.get_sticky_clients().clear()
+        self.factory = RequestFactory()
+
+    def get_response(self, request):
+        if request.method == 'POST':
+            routers.PrimaryReplicaRouter().db_for_write(get_user_model())
+        db = routers.PrimaryReplicaRouter().db_for_read(get_user_model())
+        return HttpResponse(db)
+
+    def test_client_reads_its_writes(self):
+        """Test a client reads from the primary after writing, others do not"""
+        middleware = PrimaryStickinessMiddleware(self.get_response)
+
+        self.assertEqual(middleware(self.factory.get('/', REMOTE_ADDR='10.0.0.1')).content, b'replica1')
+        self.assertEqual(middleware(self.factory.post('/', REMOTE_ADDR='10.0.0.1')).content, b'default')
+        self.assertEqual(middleware(self.factory.get('/', REMOTE_ADDR='10.0.0.1')).content, b'default')
+        self.assertEqual(middleware(self.factory.get('/', REMOTE_ADDR='10.0.0.2')).content, b'replica1')
@@ -0,0 +1,128 @@
+"""
+Tests for the cached OpenAPI schema.
+"""
+
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from core import schema
+
+SCHEMA_URL = reverse('api-schema')
+
+
+class CachedSchemaViewTests(SimpleTestCase):
+    """Test serving the schema from memory"""
+
+    def setUp(self):
+        schema.clear_variants()
+
+    def tearDown(self):
+        schema.clear_variants()
+
+    def test_schema_generated_once(self):
+        """Test the schema is generated on the first request only"""
+        with patch('core.schema.generate_schema', wraps=schema.generate_schema) as patched:
+            self.client.get(SCHEMA_URL)
+            res = self.client.get(SCHEMA_URL)
+
+        patched.assert_called_once()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['Content-Type'], 'application/vnd.oai.openapi')
+        self.assertIn(b'/api/user/me/', res.content)
+
+    def test_json_format(self):
+        """Test requesting the JSON document"""
+        res = self.client.get(SCHEMA_URL, {'format': 'openapi-json'})
+
+        self.assertEqual(res['Content-Type'], 'application/vnd.oai.openapi+json')
+        self.assertIn('/api/user/me/', json.loads(res.content)['paths'])
+
+    def test_not_modified(self):
+        """Test a matching If-None-Match gets an empty 304"""
+        etag = self.client.get(SCHEMA_URL)['ETag']
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.content, b'')
+        self.assertEqual(res['ETag'], etag)
+
+    def test_gzip_variant(self):
+        """Test clients accepting gzip get the compressed document"""
+        plain = self.client.get(SCHEMA_URL)
+
+        res = self.client.get(SCHEMA_URL, HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.content), plain.content)
+        self.assertEqual(res['ETag'], plain['ETag'])
+        self.assertIn('Accept-Encoding', res['Vary'])
+
+    def test_gzip_refused(self):
+        """Test gzip;q=0 gets the plain document"""
+        res = self.client.get(SCHEMA_URL, HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+
+        self.assertNotIn('Content-Encoding', res)
+        self.assertIn(b'/api/user/me/', res.content)
+
+    def test_accepts_gzip(self):
+        """Test the q-values of Accept-Encoding are honoured"""
+        self.assertTrue(schema.accepts_gzip('gzip'))
+        self.assertTrue(schema.accepts_gzip('br;q=1.0, gzip;q=0.5'))
+        self.assertTrue(schema.accepts_gzip('*'))
+        self.assertFalse(schema.accepts_gzip('gzip;q=0'))
+        self.assertFalse(schema.accepts_gzip('*, gzip;q=0.000'))
+        self.assertFalse(schema.accepts_gzip(''))
+
+
+class BuildSchemaCommandTests(SimpleTestCase):
+    """Test pre-generating the schema into a directory"""
+
+    def setUp(self):
+        schema.clear_variants()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        schema.clear_variants()
+
+    def test_schema_read_from_directory(self):
+        """Test the view serves the built schema without generating it"""
+        call_command('build_schema', dir=self.directory, stdout=StringIO())
+
+        with override_settings(SCHEMA_CACHE_DIR=self.directory), \
+                patch('core.schema.generate_schema') as patched:
+            res = self.client.get(SCHEMA_URL)
+
+        patched.assert_not_called()
+        self.assertIn(b'/api/user/me/', res.content)
+
+    def test_gzip_read_from_directory(self):
+        """Test the gzip variant built by the command is the one served"""
+        call_command('build_schema', dir=self.directory, stdout=StringIO())
+        with open(os.path.join(self.directory, 'openapi.yaml.gz'), 'rb') as f:
+            built = f.read()
+
+        with override_settings(SCHEMA_CACHE_DIR=self.directory), \
+                patch('core.schema.gzip.compress') as patched:
+            res = self.client.get(SCHEMA_URL, HTTP_ACCEPT_ENCODING='gzip')
+
+        patched.assert_not_called()
+        self.assertEqual(res.content, built)
+
+    @patch('core.schema.source_fingerprint', return_value='changed')
+    def test_stale_schema_regenerated(self, patched_fingerprint):
+        """Test a schema built from other sources is not used"""
+        schema.write_schema(self.directory, {'openapi': b'old', 'openapi-json': b'{}'}, 'old')
+
+        with override_settings(SCHEMA_CACHE_DIR=self.directory):
+            res = self.client.get(SCHEMA_URL)
+
+        self.assertNotEqual(res.content, b'old')
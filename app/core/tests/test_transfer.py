@@ -0,0 +1,149 @@
+"""
+Tests for the import_users and export_users commands.
+"""
+
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+
+class TransferCommandTests(TestCase):
+    """Test moving users between databases through files"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def write(self, name, content):
+        with open(self.path(name), 'w') as f:
+            f.write(content)
+        return self.path(name)
+
+    def test_export_jsonl(self):
+        """Test users are exported one JSON object per line, hashes included"""
+        user = get_user_model().objects.create_user('test@example.com', 'test123', name='Test')
+
+        call_command('export_users', self.path('users.jsonl'), stdout=StringIO())
+
+        with open(self.path('users.jsonl')) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(rows, [{
+            'email': 'test@example.com', 'name': 'Test', 'password': user.password,
+            'is_active': True, 'is_staff': False, 'is_superuser': False,
+        }])
+
+    def test_export_import_csv_round_trip(self):
+        """Test exported users import back with their password hashes"""
+        get_user_model().objects.create_user('one@example.com', 'test123', name='One')
+        get_user_model().objects.create_superuser('two@example.com', 'test456')
+        call_command('export_users', self.path('users.csv'), stdout=StringIO())
+        get_user_model().objects.all().delete()
+
+        call_command('import_users', self.path('users.csv'), batch_size=1, stdout=StringIO())
+
+        one = get_user_model().objects.get(email='one@example.com')
+        two = get_user_model().objects.get(email='two@example.com')
+        self.assertEqual(one.name, 'One')
+        self.assertTrue(one.check_password('test123'))
+        self.assertTrue(two.is_superuser)
+        self.assertTrue(two.check_password('test456'))
+
+    def test_import_hashes_plaintext(self):
+        """Test plaintext passwords are hashed and hashes kept as they are"""
+        encoded = make_password('hashed123')
+        path = self.write('users.jsonl', '\n'.join([
+            json.dumps({'email': 'plain@EXAMPLE.com', 'name': 'Plain', 'password': 'plain123'}),
+            json.dumps({'email': 'hashed@example.com', 'name': 'Hashed', 'password': encoded}),
+            json.dumps({'email': 'none@example.com', 'name': 'None'}),
+        ]))
+        out = StringIO()
+
+        call_command('import_users', path, stdout=out)
+
+        plain = get_user_model().objects.get(email='plain@example.com')
+        self.assertTrue(plain.check_password('plain123'))
+        self.assertEqual(get_user_model().objects.get(email='hashed@example.com').password, encoded)
+        self.assertFalse(get_user_model().objects.get(email='none@example.com').has_usable_password())
+        self.assertIn('hashed 1 plaintext passwords', out.getvalue())
+
+    def test_import_plaintext_like_unusable(self):
+        """Test only Django's exact unusable format is kept as a hash"""
+        unusable = make_password(None)
+        path = self.write('users.jsonl', '\n'.join([
+            json.dumps({'email': 'bang@example.com', 'name': 'Bang', 'password': '!secret123'}),
+            json.dumps({'email': 'unusable@example.com', 'name': 'Unusable', 'password': unusable}),
+        ]))
+
+        call_command('import_users', path, stdout=StringIO())
+
+        self.assertTrue(get_user_model().objects.get(email='bang@example.com').check_password('!secret123'))
+        self.assertEqual(get_user_model().objects.get(email='unusable@example.com').password, unusable)
+
+    def test_import_skips_invalid_rows(self):
+        """Test rows without a valid email are reported by line and skipped"""
+        path = self.write('users.jsonl', '\n'.join([
+            json.dumps({'email': 'valid@example.com', 'name': 'Valid', 'password': 'valid123'}),
+            json.dumps({'email': None, 'name': 'Null', 'password': 'null123'}),
+            '',
+            json.dumps({'email': 'not-an-email', 'name': 'Invalid', 'password': 'invalid123'}),
+            json.dumps({'name': 'Missing', 'password': 'missing123'}),
+        ]))
+        out, err = StringIO(), StringIO()
+
+        call_command('import_users', path, stdout=out, stderr=err)
+
+        self.assertEqual(
+            list(get_user_model().objects.values_list('email', flat=True)),
+            ['valid@example.com'],
+        )
+        self.assertIn('Line 2: missing email', err.getvalue())
+        self.assertIn("Line 4: invalid email 'not-an-email'", err.getvalue())
+        self.assertIn('Line 5: missing email', err.getvalue())
+        self.assertIn('imported 1, skipped 0 existing and 3 invalid', out.getvalue())
+        self.assertIn('hashed 1 plaintext passwords', out.getvalue())
+
+    def test_import_counts_only_batch_emails(self):
+        """Test counting skipped rows queries the emails of the batch only"""
+        get_user_model().objects.create_user('test@example.com', 'test123')
+        path = self.write('users.csv', (
+            'email,name,password,is_active,is_staff,is_superuser\n'
+            'TEST@example.com,New,pbkdf2_sha256$1$salt$hash,,,\n'
+            'new@example.com,New,pbkdf2_sha256$1$salt$hash,,,\n'
+            'NEW@example.com,Again,pbkdf2_sha256$1$salt$hash,,,\n'
+        ))
+        out = StringIO()
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_users', path, stdout=out)
+
+        self.assertFalse(any('COUNT' in query['sql'] and 'LOWER' not in query['sql'] for query in queries))
+        self.assertIn('imported 1, skipped 2 existing', out.getvalue())
+
+    def test_import_skips_existing(self):
+        """Test emails already taken, ignoring case, are skipped"""
+        get_user_model().objects.create_user('test@example.com', 'test123', name='Old')
+        path = self.write('users.csv', (
+            'email,name,password,is_active,is_staff,is_superuser\n'
+            'TEST@example.com,New,new123,true,true,false\n'
+            'other@example.com,Other,other123,,,\n'
+        ))
+        out = StringIO()
+
+        call_command('import_users', path, stdout=out)
+
+        self.assertEqual(get_user_model().objects.get(email='test@example.com').name, 'Old')
+        other = get_user_model().objects.get(email='other@example.com')
+        self.assertTrue(other.is_active)
+        self.assertFalse(other.is_staff)
+        self.assertIn('imported 1, skipped 1 existing', out.getvalue())
@@ -0,0 +1,33 @@
+"""
+Tests for the project wide views.
+"""
+
+from unittest.mock import patch
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+from django.views import View
+
+from core.views import lazy_view
+
+
+class GreetingView(View):
+    greeting = 'hello'
+
+    def get(self, request):
+        return HttpResponse(self.greeting)
+
+
+class LazyViewTests(SimpleTestCase):
+    """Test views imported on their first request"""
+
+    def test_imported_on_first_request(self):
+        """Test the view is imported once, on the first request"""
+        with patch('core.views.import_string', return_value=GreetingView) as patched:
+            view = lazy_view('core.tests.test_views.GreetingView', greeting='hi')
+            patched.assert_not_called()
+
+            responses = [view(RequestFactory().get('/')) for _ in range(2)]
+
+        patched.assert_called_once_with('core.tests.test_views.GreetingView')
+        self.assertEqual([res.content for res in responses], [b'hi', b'hi'])
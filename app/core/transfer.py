@@ -0,0 +1,154 @@
+"""
+Streaming reading and writing of user rows for import_users/export_users.
+"""
+
+import csv
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import (
+    UNUSABLE_PASSWORD_PREFIX,
+    UNUSABLE_PASSWORD_SUFFIX_LENGTH,
+    identify_hasher,
+    make_password,
+)
+from django.core.exceptions import ValidationError
+
+from core import hashing
+from core.renderers import orjson
+
+# columns moved between environments, passwords always travel hashed
+FIELDS = ['email', 'name', 'password', 'is_active', 'is_staff', 'is_superuser']
+BOOLEAN_FIELDS = {'is_active': True, 'is_staff': False, 'is_superuser': False}
+
+
+def guess_format(path, default='jsonl'):
+    """Return 'csv' or 'jsonl' from a file name."""
+    if path and path.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def dumps(row):
+    """Return a row as one JSON line."""
+    if orjson is not None:
+        return orjson.dumps(row).decode() + '\n'
+    return json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def write_rows(rows, stream, fmt):
+    """Write (email, name, ...) tuples to a text stream, return the count."""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(FIELDS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+        return count
+
+    for row in rows:
+        stream.write(dumps(dict(zip(FIELDS, row))))
+        count += 1
+    return count
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, dict) per row of a CSV or JSONL text stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    loads = orjson.loads if orjson is not None else json.loads
+    for number, line in enumerate(stream, 1):
+        if line.strip():
+            yield number, loads(line)
+
+
+def parse_bool(value, default):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 't', 'yes')
+
+
+def is_unusable(password):
+    """True for exactly what make_password(None) returns."""
+    suffix = password[len(UNUSABLE_PASSWORD_PREFIX):]
+    return (
+        password.startswith(UNUSABLE_PASSWORD_PREFIX)
+        and len(suffix) == UNUSABLE_PASSWORD_SUFFIX_LENGTH
+        and suffix.isascii() and suffix.isalnum()
+    )
+
+
+def is_hashed(password):
+    """True for a hash Django can check, false for a plaintext password."""
+    # a plaintext password may start with '!' too
+    if not password or is_unusable(password):
+        return True
+    try:
+        identify_hasher(password)
+    except ValueError:
+        return False
+    return True
+
+
+def row_error(row):
+    """Return why a row can't be imported, None for a valid row."""
+    email = row.get('email')
+    if not isinstance(email, str) or not email.strip():
+        return 'missing email'
+    try:
+        # the checks of the model field, EmailValidator and max_length
+        get_user_model()._meta.get_field('email').run_validators(email)
+    except ValidationError as exc:
+        return f'invalid email {email!r}: {" ".join(exc.messages)}'
+    return None
+
+
+def clean_batch(rows, normalize_email):
+    """Return (rows as FIELDS tuples, number of passwords hashed, errors).
+
+    Invalid rows are left out and reported in errors as (index in rows,
+    reason). Plaintext passwords of the batch are hashed in parallel on the
+    hashing pool, hashes are kept as they are.
+    """
+    errors = []
+    for index, row in enumerate(rows):
+        error = row_error(row)
+        if error is not None:
+            errors.append((index, error))
+    if errors:
+        invalid = {index for index, _ in errors}
+        rows = [row for index, row in enumerate(rows) if index not in invalid]
+
+    passwords = [row.get('password') or '' for row in rows]
+    plaintext = [index for index, password in enumerate(passwords) if not is_hashed(password)]
+    for index, encoded in zip(plaintext, hashing.make_passwords([passwords[i] for i in plaintext])):
+        passwords[index] = encoded
+
+    cleaned = []
+    for row, password in zip(rows, passwords):
+        cleaned.append((
+            normalize_email(row['email']),
+            row.get('name') or '',
+            # no password at all becomes an unusable one
+            password or make_password(None),
+        ) + tuple(
+            parse_bool(row.get(name), default)
+            for name, default in BOOLEAN_FIELDS.items()
+        ))
+    return cleaned, len(plaintext), errors
+
+
+def to_csv(rows):
+    """Return rows as an in-memory CSV file for COPY."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    return buffer
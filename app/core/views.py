@@ -0,0 +1,71 @@
+"""
+Views for the project wide endpoints.
+"""
+
+import hmac
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.utils.module_loading import import_string
+from django.views.decorators.http import require_GET
+
+from core import metrics, readiness
+
+
+def can_scrape(request):
+    """True for the bearer of settings.METRICS['TOKEN'], or locally without one"""
+    token = settings.METRICS['TOKEN']
+    if not token:
+        return request.META.get('REMOTE_ADDR') in ('127.0.0.1', '::1')
+    return hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer ' + token)
+
+
+@require_GET
+def metrics_view(request):
+    """Return the metrics of every worker in the Prometheus text format"""
+    if not can_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.render(settings.METRICS['DIR']),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+@require_GET
+def liveness_view(request):
+    """Answer while the process serves requests, without using the database"""
+    return HttpResponse('ok', content_type='text/plain')
+
+
+@require_GET
+def readiness_view(request):
+    """Answer 200 once the process warmed up and its databases answer"""
+    if not readiness.is_ready():
+        return JsonResponse({'status': 'starting'}, status=503)
+    databases = readiness.check_databases()
+    ready = not any(databases.values())
+    return JsonResponse(
+        {'status': 'ready' if ready else 'unavailable', 'databases': databases},
+        status=200 if ready else 503,
+    )
+
+
+def lazy_view(dotted_path, **initkwargs):
+    """Return a view importing its class-based view on the first request.
+
+    Keeps heavy modules, like the schema generator, out of the start of the
+    processes that never serve them.
+    """
+    view = None
+    lock = threading.Lock()
+
+    def lazy(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            with lock:
+                if view is None:
+                    view = import_string(dotted_path).as_view(**initkwargs)
+        return view(request, *args, **kwargs)
+
+    return lazy
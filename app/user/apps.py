@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class UserConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user'
+
+    def ready(self):
+        # connect the cache invalidation signal handlers
+        from user import signals  # noqa: F401
+        from core import metrics
+        from user import authentication, throttling, tokens
+
+        metrics.register_gauges(authentication.metrics_gauges)
+        metrics.register_gauges(tokens.metrics_gauges)
+        metrics.register_gauges(throttling.metrics_gauges)
@@ -0,0 +1,120 @@
+"""
+Async adapters running the user API views on a sized thread pool.
+"""
+
+import asyncio
+import contextvars
+import functools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the thread pool the async views run their sync work on."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # every thread keeps its own database connection, so this
+                # also caps the connections held by one ASGI worker
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.USER_API_THREADS,
+                    thread_name_prefix='user-api',
+                )
+    return _executor
+
+
+def _call_view(view, request, *args, **kwargs):
+    """Run a sync view and render its response on a pool thread."""
+    # the request_started/finished signals only clean up the connection of
+    # the event loop thread, pool threads honour CONN_MAX_AGE here instead
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response = response.render()
+        if response.streaming:
+            response.streaming_content = stream_on_thread(response.streaming_content)
+        return response
+    finally:
+        close_old_connections()
+
+
+def _put(items, stop, item):
+    """Queue an item unless the consumer stopped, return False if it did."""
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _produce(iterator, items, stop):
+    """Put the parts of a streaming response on a queue until stopped."""
+    try:
+        for part in iterator:
+            if not _put(items, stop, (True, part)):
+                return
+        _put(items, stop, (False, None))
+    except Exception as exc:
+        _put(items, stop, (False, exc))
+    finally:
+        # the thread is gone once the response is sent, and so are its
+        # connections unless they are closed here
+        connections.close_all()
+
+
+def stream_on_thread(iterator, prefetch=2):
+    """Pull a streaming response on a thread of its own.
+
+    Django iterates streaming content on the event loop thread, where the
+    ORM refuses to run, so parts reading the database are produced by a
+    thread staying at most prefetch parts ahead of the client.
+    """
+    items = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=_produce, args=(iterator, items, stop),
+        name='user-api-stream', daemon=True,
+    )
+    thread.start()
+    try:
+        while True:
+            more, part = items.get()
+            if not more:
+                if part is not None:
+                    raise part
+                return
+            yield part
+    finally:
+        # the client went away, let the producer finish
+        stop.set()
+
+
+def as_async_view(view):
+    """Wrap a sync view so it runs on the user API thread pool."""
+    # Django would otherwise run every sync view on the one thread shared by
+    # all thread sensitive work, serializing the requests of a worker
+
+    async def async_view(request, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # carry the request's context variables, e.g. its timings
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            get_executor(),
+            context.run,
+            functools.partial(_call_view, view, request, *args, **kwargs),
+        )
+
+    # keep csrf_exempt and the other attributes set by as_view()
+    functools.update_wrapper(async_view, view)
+    return async_view
@@ -0,0 +1,389 @@
+"""
+Authentication classes for the user API.
+"""
+
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from rest_framework import authentication, exceptions
+from rest_framework.authtoken.models import Token
+
+from core.cache import check_shared
+from user import tokens
+
+
+def _field_names(model):
+    """Return the column attribute names used to rebuild a model instance."""
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+class TokenCache:
+    """LRU cache with TTL mapping a token key to its token and user rows.
+
+    Tokens and the users cached for signed access tokens live in separate
+    namespaces, so no key sent by a client can reach a user entry.
+
+    With a shared tier, invalidating a user stores a new stamp for it there
+    and every hit is checked against that stamp, so other workers drop their
+    local entries on the next request. Without one, other workers serve an
+    invalidated entry until its TTL runs out.
+    """
+
+    # prefix used for the keys stored in the optional shared cache tier
+    key_prefix = 'user-token:'
+
+    def __init__(self, max_size=10000, ttl=300, shared_cache=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        # alias of an entry in settings.CACHES shared between workers
+        self.shared_cache = shared_cache
+        # ('token', key) or ('user', pk) -> (expires_at, user pk, token
+        # values, user values, stamp of the user when cached)
+        self._entries = OrderedDict()
+        # user pk -> set of entry keys, used to invalidate by user
+        self._user_keys = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls):
+        """Create a cache configured by settings.USER_TOKEN_CACHE."""
+        config = getattr(settings, 'USER_TOKEN_CACHE', {})
+        if config.get('SHARED_CACHE'):
+            # a cache of each process would keep invalidations in one worker
+            # while the long TTL of a shared tier applies
+            check_shared(config['SHARED_CACHE'], 'USER_TOKEN_CACHE_ALIAS')
+        return cls(
+            max_size=config.get('MAX_SIZE', 10000),
+            ttl=config.get('TTL', 300),
+            shared_cache=config.get('SHARED_CACHE'),
+        )
+
+    def _shared(self):
+        return caches[self.shared_cache] if self.shared_cache else None
+
+    def _shared_key(self, entry_key):
+        return '%s%s:%s' % ((self.key_prefix,) + entry_key)
+
+    def _build(self, entry):
+        """Build fresh Token and User instances from a cached entry."""
+        # new instances are built for every hit so that a view mutating
+        # request.user never changes what other requests get from the cache
+        _, _, token_values, user_values, _ = entry
+        user_model = get_user_model()
+        user = user_model.from_db(
+            None, _field_names(user_model), user_values,
+        )
+        if token_values is None:
+            return user
+        token = Token.from_db(None, _field_names(Token), token_values)
+        token.user = user
+        return token
+
+    def _store(self, entry_key, entry):
+        """Store an entry locally, evicting the least recently used."""
+        user_pk = entry[1]
+        with self._lock:
+            self._entries[entry_key] = entry
+            self._entries.move_to_end(entry_key)
+            self._user_keys.setdefault(user_pk, set()).add(entry_key)
+            while len(self._entries) > self.max_size:
+                old_key, old_entry = self._entries.popitem(last=False)
+                self._discard_user_key(old_entry[1], old_key)
+
+    def _discard_user_key(self, user_pk, entry_key):
+        keys = self._user_keys.get(user_pk)
+        if keys is not None:
+            keys.discard(entry_key)
+            if not keys:
+                del self._user_keys[user_pk]
+
+    def _stamp(self, shared, user_pk):
+        """Return the stamp of a user in the shared tier, None if unset."""
+        return shared.get(self._shared_key(('stamp', user_pk)))
+
+    def _drop(self, entry_key):
+        with self._lock:
+            entry = self._entries.pop(entry_key, None)
+            if entry is not None:
+                self._discard_user_key(entry[1], entry_key)
+
+    def _get(self, entry_key):
+        now = time.monotonic()
+        shared = self._shared()
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[entry_key]
+                self._discard_user_key(entry[1], entry_key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(entry_key)
+
+        # the user may have been invalidated by another worker since
+        if entry is not None and shared is not None and self._stamp(shared, entry[1]) != entry[4]:
+            self._drop(entry_key)
+            entry = None
+        if entry is not None:
+            self.hits += 1
+            return self._build(entry)
+
+        if shared is not None:
+            values = shared.get(self._shared_key(entry_key))
+            if values is not None and self._stamp(shared, values[0]) == values[3]:
+                self.shared_hits += 1
+                entry = (now + self.ttl,) + tuple(values)
+                self._store(entry_key, entry)
+                return self._build(entry)
+
+        self.misses += 1
+        return None
+
+    def get(self, key):
+        """Return the cached token (with user) for key, or None."""
+        return self._get(('token', key))
+
+    def stamp(self, user_pk):
+        """Return the stamp of a user, to read before loading the user.
+
+        An entry cached with a stamp read after the load would hide an
+        invalidation made while loading; without a shared tier it is None.
+        """
+        shared = self._shared()
+        return self._stamp(shared, user_pk) if shared is not None else None
+
+    def set(self, token, stamp=None):
+        """Cache a token whose user was loaded after reading stamp."""
+        user = token.user
+        shared = self._shared()
+        values = (
+            user.pk,
+            tuple(getattr(token, name) for name in _field_names(Token)),
+            tuple(getattr(user, name) for name in _field_names(type(user))),
+            stamp,
+        )
+        entry_key = ('token', token.key)
+        self._store(entry_key, (time.monotonic() + self.ttl,) + values)
+
+        if shared is not None:
+            shared.set_many({
+                self._shared_key(entry_key): values,
+                # the token of a user, to invalidate it by user
+                self._shared_key(('index', user.pk)): token.key,
+            }, timeout=self.ttl)
+
+    def get_user(self, user_pk):
+        """Return the cached user for a signed access token, or None."""
+        return self._get(('user', user_pk))
+
+    def set_user(self, user, stamp=None):
+        """Cache a user on its own, for signed access tokens."""
+        entry_key = ('user', user.pk)
+        shared = self._shared()
+        values = (
+            user.pk,
+            None,
+            tuple(getattr(user, name) for name in _field_names(type(user))),
+            stamp,
+        )
+        self._store(entry_key, (time.monotonic() + self.ttl,) + values)
+
+        if shared is not None:
+            shared.set(self._shared_key(entry_key), values, timeout=self.ttl)
+
+    def invalidate(self, key):
+        """Drop a single token key."""
+        entry_key = ('token', key)
+        self._drop(entry_key)
+
+        shared = self._shared()
+        if shared is not None:
+            shared.delete(self._shared_key(entry_key))
+
+    def invalidate_user(self, user_pk):
+        """Drop every entry belonging to a user, in every worker."""
+        with self._lock:
+            for entry_key in self._user_keys.pop(user_pk, ()):
+                self._entries.pop(entry_key, None)
+
+        shared = self._shared()
+        if shared is not None:
+            index_key = self._shared_key(('index', user_pk))
+            token_key = shared.get(index_key)
+            keys = [index_key, self._shared_key(('user', user_pk))]
+            if token_key is not None:
+                keys.append(self._shared_key(('token', token_key)))
+            shared.delete_many(keys)
+            # kept without a timeout, the entries of other workers cached
+            # with the previous stamp no longer match it
+            shared.set(self._shared_key(('stamp', user_pk)), uuid.uuid4().hex, timeout=None)
+
+    def clear(self):
+        """Drop every locally cached entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+            self.hits = self.shared_hits = self.misses = 0
+
+    def stats(self):
+        """Return the hit/miss counters and current size."""
+        return {
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+        }
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    """Return the process wide token cache."""
+    global _token_cache
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                _token_cache = TokenCache.from_settings()
+    return _token_cache
+
+
+def metrics_gauges():
+    """Report the token cache counters on /metrics."""
+    stats = get_token_cache().stats()
+    return [
+        ('app_token_cache_%s' % name, (), value)
+        for name, value in stats.items()
+    ]
+
+
+def get_token_lifetime():
+    """Return the (TTL, renew interval) seconds of database tokens."""
+    config = getattr(settings, 'USER_AUTH_TOKENS', {})
+    return config.get('TTL', 0), config.get('RENEW_INTERVAL', 3600)
+
+
+def token_expiry_cutoff(now=None):
+    """Tokens last renewed before this have expired, None if none expire."""
+    ttl, _ = get_token_lifetime()
+    if not ttl:
+        return None
+    return (now or timezone.now()) - timedelta(seconds=ttl)
+
+
+def renew_token(token, now=None):
+    """Restart the lifetime of a token in use, return whether it was renewed.
+
+    Token.created holds the last renewal, it is written at most once per
+    renew interval so that authenticating stays free of writes.
+    """
+    _, interval = get_token_lifetime()
+    now = now or timezone.now()
+    if token.created > now - timedelta(seconds=interval):
+        return False
+    # update() sends no post_save, the caller refreshes the cached entry
+    Token.objects.filter(pk=token.pk).update(created=now)
+    token.created = now
+    return True
+
+
+def issue_token(user):
+    """Return the database token of a user, replacing an expired one."""
+    token, created = Token.objects.get_or_create(user=user)
+    if created:
+        return token
+    cutoff = token_expiry_cutoff()
+    if cutoff is not None and token.created <= cutoff:
+        Token.objects.filter(pk=token.pk).delete()
+        token, _ = Token.objects.get_or_create(user=user)
+    elif cutoff is not None and renew_token(token):
+        get_token_cache().invalidate(token.key)
+    return token
+
+
+class CachedTokenAuthentication(authentication.TokenAuthentication):
+    """Token authentication that resolves token -> user from a cache."""
+
+    # the keys made by Token.generate_key()
+    key_pattern = re.compile(r'[0-9a-f]{40}')
+
+    def authenticate_credentials(self, key):
+        if not self.key_pattern.fullmatch(key):
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        cache = get_token_cache()
+        token = cache.get(key)
+        cached = token is not None
+        if not cached:
+            stamp = None
+            if cache.shared_cache:
+                user_pk = Token.objects.filter(key=key).values_list('user_id', flat=True).first()
+                stamp = cache.stamp(user_pk)
+            user, token = super().authenticate_credentials(key)
+        elif not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        # cached entries are checked too, they outlive the expiry by up to
+        # the cache TTL otherwise
+        now = timezone.now()
+        cutoff = token_expiry_cutoff(now)
+        if cutoff is not None:
+            if token.created <= cutoff:
+                cache.invalidate(key)
+                raise exceptions.AuthenticationFailed(_('Token has expired.'))
+            if renew_token(token, now) and cached:
+                # the next request loads the renewed token, the stamp of
+                # the cached entry is no longer at hand to cache it again
+                cache.invalidate(key)
+
+        if not cached:
+            cache.set(token, stamp)
+        return (token.user, token)
+
+
+class SignedTokenAuthentication(authentication.TokenAuthentication):
+    """Authenticate 'Bearer' signed access tokens without the database.
+
+    The signature, expiry and revocation are checked in memory and the user
+    comes from the token cache, a query is only made on a cache miss or when
+    the revocation filter matches.
+    """
+
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        if not tokens.is_enabled():
+            return None
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        access = tokens.verify(key)
+        if tokens.get_revocation_filter().is_revoked(access):
+            raise exceptions.AuthenticationFailed(_('Token has been revoked.'))
+
+        cache = get_token_cache()
+        user = cache.get_user(access.user_id)
+        if user is None:
+            stamp = cache.stamp(access.user_id)
+            try:
+                user = get_user_model().objects.get(pk=access.user_id)
+            except get_user_model().DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+            cache.set_user(user, stamp)
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (user, access)
@@ -0,0 +1,144 @@
+"""
+Django command to compare WSGI and ASGI throughput with slow clients
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import (
+    setup_test_environment,
+    teardown_test_environment,
+)
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+
+
+class Command(BaseCommand):
+    help = 'Measure /api/user/me/ throughput under WSGI and ASGI.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--clients', type=int, default=500)
+        parser.add_argument(
+            '--threads', type=int, default=8,
+            help='Threads of the WSGI server.',
+        )
+        parser.add_argument(
+            '--delay', type=float, default=0.05,
+            help='Seconds each client takes to receive a response.',
+        )
+        parser.add_argument('--server', choices=['wsgi', 'asgi'])
+
+    def handle(self, *args, **options):
+        if options['server'] is None:
+            return self.compare(options)
+
+        setup_test_environment()
+        user = get_user_model().objects.create_user(
+            email='bench-asgi@example.com',
+            password='benchpass123',
+        )
+        try:
+            token = Token.objects.create(user=user)
+            run = self.run_wsgi if options['server'] == 'wsgi' else self.run_asgi
+            elapsed = run(token.key, options)
+        finally:
+            user.delete()
+            teardown_test_environment()
+        self.stdout.write(json.dumps({
+            'server': options['server'],
+            'requests_per_sec': options['requests'] / elapsed,
+        }))
+
+    def compare(self, options):
+        """Run each server in its own process, the url conf differs"""
+        for server in ('wsgi', 'asgi'):
+            env = dict(os.environ, USER_API_ASYNC='1' if server == 'asgi' else '0')
+            output = subprocess.run(
+                [
+                    sys.executable, sys.argv[0], 'bench_asgi',
+                    '--server', server,
+                    '--requests', str(options['requests']),
+                    '--clients', str(options['clients']),
+                    '--threads', str(options['threads']),
+                    '--delay', str(options['delay']),
+                ],
+                env=env, check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            self.stdout.write(
+                f'{server}: {result["requests_per_sec"]:.0f} requests/sec'
+            )
+
+    def run_wsgi(self, key, options):
+        """Each slow client holds a server thread until it has the response"""
+        handler = WSGIHandler()
+        environ = RequestFactory()._base_environ(
+            PATH_INFO=reverse('user:me'),
+            REQUEST_METHOD='GET',
+            HTTP_AUTHORIZATION='Token ' + key,
+        )
+
+        def request(_):
+            response = handler(dict(environ), lambda status, headers: None)
+            b''.join(response)
+            response.close()
+            # writing to the slow client blocks this thread
+            time.sleep(options['delay'])
+
+        with ThreadPoolExecutor(max_workers=options['threads']) as threads:
+            start = time.perf_counter()
+            list(threads.map(request, range(options['requests'])))
+            return time.perf_counter() - start
+
+    def run_asgi(self, key, options):
+        """Slow clients only hold a coroutine while the response is sent"""
+        handler = ASGIHandler()
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': reverse('user:me'),
+            'query_string': b'',
+            'server': ('testserver', 80),
+            'client': ('127.0.0.1', 0),
+            'headers': [
+                (b'host', b'testserver'),
+                (b'authorization', b'Token ' + key.encode()),
+            ],
+        }
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.body':
+                # writing to the slow client only suspends this coroutine
+                await asyncio.sleep(options['delay'])
+
+        async def client(slots):
+            async with slots:
+                await handler(dict(scope), receive, send)
+
+        async def main():
+            slots = asyncio.Semaphore(options['clients'])
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                client(slots) for _ in range(options['requests'])
+            ))
+            return time.perf_counter() - start
+
+        return asyncio.run(main())
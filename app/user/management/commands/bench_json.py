@@ -0,0 +1,66 @@
+"""
+Django command to benchmark JSON rendering and parsing of user payloads
+"""
+
+import io
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.benchmark import timed
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer
+from user.serializers import UserListSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare the stdlib and orjson JSON renderer/parser on user payloads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000)
+        parser.add_argument('--list-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        size = options['list_size']
+        # unsaved users, only the serialization is measured
+        users = [
+            get_user_model()(
+                id=index, email=f'user{index}@example.com', name=f'User {index}',
+                is_active=True, is_staff=False,
+            )
+            for index in range(1, size + 1)
+        ]
+        single = UserListSerializer(users[0]).data
+        bulk = UserListSerializer(users, many=True).data
+        # a bulk create request body
+        bulk_body = JSONRenderer().render([
+            {'email': user.email, 'password': 'benchpass123', 'name': user.name}
+            for user in users
+        ])
+
+        # label, users per call, calls, call
+        cases = (
+            ('render user', 1, iterations,
+             lambda renderer, parser: renderer.render(single)),
+            ('render list', size, max(iterations // 100, 1),
+             lambda renderer, parser: renderer.render(bulk)),
+            ('parse bulk body', size, max(iterations // 100, 1),
+             lambda renderer, parser: parser.parse(io.BytesIO(bulk_body))),
+        )
+        backends = (
+            ('json', JSONRenderer(), JSONParser()),
+            ('orjson', FastJSONRenderer(), FastJSONParser()),
+        )
+        for label, items, runs, case in cases:
+            results = {}
+            for name, renderer, parser in backends:
+                elapsed = timed(lambda: case(renderer, parser), runs)
+                results[name] = elapsed
+                self.stdout.write(
+                    f'{label} ({name}): {runs * items / elapsed:.0f} users/sec'
+                )
+            self.stdout.write(f'{label}: {results["json"] / results["orjson"]:.1f}x faster')
@@ -0,0 +1,66 @@
+"""
+Django command to benchmark the overhead of the login throttle
+"""
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.benchmark import timed
+from core.parsers import FastJSONParser
+from user import throttling
+from user.throttling import LoginRateThrottle, SlidingWindowStore
+
+
+class Command(BaseCommand):
+    help = 'Measure the microseconds a login throttle check adds to a request.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100000)
+        parser.add_argument('--clients', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        clients = options['clients']
+        factory = APIRequestFactory()
+        # one parsed login request per simulated client
+        requests = [
+            Request(factory.post(
+                '/api/user/token/',
+                {'email': f'user{index}@example.com', 'password': 'benchpass123'},
+                format='json',
+                REMOTE_ADDR='10.%d.%d.%d' % (index >> 16 & 255, index >> 8 & 255, index & 255),
+            ), parsers=[FastJSONParser()])
+            for index in range(clients)
+        ]
+        for request in requests:
+            request.data
+
+        # nothing is rejected, every check counts an attempt
+        rates = {'login': {'ip': '%d/min' % (iterations + 1), 'email': '%d/min' % (iterations + 1)}}
+        cases = (
+            ('memory', None),
+            ('shared locmem cache', 'default'),
+        )
+        for label, shared_cache in cases:
+            config = {'RATES': rates, 'MAX_KEYS': 100000, 'SHARED_CACHE': shared_cache}
+            with override_settings(
+                USER_THROTTLE=config,
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            ):
+                throttling._store = SlidingWindowStore.from_settings()
+                throttle = LoginRateThrottle()
+                for name, pool in (('one client', requests[:1]), (f'{clients} clients', requests)):
+                    count = len(pool)
+                    calls = iter(range(iterations))
+
+                    def check():
+                        throttle.allow_request(pool[next(calls) % count], None)
+
+                    elapsed = timed(check, iterations)
+                    self.stdout.write(f'{label}, {name}: {elapsed / iterations * 1e6:.1f} us/check')
+                caches['default'].clear()
+        throttling._store = None
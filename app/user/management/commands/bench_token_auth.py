@@ -0,0 +1,55 @@
+"""
+Django command to benchmark token authentication on the /me/ endpoint
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.benchmark import bench_environment, timed
+from user.authentication import get_token_cache
+
+
+class Command(BaseCommand):
+    help = 'Measure queries and time per request on /api/user/me/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        iterations = options['requests']
+        url = reverse('user:me')
+        with bench_environment():
+            user = get_user_model().objects.create_user(
+                email='bench@example.com',
+                password='benchpass123',
+            )
+            token = Token.objects.create(user=user)
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+            cache = get_token_cache()
+
+            for label, warm in (('cold', False), ('warm', True)):
+                cache.clear()
+                if warm:
+                    client.get(url)
+
+                def request():
+                    # a cold run drops the cache before every request
+                    if not warm:
+                        cache.clear()
+                    client.get(url)
+
+                with CaptureQueriesContext(connection) as queries:
+                    elapsed = timed(request, iterations)
+                self.stdout.write(
+                    f'{label}: {len(queries) / iterations:.2f} queries/request, '
+                    f'{iterations / elapsed:.0f} requests/sec'
+                )
+
+            self.stdout.write(str(cache.stats()))
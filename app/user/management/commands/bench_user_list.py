@@ -0,0 +1,80 @@
+"""
+Django command to benchmark the keyset paginated user list
+"""
+
+from base64 import b64encode
+from urllib import parse
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.benchmark import bench_environment, timed
+
+
+def cursor_for(position):
+    """Return the cursor DRF would put in a link to the page after id=position"""
+    querystring = parse.urlencode({'p': position})
+    return b64encode(querystring.encode('ascii')).decode('ascii')
+
+
+class Command(BaseCommand):
+    help = 'Compare keyset and offset page fetches over a seeded user table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200000)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        users, page_size = options['users'], options['page_size']
+        user_model = get_user_model()
+        with bench_environment():
+            self.stdout.write(f'Seeding {users} users...')
+            # one shared hash, seeding is not what is being measured
+            password = make_password(None)
+            user_model.objects.bulk_create(
+                (
+                    user_model(email=f'bench{i}@example.com', password=password)
+                    for i in range(users)
+                ),
+                batch_size=5000,
+            )
+            admin = user_model.objects.create_superuser(
+                email='bench-admin@example.com',
+                password='benchpass123',
+            )
+            client = APIClient()
+            client.force_authenticate(user=admin)
+            first_id = user_model.objects.order_by('id').values_list('id', flat=True)[0]
+
+            url = reverse('user:list')
+            repeat = options['repeat']
+            for depth in (0, users // 2, users - page_size):
+                params = {'page_size': page_size}
+                position = first_id + depth - 1
+                if depth:
+                    params['cursor'] = cursor_for(position)
+                api = timed(lambda: client.get(url, params), repeat)
+                keyset = timed(
+                    lambda: list(
+                        user_model.objects.filter(id__gt=position)
+                        .order_by('id')[:page_size]
+                    ),
+                    repeat,
+                )
+                offset = timed(
+                    lambda: (
+                        user_model.objects.count(),
+                        list(user_model.objects.order_by('id')[depth:depth + page_size]),
+                    ),
+                    repeat,
+                )
+                self.stdout.write(
+                    f'row {depth}: API page {api * 1000 / repeat:.2f} ms, '
+                    f'keyset query {keyset * 1000 / repeat:.2f} ms, '
+                    f'offset + COUNT(*) {offset * 1000 / repeat:.2f} ms'
+                )
@@ -0,0 +1,61 @@
+"""
+Django command to benchmark the compiled user representations
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from rest_framework import serializers
+
+from core.benchmark import timed
+from user.serializers import UserSerializer, UserListSerializer
+
+
+class GenericUserSerializer(serializers.ModelSerializer):
+    class Meta(UserSerializer.Meta):
+        pass
+
+
+class GenericUserListSerializer(serializers.ModelSerializer):
+    class Meta(UserListSerializer.Meta):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Compare representations/sec of the compiled and generic user serializers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=10000)
+        parser.add_argument('--list-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        size = options['list_size']
+        # unsaved users, only the representation is measured
+        users = [
+            get_user_model()(
+                id=index, email=f'user{index}@example.com', name=f'User {index}',
+                is_active=True, is_staff=False,
+            )
+            for index in range(1, size + 1)
+        ]
+        list_runs = max(iterations // size, 1)
+
+        # label, users per call, calls, (generic, compiled) calls
+        cases = (
+            ('single (/me/)', 1, iterations, (
+                lambda: GenericUserSerializer(users[0]).data,
+                lambda: UserSerializer(users[0]).data,
+            )),
+            ('bulk (list)', size, list_runs, (
+                lambda: GenericUserListSerializer(users, many=True).data,
+                lambda: UserListSerializer(users, many=True).data,
+            )),
+        )
+        for label, items, runs, funcs in cases:
+            elapsed = [timed(func, runs) for func in funcs]
+            for name, seconds in zip(('generic', 'compiled'), elapsed):
+                self.stdout.write(
+                    f'{label} {name}: {runs * items / seconds:.0f} representations/sec'
+                )
+            self.stdout.write(f'{label}: {elapsed[0] / elapsed[1]:.1f}x faster')
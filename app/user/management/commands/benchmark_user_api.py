@@ -0,0 +1,223 @@
+"""
+Django command to load test the user API against a throwaway database
+"""
+
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import hashing
+from core.benchmark import QueryCounter, summarize
+
+SCENARIOS = ['create', 'token', 'me']
+PASSWORD = 'benchpass123'
+
+
+def git_commit():
+    """Return the commit being benchmarked, if this is a git checkout."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True, check=True, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive create/, token/ and me/ at a given concurrency against a '
+        'throwaway test database and report throughput, latency, queries '
+        'per request and password hashing CPU time.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario', action='append', choices=SCENARIOS,
+            help='Scenario to run, repeat for several. Defaults to all.',
+        )
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Requests per scenario, split across the threads.',
+        )
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', help='JSON results of a previous run to compare with.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        if connection.vendor == 'sqlite':
+            # threads only share a file database, not an in-memory one
+            handle, path = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(handle)
+            connection.settings_dict['TEST']['NAME'] = path
+        old_config = setup_databases(verbosity=0, interactive=False)
+        # every request comes from one IP, the throttle would reject most
+        no_throttle = override_settings(USER_THROTTLE={**settings.USER_THROTTLE, 'RATES': {}})
+        no_throttle.enable()
+        try:
+            self.seed(options['users'])
+            results = {
+                scenario: self.run_scenario(scenario, options)
+                for scenario in options['scenario'] or SCENARIOS
+            }
+        finally:
+            no_throttle.disable()
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'hashing_workers': hashing.get_pool().workers,
+            'scenarios': results,
+        }
+        self.print_report(report)
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.print_comparison(json.load(f), report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+    def seed(self, users):
+        """Create the users logging in and reading their profile."""
+        encoded = make_password(PASSWORD)
+        user_model = get_user_model()
+        user_model.objects.bulk_create(
+            user_model(email=f'bench{i}@example.com', name=f'Bench {i}', password=encoded)
+            for i in range(users)
+        )
+        self.users = list(user_model.objects.order_by('id'))
+        self.tokens = [Token.objects.create(user=user).key for user in self.users]
+
+    def make_request(self, scenario, client, n):
+        """Send request number n of a scenario, return the status code."""
+        if scenario == 'create':
+            return client.post(reverse('user:create'), {
+                'email': f'new{n}@example.com',
+                'password': PASSWORD,
+                'name': 'New User',
+            }).status_code
+        user = self.users[n % len(self.users)]
+        if scenario == 'token':
+            return client.post(reverse('user:token'), {
+                'email': user.email,
+                'password': PASSWORD,
+            }).status_code
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.tokens[n % len(self.tokens)])
+        return client.get(reverse('user:me')).status_code
+
+    def run_scenario(self, scenario, options):
+        concurrency = options['concurrency']
+        total = options['requests']
+        latencies = []
+        errors = []
+        counter = QueryCounter()
+        lock = threading.Lock()
+        # requests numbered so that create/ never reuses an email
+        numbers = iter(range(options['warmup'] + total))
+        start_line = threading.Barrier(concurrency + 1)
+
+        def worker():
+            client = APIClient()
+            with connection.execute_wrapper(counter):
+                start_line.wait()
+                while True:
+                    with lock:
+                        n = next(numbers, None)
+                    if n is None:
+                        break
+                    start = time.perf_counter()
+                    status_code = self.make_request(scenario, client, n)
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+                        if status_code >= 400:
+                            errors.append(status_code)
+            connection.close()
+
+        # warm up on this thread so connections, caches and pools are ready
+        client = APIClient()
+        for _ in range(options['warmup']):
+            self.make_request(scenario, client, next(numbers))
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        hash_stats = hashing.get_pool().get_stats()
+        cpu_start = time.process_time()
+        start_line.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        hash_after = hashing.get_pool().get_stats()
+
+        return {
+            'requests': len(latencies),
+            'errors': len(errors),
+            'seconds': elapsed,
+            'requests_per_sec': len(latencies) / elapsed,
+            **summarize(latencies),
+            'queries_per_request': counter.count / len(latencies),
+            'process_cpu_ms_per_request': (time.process_time() - cpu_start) * 1000 / len(latencies),
+            'hashes_per_request': (hash_after['hashes'] - hash_stats['hashes']) / len(latencies),
+            'hash_cpu_ms_per_request': (
+                (hash_after['cpu_seconds'] - hash_stats['cpu_seconds']) * 1000 / len(latencies)
+            ),
+        }
+
+    def print_report(self, report):
+        self.stdout.write(
+            f'commit {report["commit"]}, {report["database"]}, '
+            f'concurrency {report["concurrency"]}'
+        )
+        for scenario, result in report['scenarios'].items():
+            self.stdout.write(
+                f'{scenario:>7}: {result["requests_per_sec"]:8.1f} req/s  '
+                f'p50 {result["p50_ms"]:7.1f} ms  p95 {result["p95_ms"]:7.1f} ms  '
+                f'p99 {result["p99_ms"]:7.1f} ms  '
+                f'{result["queries_per_request"]:.2f} queries/req  '
+                f'{result["hash_cpu_ms_per_request"]:.1f} ms hashing/req  '
+                f'{result["errors"]} errors'
+            )
+
+    def print_comparison(self, baseline, report):
+        self.stdout.write(f'compared with commit {baseline.get("commit")}:')
+        for scenario, result in report['scenarios'].items():
+            before = baseline['scenarios'].get(scenario)
+            if before is None:
+                continue
+            changes = '  '.join(
+                f'{key} {(result[key] - before[key]) / before[key] * 100:+.1f}%'
+                for key in ('requests_per_sec', 'p95_ms', 'queries_per_request')
+                if before.get(key)
+            )
+            self.stdout.write(f'{scenario:>7}: {changes}')
@@ -0,0 +1,72 @@
+"""
+Django command to delete expired auth tokens in small batches
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from core.models import RevokedToken
+from user.authentication import token_expiry_cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete the database tokens unused for longer than their lifetime and '
+        'the revocations of expired signed tokens, a batch at a time.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--pause', type=float, default=0.1,
+            help='Seconds between batches, leaving the database to the API.',
+        )
+        parser.add_argument(
+            '--continuous', action='store_true',
+            help='Keep purging every --interval seconds.',
+        )
+        parser.add_argument('--interval', type=float, default=300)
+
+    def purge(self, label, queryset, order_by, options):
+        """Delete the rows of queryset in batches, return how many were deleted"""
+        total = 0
+        start = time.perf_counter()
+        while True:
+            # every delete is its own short transaction locking one batch
+            pks = list(queryset.order_by(order_by).values_list('pk', flat=True)[:options['batch_size']])
+            if not pks:
+                break
+            # the filter is applied again, a token renewed since is kept
+            deleted, _ = queryset.filter(pk__in=pks).delete()
+            total += deleted
+            self.stdout.write(
+                f'{label}: deleted {total} ({total / (time.perf_counter() - start):.0f} rows/sec)'
+            )
+            if len(pks) < options['batch_size']:
+                break
+            time.sleep(options['pause'])
+        return total
+
+    def purge_once(self, options):
+        now = timezone.now()
+        tokens = 0
+        cutoff = token_expiry_cutoff(now)
+        if cutoff is not None:
+            tokens = self.purge('tokens', Token.objects.filter(created__lte=cutoff), 'created', options)
+        revocations = self.purge(
+            'revocations', RevokedToken.objects.filter(expires_at__lte=now), 'expires_at', options,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Purged {tokens} expired tokens and {revocations} expired revocations.'
+        ))
+
+    def handle(self, *args, **options):
+        while True:
+            self.purge_once(options)
+            if not options['continuous']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,16 @@
+"""
+Pagination for the user API.
+"""
+
+from rest_framework import pagination
+
+
+class UserCursorPagination(pagination.CursorPagination):
+    """Keyset pagination on id, page N costs the same as page 1"""
+
+    # id is unique, so the cursor is a plain 'WHERE id > position'
+    # with no OFFSET and no COUNT(*)
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
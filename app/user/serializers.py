@@ -2,19 +2,117 @@
 Serializers for the user API view.
 """
 
+import threading
+from operator import attrgetter
+
+from django.conf import settings
 from django.contrib.auth import (
     get_user_model,
     authenticate,
 )
+from django.db import IntegrityError, transaction
 from django.utils.translation import gettext as _
 
 # Serializer is a way to convert to and from Python object
 # It takes a JSON input and validate the input as per our validation rule, then convert it to either a Python object
 # or a model in our database
 from rest_framework import serializers
+from rest_framework.relations import PKOnlyObject
+
+from core import hashing, metrics
+
+
+class TimedSerializerMixin:
+    """Add validation and representation time to the request timings"""
+
+    # the time includes queries and hashing done by validators
+
+    def run_validation(self, *args, **kwargs):
+        with metrics.timing('serializer'):
+            return super().run_validation(*args, **kwargs)
+
+    def to_representation(self, *args, **kwargs):
+        with metrics.timing('serializer'):
+            return super().to_representation(*args, **kwargs)
+
+
+# conversions matching to_representation of the plain model field serializers
+# for the values a model instance holds
+FAST_CONVERSIONS = {
+    serializers.CharField: str,
+    serializers.EmailField: str,
+    serializers.IntegerField: int,
+    serializers.BooleanField: bool,
+    serializers.ReadOnlyField: None,
+}
+
+
+class CompiledRepresentation:
+    """Build the representation of a model instance from a fixed field plan"""
+
+    __slots__ = ('model', 'plan')
 
+    def __init__(self, serializer):
+        self.model = serializer.Meta.model
+        columns = {field.attname for field in self.model._meta.concrete_fields}
+        # (output name, attribute getter, conversion, generic field or None)
+        self.plan = []
+        for field in serializer._readable_fields:
+            if type(field) in FAST_CONVERSIONS and field.source in columns:
+                self.plan.append((
+                    field.field_name, attrgetter(field.source),
+                    FAST_CONVERSIONS[type(field)], None,
+                ))
+            else:
+                self.plan.append((field.field_name, None, None, field))
 
-class UserSerializer(serializers.ModelSerializer):
+    def __call__(self, instance):
+        ret = {}
+        for name, getter, convert, field in self.plan:
+            if field is None:
+                value = getter(instance)
+                if value is None or convert is None:
+                    ret[name] = value
+                else:
+                    ret[name] = convert(value)
+                continue
+
+            # same steps as Serializer.to_representation
+            attribute = field.get_attribute(instance)
+            check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+            ret[name] = None if check_for_none is None else field.to_representation(attribute)
+
+        return ret
+
+
+class CompiledRepresentationMixin:
+    """Represent model instances with a field plan resolved once per class"""
+
+    # serializer class -> CompiledRepresentation
+    _compiled = {}
+    _compiled_lock = threading.Lock()
+
+    @classmethod
+    def get_compiled_representation(cls):
+        compiled = cls._compiled.get(cls)
+        if compiled is None:
+            with cls._compiled_lock:
+                compiled = cls._compiled.get(cls)
+                if compiled is None:
+                    # fields are introspected on a throwaway instance, the
+                    # serializers handling requests never build them to read
+                    compiled = cls._compiled[cls] = CompiledRepresentation(cls())
+        return compiled
+
+    def to_representation(self, instance):
+        compiled = self.get_compiled_representation()
+        # validated data dicts and other objects take the generic path
+        if not isinstance(instance, compiled.model):
+            return super().to_representation(instance)
+        return compiled(instance)
+
+
+class UserSerializer(TimedSerializerMixin, CompiledRepresentationMixin, serializers.ModelSerializer):
     """Serializer for the user object"""
 
     class Meta:
@@ -23,7 +121,23 @@ class UserSerializer(serializers.ModelSerializer):
         # a list of fields we want available in the serializer
         fields = ['email', 'password', 'name']
         # allows us to provide a dictionary of additional meta data to the fields
-        extra_kwargs = {'password': {'write_only': True, 'min_length': 5}}
+        # the email is checked by validate_email instead of an exact match UniqueValidator
+        extra_kwargs = {
+            'password': {'write_only': True, 'min_length': 5},
+            'email': {'validators': []},
+        }
+
+    def validate_email(self, value):
+        """Reject an email used by another user, ignoring case"""
+        # LOWER(email) = value is answered by the unique functional index
+        others = get_user_model().objects.filter(email__lower=value.lower())
+        if self.instance is not None:
+            others = others.exclude(pk=self.instance.pk)
+        if others.exists():
+            msg = _('user with this email already exists.')
+            raise serializers.ValidationError(msg, code='unique')
+
+        return value
 
     def create(self, validated_data):
         """Create and return a user with encrypted password"""
@@ -36,19 +150,153 @@ class UserSerializer(serializers.ModelSerializer):
         # .pop() will retrieve the password then remove it from the validated_data dictionary
         # if a password is not provided, it will default to None
         password = validated_data.pop('password', None)
-        # calls the update() method in the base ModelSerializer class
-        # must remove the password from the validated_data dictionary first, because password is not a field in the user model
-        # when you call update() it will update an instance of the user model, all fields must match
-        user = super().update(instance, validated_data)
-        # if there is a password, set it here
+        # the password must be hashed before it is stored, so it is removed from validated_data
+        # and set here, the save in update() then writes it with the other changed columns
         if password:
-            user.set_password(password)
-            user.save()
+            instance.set_password(password)
+        # calls the update() method in the base ModelSerializer class
+        return super().update(instance, validated_data)
+
+
+class UserListSerializer(TimedSerializerMixin, CompiledRepresentationMixin, serializers.ModelSerializer):
+    """Serializer for users in the staff user list"""
+
+    class Meta:
+        model = get_user_model()
+        fields = ['id', 'email', 'name', 'is_active', 'is_staff']
+        read_only_fields = fields
+
+
+class BulkUserListSerializer(serializers.ListSerializer):
+    """Validate and create many users, reporting errors per item"""
+
+    def get_max_items(self):
+        """Return the users accepted by one request"""
+        max_items = settings.USER_BULK_CREATE_MAX_ITEMS
+        timeout = settings.SERVER['TIMEOUT']
+        if max_items or not timeout:
+            return max_items or settings.USER_BULK_CREATE_DEFAULT_MAX_ITEMS
+        # the rest of the timeout is left to validating and inserting
+        return max(hashing.batch_capacity(timeout / 2), 1)
+
+    def to_internal_value(self, data):
+        """Validate every item, keeping the valid ones"""
+        if not isinstance(data, list):
+            raise serializers.ValidationError(
+                _('Expected a list of users.'), code='not_a_list',
+            )
+        if not data:
+            raise serializers.ValidationError(
+                _('This list may not be empty.'), code='empty',
+            )
+        max_items = self.get_max_items()
+        if len(data) > max_items:
+            msg = _('Ensure this list has no more than %d users.') % max_items
+            raise serializers.ValidationError(msg, code='max_length')
+
+        # item_errors lines up with the payload, None for valid items
+        self.item_errors = [None] * len(data)
+        valid = []
+        for index, item in enumerate(data):
+            try:
+                attrs = self.child.run_validation(item)
+            except serializers.ValidationError as exc:
+                self.item_errors[index] = exc.detail
+                continue
+            attrs['email'] = get_user_model().objects.normalize_email(
+                attrs['email']
+            )
+            valid.append((index, attrs))
+
+        # one LOWER(email) IN query checks every email against the database
+        taken = {
+            email.lower() for email in get_user_model().objects.filter(
+                email__lower__in=[attrs['email'].lower() for index, attrs in valid],
+            ).values_list('email', flat=True)
+        }
+        msg = _('user with this email already exists.')
+        # payload index of each returned item, used to build the results
+        self.valid_indexes = []
+        unique = []
+        for index, attrs in valid:
+            if attrs['email'].lower() in taken:
+                self.item_errors[index] = {'email': [msg]}
+                continue
+            # an email repeated in the payload is only created once
+            taken.add(attrs['email'].lower())
+            self.valid_indexes.append(index)
+            unique.append(attrs)
 
-        return user
+        return unique
 
+    def create(self, validated_data):
+        """Hash the passwords in parallel then insert the users in batches"""
+        passwords = hashing.make_passwords(
+            [attrs.pop('password') for attrs in validated_data]
+        )
+        users = [
+            get_user_model()(password=password, **attrs)
+            for attrs, password in zip(validated_data, passwords)
+        ]
+        try:
+            # every batch in one transaction, or a savepoint of the caller's
+            with transaction.atomic():
+                get_user_model().objects.bulk_create(
+                    users, batch_size=settings.USER_BULK_CREATE_BATCH_SIZE,
+                )
+        except IntegrityError:
+            # an email was signed up since it was checked, only inserting
+            # the users one by one tells which
+            return self.create_each(users)
+
+        return users
+
+    def create_each(self, users):
+        """Insert the users one at a time, reporting the emails taken"""
+        created = []
+        valid_indexes = []
+        for index, user in zip(self.valid_indexes, users):
+            # the batches inserted before the failure were rolled back
+            user.pk = None
+            user._state.adding = True
+            try:
+                with transaction.atomic():
+                    user.save(force_insert=True)
+            except IntegrityError:
+                self.item_errors[index] = {'email': [_('user with this email already exists.')]}
+                continue
+            created.append(user)
+            valid_indexes.append(index)
+        self.valid_indexes = valid_indexes
+        return created
+
+    def results(self):
+        """Return the outcome of every item, in payload order"""
+        results = [
+            {'status': 'error', 'errors': errors} if errors else None
+            for errors in self.item_errors
+        ]
+        for index, user in zip(self.valid_indexes, self.instance):
+            results[index] = {
+                'status': 'created',
+                'data': self.child.to_representation(user),
+            }
+
+        return results
 
-class AuthTokenSerializer(serializers.Serializer):
+
+class BulkUserSerializer(UserSerializer):
+    """Serializer for one user in a bulk create payload"""
+
+    class Meta(UserSerializer.Meta):
+        list_serializer_class = BulkUserListSerializer
+
+    def validate_email(self, value):
+        """Leave uniqueness to the list, it checks every email in one query"""
+        return value
+
+
+class AuthTokenSerializer(TimedSerializerMixin, serializers.Serializer):
     # We do not need a ModelSerializer here just the generic one
     # because we are not validating based on model validation rules
     """Serializer for the user auth token"""
@@ -66,11 +314,13 @@ class AuthTokenSerializer(serializers.Serializer):
         password = attrs.get('password')
         # authenticate with the given email and password, if successful, this will return a user object
         # note that the 'request' field is required for unclear reason, just equate it to the request body
-        user = authenticate(
-            request=self.context.get('request'),
-            username=email,
-            password=password,
-        )
+        # an outdated password hash is upgraded after the response, not during it
+        with hashing.deferred_rehash():
+            user = authenticate(
+                request=self.context.get('request'),
+                username=email,
+                password=password,
+            )
         # if authentication fails, the user will not be set and therefore, raise the validation error with a custom message
         if not user:
             msg = _('Unable to authenticate with provided credentials.')
@@ -0,0 +1,43 @@
+"""
+Signal handlers keeping the user API caches consistent with the database.
+"""
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from user import tokens
+from user.authentication import get_token_cache
+
+
+@receiver([post_save, post_delete], sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    """Drop a token from the cache when it is rotated or deleted."""
+    cache = get_token_cache()
+    cache.invalidate(instance.key)
+    # the other workers learn of it through the stamp of the user
+    cache.invalidate_user(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def invalidate_user_tokens(sender, instance, **kwargs):
+    """Drop a user's tokens when the user is saved, deactivated or deleted."""
+    get_token_cache().invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=get_user_model())
+def revoke_deactivated_user_tokens(sender, instance, created, update_fields, **kwargs):
+    """Revoke the signed access tokens of a user being deactivated."""
+    if created or instance.is_active or not tokens.is_enabled():
+        return
+    if update_fields is None or 'is_active' in update_fields:
+        tokens.get_revocation_filter().revoke_user(instance.pk)
+
+
+@receiver(post_delete, sender=get_user_model())
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    """Revoke the signed access tokens of a deleted user."""
+    if tokens.is_enabled():
+        tokens.get_revocation_filter().revoke_user(instance.pk)
@@ -0,0 +1,117 @@
+"""
+Tests for the async user API views.
+"""
+
+import asyncio
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import AsyncClient, TransactionTestCase, override_settings
+from django.urls import path
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from user import views
+from user.async_views import as_async_view
+from user.throttling import get_throttle_store
+
+# urls for these tests, the views are only async when USER_API_ASYNC is set
+urlpatterns = [
+    path('create/', as_async_view(views.CreateUserView.as_view())),
+    path('token/', as_async_view(views.CreateTokenView.as_view())),
+    path('me/', as_async_view(views.ManageUserView.as_view())),
+    path('export/', as_async_view(views.ExportUserView.as_view())),
+]
+
+
+@override_settings(ROOT_URLCONF='user.tests.test_async_views')
+class AsyncUserApiTests(TransactionTestCase):
+    """Test the user API views running on the thread pool"""
+
+    # the views run on pool threads with their own database connections,
+    # so the data must be committed for them to see it
+
+    def setUp(self):
+        self.client = AsyncClient()
+        get_throttle_store().clear()
+
+    def test_views_are_coroutines(self):
+        """Test the wrapped views are async and keep the view attributes"""
+        view = urlpatterns[0].callback
+
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+        self.assertTrue(view.csrf_exempt)
+        self.assertIs(view.cls, views.CreateUserView)
+
+    def test_create_user_and_token(self):
+        """Test creating a user and logging in through the async views"""
+        payload = {
+            'email': 'test@example.com',
+            'password': 'testpass123',
+            'name': 'Test Name',
+        }
+
+        res = async_to_sync(self.client.post)(
+            '/create/', payload, content_type='application/json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.json(), {'email': payload['email'], 'name': payload['name']})
+
+        res = async_to_sync(self.client.post)('/token/', {
+            'email': payload['email'],
+            'password': payload['password'],
+        }, content_type='application/json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('token', res.json())
+
+    def test_retrieve_profile(self):
+        """Test token authentication on the async me view"""
+        user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        token = Token.objects.create(user=user)
+
+        # the async client of Django 3.2 takes headers as plain kwargs
+        res = async_to_sync(self.client.get)(
+            '/me/', authorization='Token ' + token.key,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), {'email': user.email, 'name': user.name})
+
+    def test_export_reads_database_off_the_loop(self):
+        """Test the streamed export queries the database on its own thread"""
+        admin = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='testpass123',
+        )
+        token = Token.objects.create(user=admin)
+
+        async def export():
+            res = await self.client.get('/export/', authorization='Token ' + token.key)
+            # the ASGI handler reads the response on the event loop thread
+            return res, b''.join(res.streaming_content)
+
+        res, content = async_to_sync(export)()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(content, b'{"email":"admin@example.com","name":""}\n')
+
+    def test_concurrent_requests(self):
+        """Test concurrent requests are all served"""
+        async def get_many():
+            return await asyncio.gather(*(
+                self.client.get('/me/') for _ in range(10)
+            ))
+
+        responses = async_to_sync(get_many)()
+
+        self.assertEqual(
+            [res.status_code for res in responses],
+            [status.HTTP_401_UNAUTHORIZED] * 10,
+        )
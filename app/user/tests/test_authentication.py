@@ -0,0 +1,231 @@
+"""
+Tests for the cached token authentication.
+"""
+
+from datetime import timedelta
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from user.authentication import TokenCache, get_token_cache
+
+ME_URL = reverse('user:me')
+
+
+def create_user(**params):
+    """Create and return a new user"""
+    return get_user_model().objects.create_user(**params)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test resolving tokens through the token cache"""
+
+    def setUp(self):
+        self.user = create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        get_token_cache().clear()
+
+    def test_warm_cache_makes_no_queries(self):
+        """Test a second request is authenticated without the database"""
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+        self.assertEqual(get_token_cache().stats()['hits'], 1)
+        self.assertEqual(get_token_cache().stats()['misses'], 1)
+
+    def test_deleted_token_is_rejected(self):
+        """Test deleting a token invalidates the cached entry"""
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_rejected(self):
+        """Test deactivating a user invalidates the cached entry"""
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_updated_user_is_reloaded(self):
+        """Test a saved user is not served stale from the cache"""
+        self.client.get(ME_URL)
+        self.user.name = 'New Name'
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'New Name')
+
+    def test_malformed_key_is_rejected(self):
+        """Test a key not made by Token.generate_key is never looked up"""
+        get_token_cache().set_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token uid:%s' % self.user.pk)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(get_token_cache().stats()['misses'], 0)
+
+
+@override_settings(USER_AUTH_TOKENS={'TTL': 86400, 'RENEW_INTERVAL': 3600})
+class TokenExpiryTests(TestCase):
+    """Test the lifetime of database tokens"""
+
+    def setUp(self):
+        self.user = create_user(email='test@example.com', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        get_token_cache().clear()
+
+    def age_token(self, **delta):
+        Token.objects.filter(pk=self.token.pk).update(created=timezone.now() - timedelta(**delta))
+
+    def test_expired_token_is_rejected(self):
+        """Test a token unused for longer than the TTL is rejected"""
+        self.age_token(days=2)
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cached_token_expires(self):
+        """Test expiry is checked on cache hits too"""
+        # the cache filled while the token was still valid
+        self.token.created = timezone.now() - timedelta(days=2)
+        get_token_cache().set(self.token)
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(get_token_cache().stats()['hits'], 1)
+
+    def test_used_token_is_renewed_once(self):
+        """Test using a token restarts its lifetime, at most once per interval"""
+        self.age_token(hours=2)
+
+        self.client.get(ME_URL)
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.token.refresh_from_db()
+        self.assertGreater(self.token.created, timezone.now() - timedelta(minutes=1))
+
+    @override_settings(USER_AUTH_TOKENS={'TTL': 0})
+    def test_tokens_without_ttl_never_expire(self):
+        """Test a TTL of 0 keeps tokens forever"""
+        self.age_token(days=1000)
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class TokenCacheTests(TestCase):
+    """Test the token cache itself"""
+
+    def setUp(self):
+        self.user = create_user(email='test@example.com', password='pass123')
+        self.token = Token.objects.create(user=self.user)
+
+    def test_entries_expire(self):
+        """Test entries are not returned after their TTL"""
+        cache = TokenCache(ttl=0)
+        cache.set(self.token)
+
+        self.assertIsNone(cache.get(self.token.key))
+
+    def test_least_recently_used_evicted(self):
+        """Test the cache never holds more than max_size entries"""
+        other = create_user(email='other@example.com', password='pass123')
+        other_token = Token.objects.create(user=other)
+        cache = TokenCache(max_size=1)
+        cache.set(self.token)
+        cache.set(other_token)
+
+        self.assertIsNone(cache.get(self.token.key))
+        self.assertEqual(cache.get(other_token.key).user.pk, other.pk)
+
+    def test_hits_return_independent_instances(self):
+        """Test changing a cached user does not change the cache"""
+        cache = TokenCache()
+        cache.set(self.token)
+        cache.get(self.token.key).user.name = 'Changed'
+
+        self.assertEqual(cache.get(self.token.key).user.name, '')
+
+    @override_settings(USER_TOKEN_CACHE={'SHARED_CACHE': 'default', 'TTL': 300})
+    def test_process_local_shared_cache_rejected(self):
+        """Test a cache of each process is refused as the shared tier"""
+        with self.assertRaises(ImproperlyConfigured):
+            TokenCache.from_settings()
+
+    @override_settings(CACHES={'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_tokens_and_users_kept_apart(self):
+        """Test token keys never reach the users cached for access tokens"""
+        cache = TokenCache(shared_cache='shared')
+        stamp = cache.stamp(self.user.pk)
+        cache.set_user(self.user, stamp)
+        cache.set(self.token, stamp)
+
+        self.assertIsNone(cache.get('user:%s' % self.user.pk))
+        self.assertIsNone(cache.get('index:%s' % self.user.pk))
+        self.assertIsNone(TokenCache(shared_cache='shared').get('user:%s' % self.user.pk))
+        self.assertEqual(cache.get_user(self.user.pk).pk, self.user.pk)
+
+    @override_settings(CACHES={'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_invalidation_reaches_other_workers(self):
+        """Test a user invalidated by one worker is dropped by the others"""
+        worker = TokenCache(shared_cache='shared')
+        other_worker = TokenCache(shared_cache='shared')
+        stamp = worker.stamp(self.user.pk)
+        worker.set(self.token, stamp)
+        worker.set_user(self.user, stamp)
+
+        other_worker.invalidate_user(self.user.pk)
+
+        self.assertIsNone(worker.get(self.token.key))
+        self.assertIsNone(worker.get_user(self.user.pk))
+        self.assertEqual(worker.stats()['hits'], 0)
+        worker.set(self.token, worker.stamp(self.user.pk))
+        self.assertEqual(worker.get(self.token.key).key, self.token.key)
+
+    @override_settings(CACHES={'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_invalidation_while_loading(self):
+        """Test a user invalidated while it loads is not cached as valid"""
+        worker = TokenCache(shared_cache='shared')
+        other_worker = TokenCache(shared_cache='shared')
+        stamp = worker.stamp(self.user.pk)
+        # the user is deactivated after the worker read the row
+        other_worker.invalidate_user(self.user.pk)
+        worker.set(self.token, stamp)
+        worker.set_user(self.user, stamp)
+
+        self.assertIsNone(worker.get(self.token.key))
+        self.assertIsNone(worker.get_user(self.user.pk))
+        self.assertIsNone(other_worker.get(self.token.key))
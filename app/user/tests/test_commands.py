@@ -0,0 +1,58 @@
+"""
+Tests for the user management commands.
+"""
+
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from core.models import RevokedToken
+
+
+@override_settings(USER_AUTH_TOKENS={'TTL': 86400, 'RENEW_INTERVAL': 3600})
+class PurgeTokensCommandTests(TestCase):
+    """Test deleting expired tokens"""
+
+    def create_token(self, email, **age):
+        user = get_user_model().objects.create_user(email=email, password='testpass123')
+        token = Token.objects.create(user=user)
+        Token.objects.filter(pk=token.pk).update(created=timezone.now() - timedelta(**age))
+        return token
+
+    def test_purge_in_batches(self):
+        """Test expired tokens are deleted a batch at a time, others kept"""
+        for i in range(5):
+            self.create_token('expired%s@example.com' % i, days=2)
+        fresh = self.create_token('fresh@example.com', hours=1)
+        out = StringIO()
+
+        call_command('purge_tokens', batch_size=2, pause=0, stdout=out)
+
+        self.assertEqual(list(Token.objects.values_list('pk', flat=True)), [fresh.pk])
+        self.assertIn('tokens: deleted 5', out.getvalue())
+        self.assertEqual(out.getvalue().count('tokens: deleted'), 3)
+
+    def test_purge_expired_revocations(self):
+        """Test revocations of expired signed tokens are deleted"""
+        now = timezone.now()
+        RevokedToken.objects.create(key='jti:old', revoked_at=now, expires_at=now - timedelta(minutes=1))
+        RevokedToken.objects.create(key='jti:new', revoked_at=now, expires_at=now + timedelta(minutes=1))
+
+        call_command('purge_tokens', stdout=StringIO())
+
+        self.assertEqual(list(RevokedToken.objects.values_list('key', flat=True)), ['jti:new'])
+
+    @override_settings(USER_AUTH_TOKENS={'TTL': 0})
+    def test_tokens_kept_without_ttl(self):
+        """Test no token is deleted when tokens never expire"""
+        self.create_token('test@example.com', days=1000)
+
+        call_command('purge_tokens', stdout=StringIO())
+
+        self.assertEqual(Token.objects.count(), 1)
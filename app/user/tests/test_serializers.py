@@ -0,0 +1,73 @@
+"""
+Tests for the compiled user representations.
+"""
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase
+
+from rest_framework import serializers
+
+from core.renderers import FastJSONRenderer
+from user.serializers import UserSerializer, UserListSerializer
+
+
+class GenericUserSerializer(serializers.ModelSerializer):
+    """UserSerializer without the compiled representation"""
+
+    class Meta(UserSerializer.Meta):
+        pass
+
+
+class GenericUserListSerializer(serializers.ModelSerializer):
+    """UserListSerializer without the compiled representation"""
+
+    class Meta(UserListSerializer.Meta):
+        pass
+
+
+def make_users():
+    """Return unsaved users covering unicode and empty values"""
+    return [
+        get_user_model()(id=1, email='test@example.com', name='Test Name', is_staff=True),
+        get_user_model()(id=2, email='zoë@example.com', name='Zoë  ', is_active=False),
+        get_user_model()(id=3, email='empty@example.com', name=''),
+    ]
+
+
+class CompiledRepresentationTests(SimpleTestCase):
+    """Test the compiled path matches the generic serializers"""
+
+    def assertSameBytes(self, compiled, generic):
+        renderer = FastJSONRenderer()
+        self.assertEqual(renderer.render(compiled.data), renderer.render(generic.data))
+
+    def test_user_serializer_same_output(self):
+        """Test a single user renders byte for byte like ModelSerializer"""
+        for user in make_users():
+            with self.subTest(email=user.email):
+                self.assertSameBytes(UserSerializer(user), GenericUserSerializer(user))
+
+    def test_user_list_serializer_same_output(self):
+        """Test a list of users renders byte for byte like ModelSerializer"""
+        users = make_users()
+
+        self.assertSameBytes(
+            UserListSerializer(users, many=True),
+            GenericUserListSerializer(users, many=True),
+        )
+
+    def test_fields_not_built_to_read(self):
+        """Test representing a user does not build the serializer fields"""
+        serializer = UserSerializer(make_users()[0])
+
+        serializer.data
+
+        self.assertNotIn('fields', serializer.__dict__)
+
+    def test_dict_uses_generic_path(self):
+        """Test a dict of validated data is still represented"""
+        data = {'email': 'test@example.com', 'password': 'testpass123', 'name': 'Test Name'}
+
+        ret = UserSerializer().to_representation(data)
+
+        self.assertEqual(ret, {'email': 'test@example.com', 'name': 'Test Name'})
@@ -0,0 +1,146 @@
+"""
+Tests for the login and signup throttles.
+"""
+
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from user.throttling import SlidingWindowStore, get_throttle_store
+
+TOKEN_URL = reverse('user:token')
+CREATE_USER_URL = reverse('user:create')
+
+THROTTLE = {
+    'RATES': {
+        'login': {'ip': '5/min', 'email': '2/min'},
+        'signup': {'ip': '3/min'},
+    },
+    'MAX_KEYS': 1000,
+}
+
+
+class SlidingWindowStoreTests(SimpleTestCase):
+    """Test the sliding window counters"""
+
+    def test_limit_within_window(self):
+        """Test attempts past the limit are rejected until the window slides"""
+        store = SlidingWindowStore()
+
+        results = [store.hit('key', 3, 60, now=600 + i)[0] for i in range(4)]
+
+        self.assertEqual(results, [True, True, True, False])
+        # halfway through the next window half of the old attempts still count
+        results = [store.hit('key', 3, 60, now=690)[0] for i in range(3)]
+        self.assertEqual(results, [True, True, False])
+        # two windows later nothing counts
+        self.assertTrue(all(store.hit('key', 3, 60, now=840 + i)[0] for i in range(3)))
+
+    def test_wait_until_window_end(self):
+        """Test a rejected attempt reports when the window ends"""
+        store = SlidingWindowStore()
+        store.hit('key', 1, 60, now=610)
+
+        allowed, wait = store.hit('key', 1, 60, now=620)
+
+        self.assertFalse(allowed)
+        self.assertEqual(wait, 40)
+
+    def test_idle_keys_evicted(self):
+        """Test memory stays bounded by evicting the least recently used keys"""
+        store = SlidingWindowStore(max_keys=2)
+        for key in ('a', 'b', 'a', 'c'):
+            store.hit(key, 10, 60, now=600)
+
+        self.assertEqual(list(store._entries), ['a', 'c'])
+
+    def test_limit_shared_by_workers(self):
+        """Test a store counting for one of several workers allows its share"""
+        store = SlidingWindowStore(workers=3)
+
+        results = [store.hit('key', 5, 60, now=600 + i)[0] for i in range(3)]
+
+        self.assertEqual(results, [True, True, False])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_shared_cache(self):
+        """Test attempts are counted in the shared cache between stores"""
+        first = SlidingWindowStore(shared_cache='default')
+        second = SlidingWindowStore(shared_cache='default')
+
+        self.assertTrue(first.hit('shared', 2, 60, now=600)[0])
+        self.assertTrue(second.hit('shared', 2, 60, now=601)[0])
+        self.assertFalse(first.hit('shared', 2, 60, now=602)[0])
+
+
+@override_settings(USER_THROTTLE=THROTTLE)
+class ThrottleApiTests(TestCase):
+    """Test the throttles on the login and signup endpoints"""
+
+    def setUp(self):
+        get_user_model().objects.create_user(email='test@example.com', password='testpass123')
+        self.client = APIClient()
+        get_throttle_store().clear()
+        # a test crossing into the next window would see its attempts decay
+        patcher = patch('user.throttling.time')
+        patcher.start().time.return_value = 600.0
+        self.addCleanup(patcher.stop)
+
+    def test_login_throttled_by_email(self):
+        """Test logins for one email are throttled before authenticating"""
+        payload = {'email': 'test@example.com', 'password': 'wrong'}
+        for _ in range(2):
+            self.client.post(TOKEN_URL, payload)
+
+        with patch('user.serializers.authenticate') as patched_authenticate:
+            res = self.client.post(TOKEN_URL, {'email': 'TEST@example.com', 'password': 'wrong'})
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+        patched_authenticate.assert_not_called()
+        # other emails are only limited by the IP
+        res = self.client.post(TOKEN_URL, {'email': 'other@example.com', 'password': 'wrong'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_login_throttled_by_ip(self):
+        """Test logins from one IP are throttled whatever the email"""
+        for index in range(5):
+            self.client.post(TOKEN_URL, {'email': f'user{index}@example.com', 'password': 'wrong'})
+
+        res = self.client.post(TOKEN_URL, {'email': 'test@example.com', 'password': 'testpass123'})
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_forwarded_for_ignored_without_proxies(self):
+        """Test a client can't escape the IP limit by rotating X-Forwarded-For"""
+        for index in range(5):
+            self.client.post(
+                TOKEN_URL, {'email': f'user{index}@example.com', 'password': 'wrong'},
+                HTTP_X_FORWARDED_FOR=f'10.0.0.{index}',
+            )
+
+        res = self.client.post(
+            TOKEN_URL, {'email': 'test@example.com', 'password': 'testpass123'},
+            HTTP_X_FORWARDED_FOR='10.0.0.99',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_signup_throttled_by_ip(self):
+        """Test signups from one IP are throttled"""
+        for index in range(3):
+            self.client.post(CREATE_USER_URL, {
+                'email': f'user{index}@example.com', 'password': 'testpass123', 'name': 'Test',
+            })
+
+        res = self.client.post(CREATE_USER_URL, {
+            'email': 'new@example.com', 'password': 'testpass123', 'name': 'Test',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertFalse(get_user_model().objects.filter(email='new@example.com').exists())
@@ -0,0 +1,201 @@
+"""
+Tests for the signed access tokens.
+"""
+
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.bloom import BloomFilter
+from core.models import RevokedToken
+from user import tokens
+from user.authentication import get_token_cache
+from user.throttling import get_throttle_store
+
+TOKEN_URL = reverse('user:token')
+REVOKE_URL = reverse('user:token-revoke')
+ME_URL = reverse('user:me')
+
+ACCESS_TOKENS = {
+    'ENABLED': True,
+    'TTL': 900,
+    'KEYS': {'1': 'first-secret'},
+    'CURRENT_KEY': '1',
+    'REVOCATION_REFRESH': 3600,
+    'REVOCATION_CAPACITY': 100,
+}
+
+
+class BloomFilterTests(SimpleTestCase):
+    """Test the bloom filter"""
+
+    def test_added_values_present(self):
+        """Test every added value is reported as present"""
+        bloom = BloomFilter(capacity=1000)
+        for index in range(1000):
+            bloom.add('jti:%d' % index)
+
+        self.assertTrue(all('jti:%d' % index in bloom for index in range(1000)))
+        self.assertFalse(bloom.full)
+
+    def test_false_positive_rate(self):
+        """Test absent values are rarely reported as present"""
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for index in range(1000):
+            bloom.add('jti:%d' % index)
+
+        false_positives = sum('other:%d' % index in bloom for index in range(10000))
+
+        self.assertLess(false_positives, 300)
+
+
+@override_settings(USER_ACCESS_TOKENS=ACCESS_TOKENS)
+class SignedTokenApiTests(TestCase):
+    """Test logging in and authenticating with signed access tokens"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.client = APIClient()
+        tokens._revocation_filter = None
+        get_token_cache().clear()
+        get_throttle_store().clear()
+
+    def tearDown(self):
+        tokens._revocation_filter = None
+
+    def login(self):
+        res = self.client.post(TOKEN_URL, {'email': 'test@example.com', 'password': 'testpass123'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data['token']
+
+    def test_login_issues_signed_token(self):
+        """Test the token endpoint returns a bearer token"""
+        res = self.client.post(TOKEN_URL, {'email': 'test@example.com', 'password': 'testpass123'})
+
+        self.assertEqual(res.data['token_type'], 'Bearer')
+        self.assertEqual(res.data['expires_in'], 900)
+        self.assertEqual(tokens.verify(res.data['token']).user_id, self.user.pk)
+
+    def test_me_without_queries(self):
+        """Test a warm request is authenticated without the database"""
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.login())
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], 'test@example.com')
+
+    def test_tampered_token_rejected(self):
+        """Test a token whose payload was changed is rejected"""
+        token = self.login()
+        key_id, user_id, rest = token.split('.', 2)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer %s.%s.%s' % (key_id, user_id + '0', rest))
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_expired_token_rejected(self):
+        """Test an expired token is rejected"""
+        with self.settings(USER_ACCESS_TOKENS={**ACCESS_TOKENS, 'TTL': -1}):
+            token = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_key_rotation(self):
+        """Test tokens are accepted until their key is removed"""
+        token = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+        rotated = {**ACCESS_TOKENS, 'KEYS': {'2': 'second-secret', '1': 'first-secret'}, 'CURRENT_KEY': '2'}
+
+        with self.settings(USER_ACCESS_TOKENS=rotated):
+            self.assertTrue(self.login().startswith('2.'))
+            self.assertEqual(self.client.get(ME_URL).status_code, status.HTTP_200_OK)
+        with self.settings(USER_ACCESS_TOKENS={**rotated, 'KEYS': {'2': 'second-secret'}}):
+            self.assertEqual(self.client.get(ME_URL).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_revokes_token(self):
+        """Test a revoked token is rejected while others still work"""
+        token = self.login()
+        other = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+
+        res = self.client.post(REVOKE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get(ME_URL).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + other)
+        self.assertEqual(self.client.get(ME_URL).status_code, status.HTTP_200_OK)
+
+    def test_deactivation_revokes_tokens(self):
+        """Test deactivating a user revokes the tokens issued before"""
+        access = tokens.verify(self.login())
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertTrue(tokens.get_revocation_filter().is_revoked(access))
+
+    def test_revocation_by_other_process(self):
+        """Test revocations written by another process are picked up"""
+        access = tokens.verify(self.login())
+        revocations = tokens.get_revocation_filter()
+        self.assertFalse(revocations.is_revoked(access))
+
+        RevokedToken.objects.create(
+            key='jti:%s' % access.token_id,
+            revoked_at=timezone.now(),
+            expires_at=timezone.now() + timedelta(minutes=15),
+        )
+        revocations.refresh(force=True)
+
+        self.assertTrue(revocations.is_revoked(access))
+
+    def test_revocation_committed_late(self):
+        """Test a revocation committed after newer ones is still picked up"""
+        access = tokens.verify(self.login())
+        revocations = tokens.get_revocation_filter()
+        revoked_at = timezone.now()
+        # its id was taken before the newer row's
+        late = RevokedToken(
+            id=999, key='jti:%s' % access.token_id,
+            revoked_at=revoked_at,
+            expires_at=revoked_at + timedelta(minutes=15),
+        )
+        # a newer revocation commits and is loaded first
+        RevokedToken.objects.create(
+            id=1000, key='jti:other', revoked_at=timezone.now(),
+            expires_at=timezone.now() + timedelta(minutes=15),
+        )
+        revocations.refresh(force=True)
+        self.assertFalse(revocations.is_revoked(access))
+
+        late.save()
+        revocations.refresh(force=True)
+
+        self.assertTrue(revocations.is_revoked(access))
+
+    def test_disabled_ignores_bearer_tokens(self):
+        """Test bearer tokens are not accepted when the mode is off"""
+        token = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+
+        with self.settings(USER_ACCESS_TOKENS={**ACCESS_TOKENS, 'ENABLED': False}):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
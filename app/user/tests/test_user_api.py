@@ -2,16 +2,32 @@
 Tests for the user API.
 """
 
-from django.test import TestCase
+import json
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.conf import settings
+from django.db import connection
+from django.contrib.auth.hashers import make_password
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
 
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from core import hashing
+from user.throttling import get_throttle_store
+
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
 ME_URL = reverse('user:me')
+BULK_CREATE_URL = reverse('user:bulk-create')
+LIST_URL = reverse('user:list')
+EXPORT_URL = reverse('user:export')
 
 
 def create_user(**params):
@@ -25,6 +41,7 @@ class PublicUserApiTests(TestCase):
     def setUp(self):
         # APIClient mocks user authentication such as user registration & login
         self.client = APIClient()
+        get_throttle_store().clear()
 
     def test_create_user_success(self):
         """Test creating a user is successful"""
@@ -68,6 +85,20 @@ class PublicUserApiTests(TestCase):
         # response status code should be 400 because the user already exists in the database
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_user_with_email_in_other_case_exists_error(self):
+        """Test error returned if the email is taken in another case"""
+        create_user(email='test@example.com', password='testpass123')
+        payload = {
+            'email': 'TEST@example.com',
+            'password': 'testpass123',
+            'name': 'Test Name',
+        }
+
+        res = self.client.post(CREATE_USER_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email', res.data)
+
     def test_password_too_short_error(self):
         """Test an error is returned if password less than 5 chars"""
 
@@ -113,6 +144,28 @@ class PublicUserApiTests(TestCase):
         # check status code
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
+    def test_create_token_email_in_other_case(self):
+        """Test logging in with an email typed in another case"""
+        create_user(email='Test@example.com', password='testpass123')
+
+        payload = {'email': 'test@EXAMPLE.com', 'password': 'testpass123'}
+        res = self.client.post(TOKEN_URL, payload)
+
+        self.assertIn('token', res.data)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_create_token_replaces_expired_token(self):
+        """Test logging in after a token expired issues a new token"""
+        user = create_user(email='test@example.com', password='testpass123')
+        expired = Token.objects.create(user=user)
+        Token.objects.filter(pk=expired.pk).update(created=timezone.now() - timedelta(days=365))
+
+        res = self.client.post(TOKEN_URL, {'email': 'test@example.com', 'password': 'testpass123'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res.data['token'], expired.key)
+        self.assertFalse(Token.objects.filter(pk=expired.pk).exists())
+
     def test_create_token_bad_credentials(self):
         """Test returns error if credentials are invalid"""
 
@@ -142,6 +195,32 @@ class PublicUserApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+class DeferredRehashApiTests(TransactionTestCase):
+    """Test logins upgrading outdated hashes in the background"""
+
+    # the rehash thread has its own connection, the user must be committed
+
+    def setUp(self):
+        self.client = APIClient()
+        get_throttle_store().clear()
+
+    def test_login_upgrades_hash_after_response(self):
+        """Test a login with an old hash is answered before the upgrade"""
+        old = make_password('testpass123', hasher='pbkdf2_sha1')
+        user = get_user_model().objects.create(email='test@example.com', password=old)
+        rehash_queue = hashing.RehashQueue(max_size=10)
+
+        with patch('core.hashing.get_rehash_queue', return_value=rehash_queue), \
+                patch.object(rehash_queue, '_rehash', wraps=rehash_queue._rehash) as patched_rehash:
+            res = self.client.post(TOKEN_URL, {'email': 'test@example.com', 'password': 'testpass123'})
+            rehash_queue.join()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        patched_rehash.assert_called_once()
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+
+
 class PrivateUserApiTests(TestCase):
     """Test API requests that require authentication"""
 
@@ -174,6 +253,77 @@ class PrivateUserApiTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
 
+    def test_retrieve_profile_validators(self):
+        """Test the profile is returned with an ETag and Last-Modified"""
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res['ETag'], '"%s-1-json"' % self.user.pk)
+        self.assertIn('Last-Modified', res)
+        self.assertIn('private', res['Cache-Control'])
+
+    def test_retrieve_profile_not_modified(self):
+        """Test a matching ETag is answered with 304 without serializing"""
+        etag = self.client.get(ME_URL)['ETag']
+
+        with patch('user.serializers.UserSerializer.to_representation') as patched_repr:
+            res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+        patched_repr.assert_not_called()
+
+    def test_retrieve_profile_not_modified_since(self):
+        """Test If-Modified-Since is answered with 304 when unchanged"""
+        last_modified = self.client.get(ME_URL)['Last-Modified']
+
+        res = self.client.get(ME_URL, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_update_changes_etag(self):
+        """Test the ETag of the profile changes with the profile"""
+        etag = self.client.get(ME_URL)['ETag']
+
+        res = self.client.patch(ME_URL, {'name': 'Updated name'})
+
+        self.assertNotEqual(res['ETag'], etag)
+        res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_update_if_match(self):
+        """Test an update with the current ETag succeeds"""
+        etag = self.client.get(ME_URL)['ETag']
+
+        res = self.client.patch(ME_URL, {'name': 'Updated name'}, HTTP_IF_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'Updated name')
+
+    def test_update_if_match_stale(self):
+        """Test an update based on an outdated ETag is refused"""
+        etag = self.client.get(ME_URL)['ETag']
+        # changed by another client meanwhile
+        get_user_model().objects.filter(pk=self.user.pk).update(name='Other', version=2)
+
+        res = self.client.patch(ME_URL, {'name': 'Updated name'}, HTTP_IF_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'Other')
+
+    def test_update_profile_single_update(self):
+        """Test changing the name and password issues one UPDATE"""
+        payload = {'name': 'Updated name', 'password': 'newpassword123'}
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.patch(ME_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('"email"', updates[0])
+
     def test_update_user_profile(self):
         """Test updating the user profile for the authenticated user"""
 
@@ -185,3 +335,217 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class BulkCreateUserApiTests(TestCase):
+    """Test creating many users with one request"""
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_bulk_create_users_success(self):
+        """Test every user in the payload is created"""
+        payload = [
+            {'email': 'user%s@example.com' % i, 'password': 'testpass123', 'name': 'User %s' % i}
+            for i in range(3)
+        ]
+
+        res = self.client.post(BULK_CREATE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([item['status'] for item in res.data], ['created'] * 3)
+        for item in payload:
+            user = get_user_model().objects.get(email=item['email'])
+            self.assertTrue(user.check_password(item['password']))
+            self.assertEqual(user.name, item['name'])
+
+    def test_bulk_create_reports_errors_per_item(self):
+        """Test invalid and duplicate items are reported in place"""
+        create_user(email='taken@example.com', password='testpass123')
+        payload = [
+            {'email': 'new@example.com', 'password': 'testpass123', 'name': 'New'},
+            {'email': 'taken@example.com', 'password': 'testpass123', 'name': 'Taken'},
+            {'email': 'short@example.com', 'password': 'pw', 'name': 'Short'},
+            {'email': 'new@EXAMPLE.com', 'password': 'testpass123', 'name': 'Again'},
+        ]
+
+        # one uniqueness SELECT and one INSERT for the whole payload, plus
+        # the savepoint around the INSERT
+        with self.assertNumQueries(4):
+            res = self.client.post(BULK_CREATE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(
+            [item['status'] for item in res.data],
+            ['created', 'error', 'error', 'error'],
+        )
+        self.assertIn('email', res.data[1]['errors'])
+        self.assertIn('password', res.data[2]['errors'])
+        self.assertIn('email', res.data[3]['errors'])
+        self.assertFalse(
+            get_user_model().objects.filter(email='short@example.com').exists()
+        )
+
+    def test_bulk_create_concurrent_signup(self):
+        """Test an email taken after the check is reported, not a 500"""
+        payload = [
+            {'email': 'new@example.com', 'password': 'testpass123', 'name': 'New'},
+            {'email': 'racer@example.com', 'password': 'testpass123', 'name': 'Racer'},
+        ]
+
+        def signup_then_hash(passwords):
+            # another request signs up between the check and the INSERT
+            create_user(email='RACER@example.com', password='testpass123')
+            return [make_password(password) for password in passwords]
+
+        with patch('user.serializers.hashing.make_passwords', side_effect=signup_then_hash):
+            res = self.client.post(BULK_CREATE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([item['status'] for item in res.data], ['created', 'error'])
+        self.assertIn('email', res.data[1]['errors'])
+        self.assertEqual(res.data[0]['data']['email'], 'new@example.com')
+        self.assertTrue(get_user_model().objects.filter(email='new@example.com').exists())
+
+    def test_bulk_create_all_invalid(self):
+        """Test a payload with no valid users is a bad request"""
+        payload = [{'email': 'not-an-email', 'password': 'testpass123', 'name': 'Test'}]
+
+        res = self.client.post(BULK_CREATE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create_limit_fits_timeout(self):
+        """Test the default limit only admits payloads hashed in time"""
+        payload = [
+            {'email': 'user%s@example.com' % i, 'password': 'testpass123', 'name': 'User %s' % i}
+            for i in range(15)
+        ]
+
+        with self.settings(USER_BULK_CREATE_MAX_ITEMS=0, SERVER={**settings.SERVER, 'TIMEOUT': 30}), \
+                patch('core.hashing.hash_seconds', return_value=3.0), \
+                patch('core.hashing.get_pool') as patched_pool:
+            # 2 threads hash 10 passwords in 15 seconds
+            patched_pool.return_value.parallelism = 2
+            res = self.client.post(BULK_CREATE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('10', str(res.data))
+        self.assertFalse(get_user_model().objects.exclude(pk=self.admin.pk).exists())
+
+    def test_bulk_create_requires_list(self):
+        """Test a single object payload is rejected"""
+        payload = {'email': 'test@example.com', 'password': 'testpass123'}
+
+        res = self.client.post(BULK_CREATE_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create_requires_staff(self):
+        """Test regular users cannot bulk create users"""
+        user = create_user(email='test@example.com', password='testpass123')
+        self.client.force_authenticate(user=user)
+
+        res = self.client.post(BULK_CREATE_URL, [], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ListUserApiTests(TestCase):
+    """Test the staff user list"""
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_list_users_with_cursor(self):
+        """Test pages are ordered by id and linked with a cursor"""
+        users = [self.admin] + [
+            create_user(email='user%s@example.com' % i, password='testpass123')
+            for i in range(4)
+        ]
+
+        res = self.client.get(LIST_URL, {'page_size': 3})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', res.data)
+        self.assertEqual([u['id'] for u in res.data['results']], [u.id for u in users[:3]])
+
+        res = self.client.get(res.data['next'])
+
+        self.assertEqual([u['id'] for u in res.data['results']], [u.id for u in users[3:]])
+        self.assertIsNone(res.data['next'])
+
+    def test_filter_users(self):
+        """Test filtering users by is_active and is_staff"""
+        active = create_user(email='active@example.com', password='testpass123')
+        create_user(email='inactive@example.com', password='testpass123', is_active=False)
+
+        res = self.client.get(LIST_URL, {'is_active': 'true', 'is_staff': 'false'})
+
+        self.assertEqual([u['email'] for u in res.data['results']], [active.email])
+
+    def test_filter_must_be_boolean(self):
+        """Test an invalid filter value is a bad request"""
+        res = self.client.get(LIST_URL, {'is_staff': 'maybe'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_requires_staff(self):
+        """Test regular users cannot list users"""
+        user = create_user(email='test@example.com', password='testpass123')
+        self.client.force_authenticate(user=user)
+
+        res = self.client.get(LIST_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ExportUserApiTests(TestCase):
+    """Test the staff JSONL export"""
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    @override_settings(USER_EXPORT_CHUNK_SIZE=2)
+    def test_export_streams_users(self):
+        """Test every user is a JSON line in id order, across chunks"""
+        users = [self.admin] + [
+            create_user(email='user%s@example.com' % i, password='testpass123', name='User %s' % i)
+            for i in range(4)
+        ]
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        with CaptureQueriesContext(connection) as queries:
+            chunks = list(res.streaming_content)
+        self.assertNotIn('"password"', queries[0]['sql'])
+        self.assertEqual(len(chunks), 3)
+        rows = [json.loads(line) for line in b''.join(chunks).splitlines()]
+        self.assertEqual(rows, [{'email': u.email, 'name': u.name} for u in users])
+
+    def test_export_requires_staff(self):
+        """Test regular users cannot export users"""
+        user = create_user(email='test@example.com', password='testpass123')
+        self.client.force_authenticate(user=user)
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
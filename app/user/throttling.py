@@ -0,0 +1,186 @@
+"""
+Login and signup throttling by client IP and by submitted email.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Return (limit, window seconds) of a rate such as '10/min'."""
+    limit, period = rate.split('/')
+    return int(limit), DURATIONS[period[0]]
+
+
+class SlidingWindowStore:
+    """Sliding window counters, approximated from two fixed windows per key.
+
+    The previous window's count is weighted by how much of it still overlaps
+    the sliding window, so a key only needs three integers whatever its rate.
+
+    Counted locally by each of several workers, every worker only allows its
+    share of a limit, so that the workers together don't allow it many times.
+    """
+
+    # prefix used for the keys stored in the optional shared cache tier
+    key_prefix = 'user-throttle:'
+
+    def __init__(self, max_keys=100000, shared_cache=None, workers=1):
+        self.max_keys = max_keys
+        # alias of an entry in settings.CACHES shared between workers
+        self.shared_cache = shared_cache
+        # processes counting the same clients without a shared cache
+        self.workers = workers
+        # key -> [window index, count in that window, count in the one before]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_settings(cls):
+        config = getattr(settings, 'USER_THROTTLE', {})
+        return cls(
+            max_keys=config.get('MAX_KEYS', 100000),
+            shared_cache=config.get('SHARED_CACHE'),
+            workers=config.get('WORKERS', 1),
+        )
+
+    def hit(self, key, limit, window, now=None):
+        """Count an attempt, return (allowed, seconds to wait if rejected)."""
+        now = time.time() if now is None else now
+        index = int(now // window)
+        # share of the previous window still inside the sliding window
+        weight = 1 - (now % window) / window
+        if self.shared_cache:
+            allowed = self._hit_shared(key, limit, window, index, weight)
+        else:
+            limit = math.ceil(limit / self.workers)
+            allowed = self._hit_local(key, limit, index, weight)
+
+        if allowed:
+            self.allowed += 1
+            return True, None
+        self.rejected += 1
+        return False, window - now % window
+
+    def _hit_local(self, key, limit, index, weight):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [index, 0, 0]
+            elif entry[0] != index:
+                entry[2] = entry[1] if entry[0] == index - 1 else 0
+                entry[0], entry[1] = index, 0
+            self._entries.move_to_end(key)
+            # idle keys drift to the front and are evicted first
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+
+            if entry[2] * weight + entry[1] >= limit:
+                return False
+            entry[1] += 1
+            return True
+
+    def _hit_shared(self, key, limit, window, index, weight):
+        shared = caches[self.shared_cache]
+        current = '%s%s:%d' % (self.key_prefix, key, index)
+        previous = '%s%s:%d' % (self.key_prefix, key, index - 1)
+        counts = shared.get_many([current, previous])
+        if counts.get(previous, 0) * weight + counts.get(current, 0) >= limit:
+            return False
+        # a window's counter is needed until the end of the next one
+        shared.add(current, 0, timeout=2 * window)
+        shared.incr(current)
+        return True
+
+    def clear(self):
+        """Drop every locally counted attempt and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.allowed = self.rejected = 0
+
+    def stats(self):
+        return {
+            'keys': len(self._entries),
+            'allowed': self.allowed,
+            'rejected': self.rejected,
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_throttle_store():
+    """Return the process wide throttle store."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SlidingWindowStore.from_settings()
+    return _store
+
+
+def metrics_gauges():
+    """Report the throttle counters on /metrics."""
+    return [
+        ('app_throttle_%s' % name, (), value)
+        for name, value in get_throttle_store().stats().items()
+    ]
+
+
+class ClientRateThrottle(BaseThrottle):
+    """Throttle a scope by client IP and by the email in the request body.
+
+    DRF checks throttles before the view runs, so rejected requests never
+    reach the serializer or authenticate() and cost no password hash.
+    """
+
+    scope = None
+
+    def get_rates(self):
+        """Return the 'ip' and 'email' rates of the scope."""
+        config = getattr(settings, 'USER_THROTTLE', {})
+        return config.get('RATES', {}).get(self.scope, {})
+
+    def get_keys(self, request):
+        rates = self.get_rates()
+        if rates.get('ip'):
+            yield 'ip:%s' % self.get_ident(request), rates['ip']
+        if rates.get('email'):
+            # bulk payloads are lists, only single logins carry an email
+            email = getattr(request.data, 'get', lambda key: None)('email')
+            if isinstance(email, str) and email:
+                yield 'email:%s' % email.strip().lower(), rates['email']
+
+    def allow_request(self, request, view):
+        store = get_throttle_store()
+        now = time.time()
+        for key, rate in self.get_keys(request):
+            limit, window = parse_rate(rate)
+            allowed, self.wait_seconds = store.hit('%s:%s' % (self.scope, key), limit, window, now)
+            if not allowed:
+                return False
+
+        return True
+
+    def wait(self):
+        return getattr(self, 'wait_seconds', None)
+
+
+class LoginRateThrottle(ClientRateThrottle):
+    scope = 'login'
+
+
+class SignupRateThrottle(ClientRateThrottle):
+    scope = 'signup'
@@ -0,0 +1,187 @@
+"""
+Stateless HMAC signed access tokens and their revocation filter.
+"""
+
+import secrets
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.translation import gettext as _
+
+from rest_framework import exceptions
+
+from core.bloom import BloomFilter
+from core.models import RevokedToken
+
+# salt separating these signatures from other uses of the keys
+KEY_SALT = 'user.tokens.access'
+
+AccessToken = namedtuple('AccessToken', ['key_id', 'user_id', 'issued_at', 'expires_at', 'token_id'])
+
+
+def get_config():
+    return getattr(settings, 'USER_ACCESS_TOKENS', {})
+
+
+def is_enabled():
+    return bool(get_config().get('ENABLED'))
+
+
+def _signature(key_id, payload):
+    keys = get_config()['KEYS']
+    return salted_hmac(KEY_SALT, payload, secret=keys[key_id], algorithm='sha256').hexdigest()
+
+
+def issue(user):
+    """Return a signed access token for the user."""
+    config = get_config()
+    key_id = config['CURRENT_KEY']
+    issued_at = int(time.time())
+    payload = '%s.%d.%d.%d.%s' % (
+        key_id, user.pk, issued_at, issued_at + config['TTL'], secrets.token_hex(8),
+    )
+    return '%s.%s' % (payload, _signature(key_id, payload))
+
+
+def verify(token):
+    """Return the AccessToken of a signed token, raising if invalid or expired."""
+    payload, _sep, signature = token.rpartition('.')
+    parts = payload.split('.')
+    # any key still in KEYS is accepted, so tokens outlive a key rotation
+    if len(parts) != 5 or parts[0] not in get_config().get('KEYS', {}):
+        raise exceptions.AuthenticationFailed(_('Invalid token.'))
+    if not constant_time_compare(signature, _signature(parts[0], payload)):
+        raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+    access = AccessToken(parts[0], int(parts[1]), int(parts[2]), int(parts[3]), parts[4])
+    if access.expires_at <= time.time():
+        raise exceptions.AuthenticationFailed(_('Token has expired.'))
+
+    return access
+
+
+def _timestamp(seconds):
+    return datetime.fromtimestamp(seconds, dt_timezone.utc)
+
+
+class RevocationFilter:
+    """Bloom filter of revoked keys, refreshed from RevokedToken rows."""
+
+    def __init__(self, refresh_interval=5, capacity=10000, margin=60):
+        self.refresh_interval = refresh_interval
+        self.capacity = capacity
+        # seconds a revocation may take to commit after its revoked_at, the
+        # rows revoked that long before the last refresh are read again
+        self.margin = margin
+        self.bloom = BloomFilter(capacity)
+        # wall clock time of the last refresh, None until the first load
+        self.loaded_at = None
+        self.refreshed_at = None
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.confirmations = 0
+        self.false_positives = 0
+
+    @classmethod
+    def from_settings(cls):
+        config = get_config()
+        return cls(
+            refresh_interval=config.get('REVOCATION_REFRESH', 5),
+            capacity=config.get('REVOCATION_CAPACITY', 10000),
+            margin=config.get('REVOCATION_MARGIN', 60),
+        )
+
+    def refresh(self, force=False):
+        """Add the rows revoked since the last refresh, at most once per interval."""
+        now = time.monotonic()
+        if not force and self.refreshed_at is not None and now - self.refreshed_at < self.refresh_interval:
+            return
+        with self._lock:
+            if not force and self.refreshed_at is not None and now - self.refreshed_at < self.refresh_interval:
+                return
+            self.refreshed_at = now
+            loaded_at = timezone.now()
+            bloom = self.bloom
+            if self.loaded_at is None or bloom.full:
+                # start over from the rows whose tokens have not expired yet,
+                # readers keep the old filter until the new one is complete
+                bloom = BloomFilter(self.capacity)
+                rows = RevokedToken.objects.filter(expires_at__gt=loaded_at)
+            else:
+                # ids and revoked_at are taken before the commit, a row may
+                # appear after rows newer than it, e.g. from the admin's
+                # transaction, so a trailing window is read again each time
+                since = self.loaded_at - timedelta(seconds=self.margin)
+                rows = RevokedToken.objects.filter(revoked_at__gte=since)
+            for key in rows.values_list('key', flat=True).iterator():
+                # keys read again leave the count, and so the rebuilds, alone
+                if key not in bloom:
+                    bloom.add(key)
+            self.bloom, self.loaded_at = bloom, loaded_at
+
+    def is_revoked(self, access):
+        """Check a token, only querying the database when the filter matches."""
+        self.refresh()
+        self.checks += 1
+        keys = ['jti:%s' % access.token_id, 'user:%s' % access.user_id]
+        if not any(key in self.bloom for key in keys):
+            return False
+
+        self.confirmations += 1
+        revoked = RevokedToken.objects.filter(
+            key__in=keys, revoked_at__gte=_timestamp(access.issued_at),
+        ).exists()
+        if not revoked:
+            self.false_positives += 1
+        return revoked
+
+    def revoke(self, key, expires_at):
+        """Record a revocation and add it to this process' filter at once."""
+        RevokedToken.objects.create(key=key, revoked_at=timezone.now(), expires_at=expires_at)
+        with self._lock:
+            self.bloom.add(key)
+
+    def revoke_token(self, access):
+        self.revoke('jti:%s' % access.token_id, _timestamp(access.expires_at))
+
+    def revoke_user(self, user_pk):
+        # tokens issued until now expire at the latest one TTL from now
+        expires_at = timezone.now() + timedelta(seconds=get_config().get('TTL', 0))
+        self.revoke('user:%s' % user_pk, expires_at)
+
+    def stats(self):
+        return {
+            'size': self.bloom.count,
+            'checks': self.checks,
+            'confirmations': self.confirmations,
+            'false_positives': self.false_positives,
+        }
+
+
+_revocation_filter = None
+_revocation_filter_lock = threading.Lock()
+
+
+def get_revocation_filter():
+    """Return the process wide revocation filter."""
+    global _revocation_filter
+    if _revocation_filter is None:
+        with _revocation_filter_lock:
+            if _revocation_filter is None:
+                _revocation_filter = RevocationFilter.from_settings()
+    return _revocation_filter
+
+
+def metrics_gauges():
+    """Report the revocation filter counters on /metrics."""
+    if _revocation_filter is None:
+        return []
+    return [
+        ('app_token_revocation_%s' % name, (), value)
+        for name, value in _revocation_filter.stats().items()
+    ]
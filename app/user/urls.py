@@ -2,14 +2,35 @@
 URL mappings for the user API.
 """
 
+from django.conf import settings
 from django.urls import path
 
 from user import views
+from user.async_views import as_async_view
 
 app_name = 'user'
 
+
+def as_view(view_class):
+    """Return the view, run on the async thread pool in async mode."""
+    view = view_class.as_view()
+    return as_async_view(view) if settings.USER_API_ASYNC else view
+
+
 urlpatterns = [
-    path('create/', views.CreateUserView.as_view(), name='create'),
-    path('token/', views.CreateTokenView.as_view(), name='token'),
-    path('me/', views.ManageUserView.as_view(), name='me')
+    path('', as_view(views.ListUserView), name='list'),
+    path('create/', as_view(views.CreateUserView), name='create'),
+    path(
+        'bulk-create/',
+        as_view(views.BulkCreateUserView),
+        name='bulk-create',
+    ),
+    path('export/', as_view(views.ExportUserView), name='export'),
+    path('token/', as_view(views.CreateTokenView), name='token'),
+    path(
+        'token/revoke/',
+        as_view(views.RevokeTokenView),
+        name='token-revoke',
+    ),
+    path('me/', as_view(views.ManageUserView), name='me')
 ]
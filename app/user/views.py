@@ -5,14 +5,37 @@ Views for the user API
 # rest_framework handles a lot of logics for creating objects in the database for us
 # by providing a bunch of base classes that we can configure for our views that will handle requests
 # in a default standardized way, at the same time we have the ability to modify it as we need
-from rest_framework import generics, authentication, permissions
+from calendar import timegm
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import router
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.utils.translation import gettext as _, gettext_lazy
+
+from rest_framework import exceptions, generics, permissions, serializers, status
+from rest_framework.response import Response
 
 # DRF provides a View for getting the auth token
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+from drf_spectacular.utils import extend_schema
 
+from core.models import VersionConflict
+from core.transfer import dumps
+from user import tokens
+from user.authentication import CachedTokenAuthentication, SignedTokenAuthentication, issue_token
+from user.pagination import UserCursorPagination
+from user.throttling import LoginRateThrottle, SignupRateThrottle
 from user.serializers import (
     UserSerializer,
+    UserListSerializer,
+    BulkUserSerializer,
     AuthTokenSerializer
 )
 
@@ -22,23 +45,205 @@ class CreateUserView(generics.CreateAPIView):
     """Create a new user in the system"""
     # set the serializer for this view so Django knows what serializer to use
     serializer_class = UserSerializer
+    throttle_classes = [SignupRateThrottle]
+
+
+class BulkCreateUserView(generics.GenericAPIView):
+    """Create many users in the system with one request
+
+    A request holds at most as many users as the server hashes the passwords
+    of in half its timeout, larger payloads are rejected.
+    """
+
+    serializer_class = BulkUserSerializer
+    authentication_classes = [SignedTokenAuthentication, CachedTokenAuthentication]
+    # only staff accounts run onboarding jobs
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        results = serializer.results()
+        # 207 tells the client to look at each item when only some failed
+        if not serializer.instance:
+            code = status.HTTP_400_BAD_REQUEST
+        elif len(serializer.instance) == len(results):
+            code = status.HTTP_201_CREATED
+        else:
+            code = status.HTTP_207_MULTI_STATUS
+
+        return Response(results, status=code)
+
+
+class ListUserView(generics.ListAPIView):
+    """List users for staff, filterable by is_active and is_staff"""
+
+    serializer_class = UserListSerializer
+    authentication_classes = [SignedTokenAuthentication, CachedTokenAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = UserCursorPagination
+    filter_fields = ['is_active', 'is_staff']
+
+    def get_queryset(self):
+        """Return the users matching the boolean filters in the query"""
+        queryset = get_user_model().objects.only(*self.serializer_class.Meta.fields)
+        for field in self.filter_fields:
+            value = self.request.query_params.get(field)
+            if value is None:
+                continue
+            if value.lower() not in ('true', 'false', '1', '0'):
+                msg = _('Must be a valid boolean.')
+                raise serializers.ValidationError({field: [msg]})
+            queryset = queryset.filter(**{field: value.lower() in ('true', '1')})
+
+        return queryset
+
+
+class ExportUserView(APIView):
+    """Stream every user as JSON lines for staff"""
+
+    serializer_class = UserSerializer
+    authentication_classes = [SignedTokenAuthentication, CachedTokenAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+
+    def get_fields(self):
+        """Return the readable fields of the serializer, all plain columns"""
+        return [field.field_name for field in self.serializer_class()._readable_fields]
+
+    def get_queryset(self):
+        # only the exported columns are read, never the password hashes
+        return get_user_model().objects.order_by('pk').values_list(*self.get_fields())
+
+    def iter_lines(self, queryset):
+        """Yield the rows in bytes, one chunk of the cursor at a time"""
+        chunk_size = settings.USER_EXPORT_CHUNK_SIZE
+        fields = self.get_fields()
+        lines = []
+        # iterator() reads from a server-side cursor on PostgreSQL, so only
+        # one chunk of rows is ever held in memory
+        for row in queryset.iterator(chunk_size=chunk_size):
+            lines.append(dumps(dict(zip(fields, row))))
+            if len(lines) >= chunk_size:
+                yield ''.join(lines).encode()
+                lines = []
+        if lines:
+            yield ''.join(lines).encode()
+
+    @extend_schema(responses={(200, 'application/x-ndjson'): UserSerializer})
+    def get(self, request, *args, **kwargs):
+        response = StreamingHttpResponse(
+            self.iter_lines(self.get_queryset()),
+            content_type='application/x-ndjson',
+        )
+        response['Content-Disposition'] = 'attachment; filename="users.jsonl"'
+        return response
 
 
 class CreateTokenView(ObtainAuthToken):
     """Create a new auth token for user"""
 
     serializer_class = AuthTokenSerializer
-    # optional, to add nice UI style classes for this View
+    throttle_classes = [LoginRateThrottle]
+    # ObtainAuthToken pins its own renderers and parsers, use the API defaults
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES
+
+    def post(self, request, *args, **kwargs):
+        """Issue a database token, or a signed access token if enabled"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        if not tokens.is_enabled():
+            # ObtainAuthToken would hand out an expired token again
+            return Response({'token': issue_token(user).key})
+
+        return Response({
+            'token': tokens.issue(user),
+            'token_type': SignedTokenAuthentication.keyword,
+            'expires_in': tokens.get_config()['TTL'],
+        })
+
+
+class RevokeTokenView(APIView):
+    """Log out by revoking the token used for the request"""
+
+    authentication_classes = [SignedTokenAuthentication, CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(request=None, responses={204: None})
+    def post(self, request, *args, **kwargs):
+        if isinstance(request.auth, tokens.AccessToken):
+            tokens.get_revocation_filter().revoke_token(request.auth)
+        elif isinstance(request.auth, Token):
+            request.auth.delete()
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the authenticated user"""
 
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [SignedTokenAuthentication, CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
         """Retrieve and return the authenticated user"""
         return self.request.user
+
+    def get_etag(self, user):
+        """Return the strong ETag of the user in the negotiated format"""
+        return '"%s-%s-%s"' % (user.pk, user.version, self.request.accepted_renderer.format)
+
+    def check_conditions(self, user):
+        """Return a 304 response, or raise 412, as the conditional headers ask"""
+        response = get_conditional_response(
+            self.request,
+            etag=self.get_etag(user),
+            last_modified=timegm(user.updated_at.utctimetuple()),
+        )
+        if response is not None and response.status_code == status.HTTP_412_PRECONDITION_FAILED:
+            raise PreconditionFailed()
+        return response
+
+    def set_validators(self, response, user):
+        response['ETag'] = self.get_etag(user)
+        response['Last-Modified'] = http_date(timegm(user.updated_at.utctimetuple()))
+        # clients revalidate every time, and only their own profile
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+
+    def retrieve(self, request, *args, **kwargs):
+        user = self.get_object()
+        # a matching ETag or date is answered without running the serializer
+        response = self.check_conditions(user) or super().retrieve(request, *args, **kwargs)
+        self.set_validators(response, user)
+        return response
+
+    def update(self, request, *args, **kwargs):
+        user = self.get_object()
+        if 'HTTP_IF_MATCH' in request.META or 'HTTP_IF_UNMODIFIED_SINCE' in request.META:
+            # request.user may come from the token cache, compare with the row
+            # on the primary, as a replica may not have the last write yet
+            user.refresh_from_db(
+                using=router.db_for_write(type(user), instance=user),
+                fields=['version', 'updated_at'],
+            )
+            self.check_conditions(user)
+            # and make sure nobody writes in between
+            user.expected_version = user.version
+        try:
+            response = super().update(request, *args, **kwargs)
+        except VersionConflict:
+            raise PreconditionFailed()
+        finally:
+            user.expected_version = None
+        self.set_validators(response, user)
+        return response
+
+
+class PreconditionFailed(exceptions.APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = gettext_lazy('The user was changed since it was last read.')
+    default_code = 'precondition_failed'